@@ -0,0 +1,172 @@
+import asyncio
+import time
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from app.backend.shards import PRIMARY, session_makers
+from app.config import settings
+from app.logging_config import logger
+
+# Приоритеты запросов: при перегрузке первыми отбрасываются LOW (аналитика, списки), затем NORMAL (чтение).
+# HIGH (запись, аутентификация, проверки состояния) не отбрасывается никогда.
+# Метрики и администраторские эндпоинты тоже HIGH: именно при перегрузке по ним смотрят, что происходит
+LOW, NORMAL, HIGH = 0, 1, 2
+PRIORITY_NAMES = {LOW: 'low', NORMAL: 'normal', HIGH: 'high'}
+HIGH_PRIORITY_PREFIXES = ('/auth', '/health', '/tasks/metrics', '/live/metrics', '/permission')
+
+# Вес нового замера в сглаженном значении: одиночный всплеск не включает сброс нагрузки
+SMOOTHING = 0.5
+
+
+def request_priority(method: str, path: str) -> int:
+    if method not in ('GET', 'HEAD') or path.startswith(HIGH_PRIORITY_PREFIXES):
+        return HIGH
+    for pattern in settings.LOAD_SHED_LOW_PRIORITY_PATHS:
+        if path == pattern or (pattern.endswith('*') and path.startswith(pattern[:-1])):
+            return LOW
+    return NORMAL
+
+
+class LoadMonitor:
+    """
+    Сигналы перегрузки процесса: задержка event loop и время ожидания соединения из пулов БД всех шардов.
+    Задержка loop - насколько позже срока просыпается sleep. Ожидание пула - пробное получение соединения
+    тем же путем, что и у запросов, поэтому оно растет, когда запросы копятся в очереди пула
+    """
+
+    def __init__(self):
+        self.loop_lag = 0.0
+        self.pool_wait = 0.0
+        self.db_available = True
+        self.unavailable_shards: set[int] = set()
+        self.shed = {LOW: 0, NORMAL: 0}
+        self._probe_started: float | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    @staticmethod
+    def _smooth(previous: float, sample: float) -> float:
+        return previous + SMOOTHING * (sample - previous)
+
+    async def _sample_loop_lag(self):
+        interval = settings.LOAD_SAMPLE_INTERVAL
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(interval)
+            self.loop_lag = self._smooth(self.loop_lag, max(0.0, time.monotonic() - start - interval))
+
+    async def _probe(self, shard: int, session_maker) -> bool:
+        try:
+            async with asyncio.timeout(settings.LOAD_PROBE_TIMEOUT):
+                async with session_maker.kw['bind'].connect():
+                    pass
+        except Exception as e:
+            if shard not in self.unavailable_shards:
+                logger.error(f"Не удалось получить соединение с БД шарда {shard}: {str(e) or type(e).__name__}")
+            return False
+        if shard in self.unavailable_shards:
+            logger.info(f"Соединение с БД шарда {shard} восстановлено")
+        return True
+
+    async def _sample_pool_wait(self):
+        """
+        Пробы всех шардов идут параллельно, ожидание - по самому медленному пулу: запросы пользователей
+        насыщенного шарда копятся в его пуле, даже когда пул основной БД свободен
+        """
+        while True:
+            self._probe_started = time.monotonic()
+            shards = list(session_makers.items())
+            available = await asyncio.gather(*(self._probe(shard, session_maker) for shard, session_maker in shards))
+            self.unavailable_shards = {shard for (shard, _), ok in zip(shards, available) if not ok}
+            #Готовность воркера зависит от основной БД: недоступный шард затрагивает только своих пользователей
+            self.db_available = PRIMARY not in self.unavailable_shards
+            self.pool_wait = self._smooth(self.pool_wait, time.monotonic() - self._probe_started)
+            self._probe_started = None
+            await asyncio.sleep(settings.LOAD_SAMPLE_INTERVAL)
+
+    @property
+    def current_pool_wait(self) -> float:
+        """Пока пробное соединение ждет в очереди пула, ожидание не меньше уже прошедшего времени"""
+        if self._probe_started is None:
+            return self.pool_wait
+        return max(self.pool_wait, time.monotonic() - self._probe_started)
+
+    @property
+    def pressure(self) -> float:
+        """Отношение худшего сигнала к его порогу: 1 и больше - перегрузка"""
+        return max(
+            self.loop_lag * 1000 / settings.LOAD_SHED_LOOP_LAG_MS,
+            self.current_pool_wait * 1000 / settings.LOAD_SHED_POOL_WAIT_MS
+        )
+
+    @property
+    def shed_below(self) -> int:
+        """Запросы с приоритетом ниже этого значения отбрасываются"""
+        pressure = self.pressure
+        if pressure >= settings.LOAD_SHED_CRITICAL_FACTOR:
+            return HIGH
+        if pressure >= 1:
+            return NORMAL
+        return LOW
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks) and not any(task.done() for task in self._tasks)
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._sample_loop_lag()), asyncio.create_task(self._sample_pool_wait())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def metrics(self) -> dict:
+        pools = {shard: session_maker.kw['bind'].pool for shard, session_maker in session_makers.items()}
+        return {
+            'loop_lag_ms': round(self.loop_lag * 1000, 1),
+            'pool_wait_ms': round(self.current_pool_wait * 1000, 1),
+            'pool_checked_out': pools[PRIMARY].checkedout(),
+            'pool_size': pools[PRIMARY].size(),
+            'shard_pools': {
+                shard: {'checked_out': pool.checkedout(), 'size': pool.size()}
+                for shard, pool in pools.items() if shard != PRIMARY
+            },
+            'db_available': self.db_available,
+            'unavailable_shards': sorted(self.unavailable_shards),
+            'pressure': round(self.pressure, 2),
+            'shedding': [PRIORITY_NAMES[priority] for priority in (LOW, NORMAL) if priority < self.shed_below],
+            'shed_total': {PRIORITY_NAMES[priority]: count for priority, count in self.shed.items()}
+        }
+
+
+load_monitor = LoadMonitor()
+
+
+class AdmissionMiddleware:
+    """
+    Контроль допуска: при перегрузке запросы низкого приоритета сразу получают 503 с Retry-After,
+    не занимая место в очереди пула БД, чтобы запись и аутентификация обслуживались без деградации
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        priority = request_priority(scope['method'], scope['path'])
+        if priority < load_monitor.shed_below:
+            load_monitor.shed[priority] += 1
+            if load_monitor.shed[priority] % 100 == 1:
+                logger.warning(f"Перегрузка ({load_monitor.metrics()}), отброшен запрос {scope['method']} {scope['path']}")
+            response = JSONResponse(
+                {'detail': 'Service overloaded, retry later'},
+                status_code=503,
+                headers={'Retry-After': str(settings.LOAD_SHED_RETRY_AFTER)}
+            )
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
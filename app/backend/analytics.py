@@ -0,0 +1,255 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, timedelta
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.backend.archive import unpack_training
+from app.backend.catalog import exercise_catalog, muscle_group_catalog
+from app.backend.changelog import sync_state
+from app.backend.queries import ANALYTICS_SETS, ARCHIVED_DOCUMENTS_BY_USER, EPOCH
+from app.backend.records import BODYWEIGHT, estimated_1rm
+from app.config import settings
+
+# Окна отношения острой и хронической нагрузки, дни
+ACUTE_DAYS = 7
+CHRONIC_DAYS = 28
+# Постоянные времени модели тренированности и усталости (Banister), дни. Ядро свертки обрезается на KERNEL_TAUS * tau
+FITNESS_TAU = 42
+FATIGUE_TAU = 7
+KERNEL_TAUS = 6
+
+HOT_DTYPE = np.dtype([
+    ('training_id', np.int64), ('day', np.int32), ('group', np.int32),
+    ('exercise', np.int32), ('weight', np.float32), ('reps', np.int32)
+])
+
+
+@dataclass
+class SetHistory:
+    """
+    Все подходы пользователя (рабочие и архивные) колонками по возрастанию дня.
+    day - дни от EPOCH, group/exercise - индексы в group_names/exercise_names, weight 0 - подход без веса
+    """
+    version: int
+    day: np.ndarray
+    group: np.ndarray
+    exercise: np.ndarray
+    weight: np.ndarray
+    reps: np.ndarray
+    group_names: list[str]
+    exercise_names: list[str]
+
+    @property
+    def volume(self) -> np.ndarray:
+        return self.weight * self.reps
+
+
+# user_id -> история подходов, вытесняются давно не запрашивавшиеся пользователи
+_cache: OrderedDict[int, SetHistory] = OrderedDict()
+
+
+def to_day(value: date) -> int:
+    return (value - EPOCH).days
+
+
+def from_day(day: int) -> date:
+    return EPOCH + timedelta(days=int(day))
+
+
+def _week(day):
+    """Номер недели, недели начинаются с понедельника (EPOCH - четверг)"""
+    return (day + 3) // 7
+
+
+def _week_start(week: int) -> date:
+    return from_day(week * 7 - 3)
+
+
+async def _encode_catalog(db: AsyncSession, catalog, ids: np.ndarray, codes: dict[str, int]) -> np.ndarray:
+    """ID каталога -> коды названий: каждое уникальное ID разрешается в название один раз"""
+    unique, inverse = np.unique(ids, return_inverse=True)
+    names = await catalog.names(db, unique.tolist())
+    unique_codes = np.array(
+        [codes.setdefault(names.get(catalog_id, f'#{catalog_id}'), len(codes)) for catalog_id in unique.tolist()],
+        dtype=np.int32
+    )
+    return unique_codes[inverse]
+
+
+async def _load(db: AsyncSession, user_id: int, version: int) -> SetHistory:
+    rows = (await db.execute(ANALYTICS_SETS, {'user_id': user_id})).all()
+    hot = np.fromiter((tuple(row) for row in rows), dtype=HOT_DTYPE, count=len(rows))
+    group_codes: dict[str, int] = {}
+    exercise_codes: dict[str, int] = {}
+    hot_groups = await _encode_catalog(db, muscle_group_catalog, hot['group'], group_codes)
+    hot_exercises = await _encode_catalog(db, exercise_catalog, hot['exercise'], exercise_codes)
+
+    #Архивные тренировки читаются после рабочих: заархивированная между запросами попадет хотя бы в один из них
+    loaded = set(np.unique(hot['training_id']).tolist())
+    archived = []
+    for training_id, day, document in await db.execute(ARCHIVED_DOCUMENTS_BY_USER, {'user_id': user_id}):
+        if training_id in loaded:
+            continue
+        day = to_day(day)
+        for muscle_group in unpack_training(document)['muscle_groups']:
+            group = group_codes.setdefault(muscle_group['group_name'], len(group_codes))
+            for exercise in muscle_group['exercises']:
+                exercise_code = exercise_codes.setdefault(exercise['exercise_name'], len(exercise_codes))
+                for set_data in exercise['sets']:
+                    archived.append((day, group, exercise_code, set_data['weight_per_exe'] or BODYWEIGHT, set_data['reps']))
+    archived = np.array(archived, dtype=np.float64).reshape(-1, 5)
+
+    day = np.concatenate([hot['day'], archived[:, 0].astype(np.int32)])
+    order = np.argsort(day, kind='stable')
+    return SetHistory(
+        version=version,
+        day=day[order],
+        group=np.concatenate([hot_groups, archived[:, 1].astype(np.int32)])[order],
+        exercise=np.concatenate([hot_exercises, archived[:, 2].astype(np.int32)])[order],
+        weight=np.concatenate([hot['weight'], archived[:, 3].astype(np.float32)])[order],
+        reps=np.concatenate([hot['reps'], archived[:, 4].astype(np.int32)])[order],
+        group_names=list(group_codes),
+        exercise_names=list(exercise_codes)
+    )
+
+
+async def set_history(db: AsyncSession, user_id: int) -> SetHistory:
+    """
+    История подходов пользователя из кэша процесса. Любая запись через API увеличивает версию журнала изменений,
+    поэтому кэш сравнивает версию одним запросом по первичному ключу и перечитывает историю только после записи
+    """
+    version, _ = await sync_state(db, user_id)
+    cached = _cache.get(user_id)
+    if cached is not None and cached.version == version:
+        _cache.move_to_end(user_id)
+        return cached
+
+    history = await _load(db, user_id, version)
+    _cache[user_id] = history
+    _cache.move_to_end(user_id)
+    if len(_cache) > settings.ANALYTICS_CACHE_USERS:
+        _cache.popitem(last=False)
+    return history
+
+
+def _daily_load(history: SetHistory, start: int, end: int) -> np.ndarray:
+    """Объем (вес * повторения) по дням от start до end включительно"""
+    mask = (history.day >= start) & (history.day <= end)
+    return np.bincount(history.day[mask] - start, weights=history.volume[mask], minlength=end - start + 1)
+
+
+def _rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Среднее за window дней, заканчивающихся каждым днем (дни до начала массива считаются нулевыми)"""
+    sums = np.concatenate([[0.0], np.cumsum(values)])
+    ends = np.arange(1, len(values) + 1)
+    return (sums[ends] - sums[np.maximum(ends - window, 0)]) / window
+
+
+def _optional(value: float, digits: int = 1) -> float | None:
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+def workload(history: SetHistory, today: int, days: int) -> list[dict]:
+    """Отношение острой (7 дней) и хронической (28 дней) нагрузки для каждого из последних days дней"""
+    start = today - days + 1
+    load = _daily_load(history, start - CHRONIC_DAYS + 1, today)
+    acute = _rolling_mean(load, ACUTE_DAYS)[CHRONIC_DAYS - 1:]
+    chronic = _rolling_mean(load, CHRONIC_DAYS)[CHRONIC_DAYS - 1:]
+    ratio = np.divide(acute, chronic, out=np.full_like(acute, np.nan), where=chronic > 0)
+    load = load[CHRONIC_DAYS - 1:]
+    return [
+        {
+            'date': from_day(start + index),
+            'load': round(float(load[index]), 1),
+            'acute': round(float(acute[index]), 1),
+            'chronic': round(float(chronic[index]), 1),
+            'ratio': _optional(ratio[index], 2)
+        }
+        for index in range(days)
+    ]
+
+
+def weekly_volume(history: SetHistory, today: int, weeks: int) -> list[dict]:
+    """Число подходов и объем по группам мышц за каждую из последних weeks недель"""
+    first = _week(today) - weeks + 1
+    week = _week(history.day)
+    mask = (week >= first) & (week < first + weeks)
+    groups = len(history.group_names)
+    keys = (week[mask] - first) * groups + history.group[mask]
+    sets = np.bincount(keys, minlength=weeks * groups).reshape(weeks, groups)
+    volume = np.bincount(keys, weights=history.volume[mask], minlength=weeks * groups).reshape(weeks, groups)
+    return [
+        {
+            'week_start': _week_start(first + index),
+            'muscle_groups': [
+                {'group_name': history.group_names[group], 'sets': int(sets[index, group]), 'volume': round(float(volume[index, group]), 1)}
+                for group in np.flatnonzero(sets[index]).tolist()
+            ]
+        }
+        for index in range(weeks)
+    ]
+
+
+def e1rm_trends(history: SetHistory, today: int, weeks: int) -> list[dict]:
+    """
+    Лучший расчетный 1ПМ упражнения за каждую неделю и наклон тренда (прирост в неделю) методом
+    наименьших квадратов по неделям с подходами - для всех упражнений сразу, без цикла по упражнениям
+    """
+    first = _week(today) - weeks + 1
+    week = _week(history.day)
+    mask = (week >= first) & (week < first + weeks) & (history.weight > 0)
+    keys = history.exercise[mask] * weeks + (week[mask] - first)
+    best = np.zeros(len(history.exercise_names) * weeks)
+    np.maximum.at(best, keys, estimated_1rm(history.weight[mask], history.reps[mask]))
+    best = best.reshape(-1, weeks)
+
+    present = best > 0
+    x = np.arange(weeks)
+    n = present.sum(axis=1)
+    sum_x = (present * x).sum(axis=1)
+    sum_xx = (present * x * x).sum(axis=1)
+    sum_y = best.sum(axis=1)
+    sum_xy = (best * x).sum(axis=1)
+    denominator = n * sum_xx - sum_x ** 2
+    slope = np.divide(
+        n * sum_xy - sum_x * sum_y, denominator,
+        out=np.full(len(n), np.nan), where=denominator > 0
+    )
+    return sorted(
+        (
+            {
+                'exercise_name': history.exercise_names[exercise],
+                'slope_per_week': _optional(slope[exercise], 2),
+                'weeks': [
+                    {'week_start': _week_start(first + index), 'e1rm': round(float(best[exercise, index]), 1)}
+                    for index in np.flatnonzero(present[exercise]).tolist()
+                ]
+            }
+            for exercise in np.flatnonzero(n).tolist()
+        ),
+        key=lambda trend: trend['exercise_name']
+    )
+
+
+def _impulse_response(load: np.ndarray, tau: int) -> np.ndarray:
+    """Экспоненциально взвешенная нагрузка: свертка дневного объема с ядром exp(-t / tau), нормированным на 1"""
+    kernel = np.exp(-np.arange(KERNEL_TAUS * tau) / tau)
+    return np.convolve(load, kernel / kernel.sum())[:len(load)]
+
+
+def fatigue(history: SetHistory, today: int, days: int) -> list[dict]:
+    """Тренированность (42 дня), усталость (7 дней) и готовность (их разность) за последние days дней"""
+    warmup = KERNEL_TAUS * FITNESS_TAU
+    load = _daily_load(history, today - days - warmup + 1, today)
+    fitness = _impulse_response(load, FITNESS_TAU)[warmup:]
+    tiredness = _impulse_response(load, FATIGUE_TAU)[warmup:]
+    start = today - days + 1
+    return [
+        {
+            'date': from_day(start + index),
+            'fitness': round(float(fitness[index]), 1),
+            'fatigue': round(float(tiredness[index]), 1),
+            'form': round(float(fitness[index] - tiredness[index]), 1)
+        }
+        for index in range(days)
+    ]
@@ -0,0 +1,123 @@
+import zlib
+from datetime import date, timedelta
+import orjson
+from sqlalchemy import delete, exists, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.backend.records import BODYWEIGHT
+from app.backend.shards import session_makers
+from app.backend.sparse import SparseTree, TRAINING_TREE
+from app.backend.tasks import task
+from app.config import settings
+from app.logging_config import logger
+from app.models import ArchivedRepRecord, ArchivedTraining, Exercise, MuscleGroup, Set, Training
+
+# Документ архива - полное дерево тренировки в форме TrainingResponse
+FULL_TREE = SparseTree.build(TRAINING_TREE, None, None)
+
+
+def pack_training(training: Training) -> bytes:
+    return zlib.compress(orjson.dumps(FULL_TREE.serialize(training)))
+
+
+def unpack_training(document: bytes) -> dict:
+    return orjson.loads(zlib.decompress(document))
+
+
+def archived_on(user_id, day):
+    """Условие: у пользователя есть архивная тренировка на дату day (значения или SQL-выражения)"""
+    return exists().where(ArchivedTraining.user_id == user_id, ArchivedTraining.date == day)
+
+
+async def _archive_batch(session_maker: async_sessionmaker, cutoff: date) -> int:
+    """
+    Архивирует одну пачку тренировок шарда старше cutoff в отдельной транзакции: документы и архивные максимумы
+    повторений записываются, строки дерева удаляются. Возвращает число заархивированных тренировок
+    """
+    async with session_maker() as session:
+        async with session.begin():
+            training_ids = (await session.scalars(
+                select(Training.id)
+                .where(Training.date < cutoff)
+                .order_by(Training.id)
+                .limit(settings.ARCHIVE_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            )).all()
+            if not training_ids:
+                return 0
+
+            #Новый подход блокирует свое упражнение (FOR KEY SHARE), поэтому блокировка упражнений
+            #не дает дописать подход в тренировку между чтением документа и удалением
+            await session.execute(
+                select(Exercise.id)
+                .join(MuscleGroup, MuscleGroup.id == Exercise.muscle_group_id)
+                .where(MuscleGroup.training_id.in_(training_ids))
+                .with_for_update(of=Exercise)
+            )
+            trainings = (await session.scalars(
+                select(Training)
+                .options(*FULL_TREE.loader_options(Training.date, Training.user_id))
+                .where(Training.id.in_(training_ids))
+            )).all()
+
+            best_reps: dict[tuple[int, int, float], int] = {}
+            exercise_ids = []
+            for training in trainings:
+                for muscle_group in training.muscle_groups:
+                    for exercise in muscle_group.exercises:
+                        exercise_ids.append(exercise.id)
+                        for set_data in exercise.sets:
+                            key = (training.user_id, exercise.exercise_catalog_id, set_data.weight_per_exe or BODYWEIGHT)
+                            best_reps[key] = max(best_reps.get(key, 0), set_data.reps)
+
+            await session.execute(insert(ArchivedTraining).values([
+                {
+                    'id': training.id,
+                    'user_id': training.user_id,
+                    'date': training.date,
+                    'title': training.title,
+                    'document': pack_training(training)
+                }
+                for training in trainings
+            ]))
+            if best_reps:
+                stmt = pg_insert(ArchivedRepRecord).values([
+                    {'user_id': user_id, 'exercise_catalog_id': catalog_id, 'weight': weight, 'reps': reps}
+                    for (user_id, catalog_id, weight), reps in best_reps.items()
+                ])
+                await session.execute(stmt.on_conflict_do_update(
+                    index_elements=[ArchivedRepRecord.user_id, ArchivedRepRecord.exercise_catalog_id, ArchivedRepRecord.weight],
+                    set_={'reps': func.greatest(ArchivedRepRecord.reps, stmt.excluded.reps)}
+                ))
+
+            #Подходы удаляются явно с условием по ключу секционирования, остальное дерево - каскадом от тренировок
+            user_ids = {training.user_id for training in trainings}
+            await session.execute(
+                delete(Set)
+                .where(Set.user_id.in_(user_ids), Set.exercise_id.in_(exercise_ids))
+                .execution_options(synchronize_session=False)
+            )
+            await session.execute(
+                delete(Training)
+                .where(Training.id.in_(training_ids))
+                .execution_options(synchronize_session=False)
+            )
+    return len(training_ids)
+
+
+@task('archive_trainings')
+async def archive_trainings(older_than_days: int | None = None):
+    """
+    Переносит тренировки старше older_than_days (по умолчанию ARCHIVE_AFTER_DAYS) в archived_trainings
+    на каждом шарде пачками по ARCHIVE_BATCH_SIZE. Каждая пачка - короткая транзакция, блокировки не держатся на всё время архивации
+    """
+    days = settings.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    cutoff = date.today() - timedelta(days=days)
+    total = 0
+    for session_maker in session_makers.values():
+        while True:
+            archived = await _archive_batch(session_maker, cutoff)
+            total += archived
+            if archived < settings.ARCHIVE_BATCH_SIZE:
+                break
+    logger.info(f"Архивация тренировок до {cutoff} завершена: перенесено {total}")
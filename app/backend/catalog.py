@@ -0,0 +1,108 @@
+from functools import partial
+from sqlalchemy import Integer, literal, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.backend.db import on_commit, transaction_state
+from app.models import ExerciseCatalog, MuscleGroupCatalog
+
+
+class NameCatalog:
+    """
+    Кэш название <-> ID для таблицы каталога внутри процесса.
+    Записи каталога не изменяются и не удаляются (кроме удаления владельца), поэтому кэш не требует инвалидации.
+    Общая запись (user_id = NULL) имеет приоритет над пользовательской с тем же названием
+    """
+
+    def __init__(self, model, name_column: str):
+        self.model = model
+        self.name_column = getattr(model, name_column)
+        self._ids: dict[tuple[int | None, str], int] = {}
+        self._names: dict[int, str] = {}
+
+    def _remember(self, catalog_id: int, user_id: int | None, name: str):
+        self._ids[(user_id, name)] = catalog_id
+        self._names[catalog_id] = name
+
+    def name(self, catalog_id: int) -> str | None:
+        return self._names.get(catalog_id)
+
+    async def names(self, db: AsyncSession, catalog_ids) -> dict[int, str]:
+        """Названия для ID каталога: из кэша, недостающие - одним запросом"""
+        missing = {catalog_id for catalog_id in catalog_ids if catalog_id not in self._names}
+        if missing:
+            rows = await db.execute(
+                select(self.model.id, self.model.user_id, self.name_column).where(self.model.id.in_(missing))
+            )
+            for catalog_id, user_id, name in rows:
+                self._remember(catalog_id, user_id, name)
+        return {catalog_id: self._names[catalog_id] for catalog_id in catalog_ids if catalog_id in self._names}
+
+    def visible_to(self, user_id):
+        """Условие: запись общая или принадлежит пользователю user_id (значение или SQL-выражение)"""
+        return or_(self.model.user_id.is_(None), self.model.user_id == user_id)
+
+    async def get_id(self, db: AsyncSession, name: str, user_id: int) -> int:
+        """
+        ID записи каталога для названия. Если записи нет, создается пользовательская запись на соединении
+        запроса в SAVEPOINT: второе соединение из пула не занимается, пока запрос держит первое.
+        Созданный ID попадает в кэш процесса только после коммита транзакции запроса,
+        поэтому ее откат не оставит в кэше несуществующий ID
+        """
+        for key in ((None, name), (user_id, name)):
+            if key in self._ids:
+                return self._ids[key]
+        pending = transaction_state(db, 'catalog_pending')
+        if (self, user_id, name) in pending:
+            return pending[(self, user_id, name)]
+
+        lookup = (
+            select(self.model.id, self.model.user_id)
+            .where(self.name_column == name, self.visible_to(user_id))
+            .order_by(self.model.user_id.nulls_first())
+            .limit(1)
+        )
+        row = (await db.execute(lookup)).first()
+        if row is None:
+            async with db.begin_nested():
+                row = (await db.execute(
+                    pg_insert(self.model)
+                    .values({self.name_column.key: name, 'user_id': user_id})
+                    .on_conflict_do_nothing()
+                    .returning(self.model.id)
+                )).first()
+            if row is not None:
+                pending[(self, user_id, name)] = row.id
+                on_commit(db, partial(self._remember, row.id, user_id, name))
+                return row.id
+            #Запись уже вставил и закоммитил параллельный запрос
+            row = (await db.execute(lookup)).first()
+
+        self._remember(row.id, row.user_id, name)
+        return row.id
+
+    def id_subquery(self, name, user_id):
+        """Коррелированный подзапрос ID записи каталога для SQL-выражения с названием - для INSERT ... SELECT"""
+        return (
+            select(self.model.id)
+            .where(self.name_column == name, self.visible_to(user_id))
+            .order_by(self.model.user_id.nulls_first())
+            .limit(1)
+            .correlate_except(self.model)
+            .scalar_subquery()
+        )
+
+    def insert_missing_stmt(self, names, user_id: int):
+        """
+        INSERT пользовательских записей для названий из names (SELECT с одной колонкой),
+        которых еще нет среди общих записей и записей пользователя
+        """
+        name = names.selected_columns[0]
+        visible = select(self.model.id).where(self.name_column == name, self.visible_to(user_id)).exists()
+        return pg_insert(self.model).from_select(
+            [self.name_column.key, 'user_id'],
+            names.add_columns(literal(user_id, Integer)).where(~visible).distinct()
+        ).on_conflict_do_nothing()
+
+
+exercise_catalog = NameCatalog(ExerciseCatalog, 'exercise_name')
+muscle_group_catalog = NameCatalog(MuscleGroupCatalog, 'group_name')
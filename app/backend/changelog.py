@@ -0,0 +1,185 @@
+from datetime import timedelta
+from typing import Iterable
+from sqlalchemy import BigInteger, Integer, String, delete, func, insert, literal, select, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.backend.db import transaction_state
+from app.backend.shards import shard_map
+from app.backend.tasks import enqueue_after_commit, task
+from app.config import settings
+from app.logging_config import logger
+from app.models import (
+    ChangeLog, ChangeVersion, Exercise, ExerciseCatalog, MuscleGroup, MuscleGroupCatalog, Set, Training
+)
+
+UPSERT = 'upsert'
+DELETE = 'delete'
+
+# Сущность журнала -> (модель, колонка ссылки на родителя). Порядок - от корня дерева тренировки к листьям
+TREE = {
+    'training': (Training, None),
+    'muscle_group': (MuscleGroup, MuscleGroup.training_id),
+    'exercise': (Exercise, Exercise.muscle_group_id),
+    'set': (Set, Set.exercise_id),
+}
+
+LOG_COLUMNS = ['user_id', 'version', 'entity', 'entity_id', 'op']
+
+
+async def _version(db: AsyncSession, user_id: int) -> int:
+    """
+    Версия журнала для текущей транзакции: одна на транзакцию и пользователя.
+    Строка change_versions остается заблокированной до коммита, поэтому версии пользователя
+    коммитятся строго по возрастанию и курсор клиента не может перескочить через незакоммиченные записи
+    """
+    versions = transaction_state(db, 'change_versions')
+    if user_id not in versions:
+        version = await db.scalar(
+            pg_insert(ChangeVersion)
+            .values(user_id=user_id, version=1)
+            .on_conflict_do_update(
+                index_elements=[ChangeVersion.user_id],
+                set_={'version': ChangeVersion.version + 1}
+            )
+            .returning(ChangeVersion.version)
+        )
+        versions[user_id] = version
+        if version % settings.CHANGE_LOG_COMPACT_EVERY == 0:
+            enqueue_after_commit(db, 'compact_change_log', user_id=user_id)
+    return versions[user_id]
+
+
+async def log_changes(db: AsyncSession, user_id: int, changes: Iterable[tuple[str, int, str]]):
+    """Добавляет в журнал изменения (сущность, ID, операция) в текущей транзакции"""
+    changes = list(changes)
+    if not changes:
+        return
+    version = await _version(db, user_id)
+    await db.execute(insert(ChangeLog).values([
+        dict(zip(LOG_COLUMNS, (user_id, version, entity, entity_id, op))) for entity, entity_id, op in changes
+    ]))
+
+
+async def log_tree(db: AsyncSession, user_id: int, op: str, entity: str, ids: Iterable[int]):
+    """
+    Записывает в журнал поддеревья: сами сущности ids и всех их потомков одним INSERT ... SELECT.
+    Для удалений вызывается до DELETE, пока потомки еще существуют
+    """
+    ids = list(ids)
+    if not ids:
+        return
+    await db.flush()
+    version = await _version(db, user_id)
+
+    entities = list(TREE)
+    selects = []
+    condition = None
+    for name in entities[entities.index(entity):]:
+        model, parent_column = TREE[name]
+        if condition is None:
+            condition = model.id.in_(ids)
+        else:
+            condition = parent_column.in_(parent_ids)
+        condition = condition & (model.user_id == user_id)
+        parent_ids = select(model.id).where(condition)
+        selects.append(select(
+            literal(user_id, Integer), literal(version, BigInteger), literal(name, String), model.id, literal(op, String)
+        ).where(condition))
+
+    await db.execute(insert(ChangeLog).from_select(LOG_COLUMNS, union_all(*selects)))
+
+
+@task('compact_change_log')
+async def compact_change_log(user_id: int):
+    """
+    Сжатие журнала пользователя: от каждой сущности остается только последняя запись, записи старше
+    CHANGE_LOG_RETENTION_DAYS удаляются, а их максимальная версия становится floor
+    """
+    async with (await shard_map.session_maker(user_id))() as session:
+        async with session.begin():
+            #Один проход по записям пользователя (индекс user_id, version, id) с нумерацией внутри сущности -
+            #без коррелированного подзапроса на каждую строку журнала
+            ranked = (
+                select(
+                    ChangeLog.id,
+                    func.row_number().over(
+                        partition_by=(ChangeLog.entity, ChangeLog.entity_id), order_by=ChangeLog.id.desc()
+                    ).label('rank')
+                )
+                .where(ChangeLog.user_id == user_id)
+                .subquery()
+            )
+            deduplicated = await session.execute(
+                delete(ChangeLog)
+                .where(ChangeLog.user_id == user_id, ChangeLog.id.in_(select(ranked.c.id).where(ranked.c.rank > 1)))
+            )
+
+            expired_version = await session.scalar(
+                select(func.max(ChangeLog.version))
+                .where(
+                    ChangeLog.user_id == user_id,
+                    ChangeLog.created_at < func.now() - timedelta(days=settings.CHANGE_LOG_RETENTION_DAYS)
+                )
+            )
+            expired = 0
+            if expired_version is not None:
+                result = await session.execute(
+                    delete(ChangeLog).where(ChangeLog.user_id == user_id, ChangeLog.version <= expired_version)
+                )
+                expired = result.rowcount
+                await session.execute(
+                    update(ChangeVersion)
+                    .where(ChangeVersion.user_id == user_id)
+                    .values(floor=func.greatest(ChangeVersion.floor, expired_version))
+                )
+    logger.info(f"Журнал изменений пользователя {user_id} сжат: дубликатов удалено {deduplicated.rowcount}, устаревших {expired}")
+
+
+async def sync_state(db: AsyncSession, user_id: int) -> tuple[int, int]:
+    """Текущая версия и floor журнала пользователя"""
+    row = (await db.execute(
+        select(ChangeVersion.version, ChangeVersion.floor).where(ChangeVersion.user_id == user_id)
+    )).first()
+    return (row.version, row.floor) if row else (0, 0)
+
+
+async def read_changes(db: AsyncSession, user_id: int, since: int, limit: int) -> tuple[list, bool]:
+    """
+    Записи журнала с версией больше since. Страница не разрывает версию: изменения одной транзакции
+    отдаются вместе, поэтому курсором служит версия последней записи страницы
+    """
+    query = select(ChangeLog).where(ChangeLog.user_id == user_id).order_by(ChangeLog.version, ChangeLog.id)
+    entries = (await db.scalars(query.where(ChangeLog.version > since).limit(limit + 1))).all()
+    if len(entries) <= limit:
+        return entries, False
+
+    first_excluded = entries[limit].version
+    page = [entry for entry in entries[:limit] if entry.version < first_excluded]
+    if not page:
+        page = (await db.scalars(query.where(ChangeLog.version == first_excluded))).all()
+    return page, True
+
+
+async def load_entities(db: AsyncSession, user_id: int, ids: dict[str, list[int]]) -> dict[tuple[str, int], dict]:
+    """Текущее состояние изменившихся сущностей пользователя: (сущность, ID) -> данные"""
+    queries = {
+        'training': select(Training.id, Training.date, Training.title)
+        .where(Training.user_id == user_id),
+        'muscle_group': select(MuscleGroup.id, MuscleGroup.training_id, MuscleGroupCatalog.group_name)
+        .join(MuscleGroupCatalog, MuscleGroupCatalog.id == MuscleGroup.muscle_group_catalog_id)
+        .where(MuscleGroup.user_id == user_id),
+        'exercise': select(
+            Exercise.id, Exercise.muscle_group_id, ExerciseCatalog.exercise_name, Exercise.weight, Exercise.numbers_reps
+        )
+        .join(ExerciseCatalog, ExerciseCatalog.id == Exercise.exercise_catalog_id)
+        .where(Exercise.user_id == user_id),
+        'set': select(Set.id, Set.exercise_id, Set.weight_per_exe, Set.reps)
+        .where(Set.user_id == user_id),
+    }
+    found = {}
+    for entity, entity_ids in ids.items():
+        model = TREE[entity][0]
+        rows = await db.execute(queries[entity].where(model.id.in_(entity_ids)))
+        for row in rows.mappings():
+            found[(entity, row['id'])] = dict(row)
+    return found
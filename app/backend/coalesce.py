@@ -0,0 +1,69 @@
+import asyncio
+from collections import Counter
+from typing import Awaitable, Callable, Hashable
+from fastapi.responses import Response
+
+
+class LeaderCancelled(Exception):
+    """Запрос, выполнявший загрузку, отменен (клиент отключился) - ожидающие выполняют загрузку сами"""
+
+
+class SingleFlight:
+    """
+    Объединение одновременных одинаковых чтений: пока загрузка по ключу выполняется, следующие запросы с тем же
+    ключом не идут в БД, а ждут ее результат. Загрузку выполняет первый запрос в своей сессии, остальные получают
+    тот же результат или то же исключение (например 404). Завершенные результаты не кэшируются
+    """
+
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self.leaders = Counter()
+        self.coalesced = Counter()
+
+    async def run(self, key: tuple, load: Callable[[], Awaitable]):
+        """key - (маршрут, параметры..., пользователь): первый элемент служит именем маршрута в метриках"""
+        while (future := self._inflight.get(key)) is not None:
+            self.coalesced[key[0]] += 1
+            try:
+                return await asyncio.shield(future)
+            except LeaderCancelled:
+                self.coalesced[key[0]] -= 1
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.leaders[key[0]] += 1
+        try:
+            result = await load()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
+            if not future.done():
+                future.set_exception(LeaderCancelled())
+            #Исключение, которого никто не ждал, отмечается полученным, иначе asyncio запишет его в лог
+            future.exception()
+
+    async def json(self, key: tuple, render: Callable[[], Awaitable[bytes]]) -> Response:
+        """Общий результат - готовое JSON-тело, каждый запрос получает собственный объект ответа"""
+        return Response(await self.run(key, render), media_type='application/json')
+
+    def metrics(self) -> dict:
+        routes = sorted(set(self.leaders) | set(self.coalesced))
+        return {
+            'in_flight': len(self._inflight),
+            'routes': {
+                route: {
+                    'loads': self.leaders[route],
+                    'coalesced': self.coalesced[route],
+                    'coalesced_ratio': round(self.coalesced[route] / (self.leaders[route] + self.coalesced[route]), 3)
+                }
+                for route in routes
+            }
+        }
+
+
+single_flight = SingleFlight()
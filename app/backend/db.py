@@ -1,14 +1,63 @@
+from typing import Callable
 from ..config import settings
+from sqlalchemy import event, func
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.orm import DeclarativeBase, Session
+from app.logging_config import logger
 
-engine = create_async_engine(settings.get_db_url())
+def make_session_maker(url: str) -> async_sessionmaker:
+    engine = create_async_engine(
+        url,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT
+    )
+    return async_sessionmaker(
+        engine,
+        expire_on_commit=False,
+        class_=AsyncSession
+    )
 
-async_session_maker = async_sessionmaker(
-    engine,
-    expire_on_commit=False,
-    class_=AsyncSession
-)
+
+async_session_maker = make_session_maker(settings.get_db_url())
+engine = async_session_maker.kw['bind']
 
 class Base(DeclarativeBase):
     pass
+
+
+def next_id(table_name: str):
+    """nextval() по serial-последовательности колонки id таблицы, для заранее выделенных ID в INSERT ... SELECT"""
+    return func.nextval(func.pg_get_serial_sequence(table_name, 'id'))
+
+
+def on_commit(db: AsyncSession, callback: Callable[[], None]):
+    """callback вызывается после коммита внешней транзакции сессии, при ее откате - отбрасывается"""
+    db.sync_session.info.setdefault('on_commit', []).append(callback)
+
+
+def transaction_state(db: AsyncSession, key: str) -> dict:
+    """Словарь key, живущий до конца внешней транзакции сессии: после коммита или отката он сбрасывается"""
+    return db.sync_session.info.setdefault('transaction_state', {}).setdefault(key, {})
+
+
+@event.listens_for(Session, 'after_commit')
+def _run_on_commit(session: Session):
+    #RELEASE и ROLLBACK TO SAVEPOINT тоже вызывают эти события - ждем завершения внешней транзакции
+    if session.in_nested_transaction():
+        return
+    session.info.pop('transaction_state', None)
+    for callback in session.info.pop('on_commit', []):
+        try:
+            callback()
+        except Exception:
+            #Транзакция уже закоммичена: ошибка одного обработчика не должна отменять остальные
+            logger.exception(f"Ошибка обработчика после коммита {callback}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_on_commit(session: Session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop('transaction_state', None)
+    session.info.pop('on_commit', None)
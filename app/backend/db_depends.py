@@ -1,6 +1,63 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from fastapi import HTTPException, Request, status
 from ..backend.db import async_session_maker
-from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from sqlalchemy import func, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from app.logging_config import logger
+
+# SQLSTATE query_canceled: сработал statement_timeout или запрос отменен
+QUERY_CANCELED = '57014'
 
 async def get_db() -> AsyncSession: # type: ignore
     async with async_session_maker() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+def statement_timeout_ms(request: Request) -> int:
+    """Бюджет времени на запрос к БД для маршрута: ROUTE_STATEMENT_TIMEOUTS_MS по шаблону пути или READ_STATEMENT_TIMEOUT_MS"""
+    route = request.scope.get('route')
+    path = route.path if route else request.url.path
+    return settings.ROUTE_STATEMENT_TIMEOUTS_MS.get(path, settings.READ_STATEMENT_TIMEOUT_MS)
+
+
+async def _cancel_on_disconnect(request: Request, task: asyncio.Task):
+    """Отменяет обработчик запроса, если клиент отключился. asyncpg при отмене отправляет серверу cancel текущего запроса"""
+    while True:
+        message = await request.receive()
+        if message['type'] == 'http.disconnect':
+            logger.info(f"Клиент отключился, запрос {request.url.path} отменен")
+            task.cancel()
+            return
+
+
+@asynccontextmanager
+async def read_only_session(request: Request, session_maker: async_sessionmaker) -> AsyncIterator[AsyncSession]:
+    """
+    Сессия для GET-маршрутов без тела запроса: транзакция READ ONLY с локальным statement_timeout.
+    Пока выполняется обработчик, отключение клиента отменяет запрос, и соединение сразу возвращается в пул
+    """
+    async with session_maker() as session:
+        await session.connection(execution_options={'postgresql_readonly': True})
+        await session.execute(select(func.set_config('statement_timeout', str(statement_timeout_ms(request)), True)))
+        watcher = asyncio.create_task(_cancel_on_disconnect(request, asyncio.current_task()))
+        try:
+            yield session
+        except DBAPIError as e:
+            if getattr(e.orig, 'sqlstate', None) == QUERY_CANCELED:
+                logger.warning(f"Запрос {request.url.path} превысил statement_timeout")
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail='Query timeout'
+                )
+            raise
+        finally:
+            watcher.cancel()
+
+
+async def get_read_db(request: Request) -> AsyncSession: # type: ignore
+    async with read_only_session(request, async_session_maker) as session:
+        yield session
@@ -0,0 +1,76 @@
+import hashlib
+from dataclasses import dataclass
+from datetime import timedelta
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.logging_config import logger
+from app.models import IdempotencyRecord
+
+
+def request_fingerprint(method: str, path: str, query: str, body: bytes) -> str:
+    return hashlib.sha256(b'\n'.join([method.encode(), path.encode(), query.encode(), body])).hexdigest()
+
+
+@dataclass
+class IdempotencyKey:
+    """
+    Ключ идемпотентности запроса пользователя. claim() вызывается первым запросом в транзакции обработчика:
+    строка ключа вставляется в той же транзакции, поэтому повтор, пришедший параллельно, ждет на вставке
+    до коммита первого запроса и получает сохраненный ответ, а при откате первого - выполняет запись сам
+    """
+    key: str
+    user_id: int
+    fingerprint: str
+
+    def _where(self):
+        return (IdempotencyRecord.user_id == self.user_id, IdempotencyRecord.key == self.key)
+
+    async def claim(self, db: AsyncSession) -> JSONResponse | None:
+        """None - ключ захвачен и запрос нужно выполнить, иначе сохраненный ответ первого запроса"""
+        await db.execute(
+            delete(IdempotencyRecord)
+            .where(IdempotencyRecord.user_id == self.user_id, IdempotencyRecord.expires_at < func.now())
+        )
+        claimed = await db.scalar(
+            pg_insert(IdempotencyRecord)
+            .values(
+                user_id=self.user_id,
+                key=self.key,
+                fingerprint=self.fingerprint,
+                expires_at=func.now() + timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS)
+            )
+            .on_conflict_do_nothing()
+            .returning(IdempotencyRecord.key)
+        )
+        if claimed is not None:
+            return None
+
+        record = await db.scalar(select(IdempotencyRecord).where(*self._where()))
+        if record is None or record.status_code is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail='Request with this Idempotency-Key is in progress'
+            )
+        if record.fingerprint != self.fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail='Idempotency-Key is already used for another request'
+            )
+        logger.info(f"Повтор запроса пользователя {self.user_id} с Idempotency-Key {self.key}, отдан сохраненный ответ")
+        return JSONResponse(
+            status_code=record.status_code,
+            content=record.response,
+            headers={'Idempotent-Replayed': 'true'}
+        )
+
+    async def save(self, db: AsyncSession, status_code: int, response):
+        await db.execute(
+            update(IdempotencyRecord)
+            .where(*self._where())
+            .values(status_code=status_code, response=jsonable_encoder(response))
+        )
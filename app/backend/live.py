@@ -0,0 +1,110 @@
+import asyncio
+import json
+from functools import partial
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.backend.db import on_commit
+from app.config import settings
+from app.logging_config import logger
+
+
+class LiveLimitError(Exception):
+    pass
+
+
+class LiveConnection:
+    """
+    Подписка одного WebSocket-соединения. Исходящие сообщения копятся в ограниченной очереди;
+    если клиент не успевает их забирать (превышен размер очереди или объем в байтах), соединение помечается
+    переполненным и закрывается - публикация никогда не ждет медленного клиента
+    """
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.training_id: int | None = None
+        self.buffered_bytes = 0
+        self.overflowed = asyncio.Event()
+        self._queue: asyncio.Queue[str] = asyncio.Queue(maxsize=settings.LIVE_QUEUE_SIZE)
+
+    def push(self, message: str) -> bool:
+        size = len(message)
+        if self.buffered_bytes + size > settings.LIVE_MAX_BUFFER_BYTES:
+            return False
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            return False
+        self.buffered_bytes += size
+        return True
+
+    async def next_message(self) -> str:
+        message = await self._queue.get()
+        self.buffered_bytes -= len(message)
+        return message
+
+
+class LiveHub:
+    """
+    Pub/sub внутри процесса: события пользователя рассылаются всем его соединениям на этом воркере.
+    Соединение с выбранной тренировкой получает только события этой тренировки
+    """
+
+    def __init__(self):
+        self._connections: dict[int, set[LiveConnection]] = {}
+        self.published = 0
+        self.dropped = 0
+
+    def connect(self, user_id: int) -> LiveConnection:
+        connections = self._connections.setdefault(user_id, set())
+        if len(connections) >= settings.LIVE_MAX_CONNECTIONS_PER_USER:
+            raise LiveLimitError(f"Too many live connections for user {user_id}")
+        connection = LiveConnection(user_id)
+        connections.add(connection)
+        return connection
+
+    def disconnect(self, connection: LiveConnection):
+        connections = self._connections.get(connection.user_id)
+        if connections is None:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self._connections[connection.user_id]
+
+    def _deliver(self, connection: LiveConnection, message: str):
+        if connection.push(message):
+            self.published += 1
+        elif not connection.overflowed.is_set():
+            self.dropped += 1
+            connection.overflowed.set()
+            logger.warning(f"Live-соединение пользователя {connection.user_id} не успевает читать события и будет закрыто")
+
+    def publish(self, user_id: int, data: dict):
+        #ensure_ascii: длина строки совпадает с числом байт, по ней считается лимит буфера соединения
+        message = json.dumps(data, default=str)
+        training_id = data.get('training_id')
+        for connection in list(self._connections.get(user_id, ())):
+            if connection.training_id is None or connection.training_id == training_id:
+                self._deliver(connection, message)
+
+    def reply(self, connection: LiveConnection, data: dict):
+        """Ответ на команду клиента - только этому соединению"""
+        self._deliver(connection, json.dumps(data, default=str))
+
+    def metrics(self) -> dict:
+        return {
+            'users': len(self._connections),
+            'connections': sum(len(connections) for connections in self._connections.values()),
+            'buffered_bytes': sum(
+                connection.buffered_bytes
+                for connections in self._connections.values() for connection in connections
+            ),
+            'published': self.published,
+            'dropped_connections': self.dropped
+        }
+
+
+live_hub = LiveHub()
+
+
+def publish_after_commit(db: AsyncSession, user_id: int, data: dict):
+    """Событие уйдет подписчикам только после успешного коммита транзакции сессии"""
+    on_commit(db, partial(live_hub.publish, user_id, data))
@@ -0,0 +1,137 @@
+import gc
+import os
+import tracemalloc
+from collections import Counter
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.backend.db import Base
+
+# Аллокации самого tracemalloc и импорта модулей не относятся к приложению
+IGNORED_TRACES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+)
+
+
+def _rss_mb() -> float | None:
+    try:
+        with open('/proc/self/statm') as statm:
+            return round(int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20, 1)
+    except OSError:
+        return None
+
+
+class MemoryTracer:
+    """
+    Снимки tracemalloc: при старте запоминается базовый снимок, отчет показывает места аллокаций,
+    выросшие относительно него. tracemalloc замедляет каждую аллокацию, поэтому включается только на время диагностики
+    """
+
+    def __init__(self):
+        self._baseline: tracemalloc.Snapshot | None = None
+        self._frames = 1
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int) -> bool:
+        """False - трассировка уже включена"""
+        if tracemalloc.is_tracing():
+            return False
+        self._frames = frames
+        tracemalloc.start(frames)
+        self._baseline = tracemalloc.take_snapshot().filter_traces(IGNORED_TRACES)
+        return True
+
+    def stop(self):
+        tracemalloc.stop()
+        self._baseline = None
+
+    def top(self, limit: int, reset: bool) -> dict:
+        """Места аллокаций с наибольшим приростом после базового снимка; reset делает текущий снимок базовым"""
+        snapshot = tracemalloc.take_snapshot().filter_traces(IGNORED_TRACES)
+        #Трассировка включена при запуске процесса (PYTHONTRACEMALLOC): базой становится первый отчет
+        if self._baseline is None:
+            self._baseline = snapshot
+        stats = snapshot.compare_to(self._baseline, 'lineno' if self._frames == 1 else 'traceback')
+        if reset:
+            self._baseline = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            'traced_mb': round(current / 2 ** 20, 1),
+            'traced_peak_mb': round(peak / 2 ** 20, 1),
+            'top': [
+                {
+                    'site': [str(frame) for frame in stat.traceback],
+                    'size_kb': round(stat.size / 1024, 1),
+                    'size_diff_kb': round(stat.size_diff / 1024, 1),
+                    'count': stat.count,
+                    'count_diff': stat.count_diff
+                }
+                for stat in stats[:limit]
+            ]
+        }
+
+
+def object_stats() -> dict:
+    """
+    Живые сессии и ORM-объекты по моделям за один проход по объектам gc: объекты, удерживаемые кэшами или
+    незакрытыми сессиями, видны так же, как и объекты в identity map открытых сессий
+    """
+    mapped = {mapper.class_: mapper.class_.__name__ for mapper in Base.registry.mappers}
+    instances = Counter()
+    async_sessions = 0
+    sessions = []
+    for obj in gc.get_objects():
+        cls = type(obj)
+        if cls in mapped:
+            instances[mapped[cls]] += 1
+        elif isinstance(obj, AsyncSession):
+            async_sessions += 1
+        elif isinstance(obj, Session):
+            sessions.append(obj)
+
+    identity_map = Counter(
+        mapped.get(type(instance), type(instance).__name__)
+        for session in sessions
+        for instance in session.identity_map.values()
+    )
+    return {
+        'async_sessions': async_sessions,
+        'sessions': len(sessions),
+        'sessions_in_transaction': sum(session.in_transaction() for session in sessions),
+        'orm_instances': dict(instances.most_common()),
+        'identity_map_instances': dict(identity_map.most_common())
+    }
+
+
+def gc_stats() -> dict:
+    return {
+        'generations': [
+            {'generation': generation, 'count': count, **stats}
+            for generation, (count, stats) in enumerate(zip(gc.get_count(), gc.get_stats()))
+        ],
+        'thresholds': gc.get_threshold(),
+        'tracked_objects': len(gc.get_objects()),
+        'garbage': len(gc.garbage)
+    }
+
+
+def memory_report(limit: int, reset: bool, collect: bool) -> dict:
+    """
+    Отчет о памяти воркера. collect запускает полную сборку перед подсчетом: то, что остается после нее,
+    удерживается ссылками, а не ждет сборщика циклов
+    """
+    report = {'rss_mb': _rss_mb()}
+    if collect:
+        report['collected'] = gc.collect()
+    report['gc'] = gc_stats()
+    report['objects'] = object_stats()
+    if memory_tracer.tracing:
+        report['tracemalloc'] = memory_tracer.top(limit, reset)
+    return report
+
+
+memory_tracer = MemoryTracer()
@@ -0,0 +1,141 @@
+import msgpack
+import orjson
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.schemas.create_schemas import CreateSet
+from app.schemas.response_schemas import SetResponse
+
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+# Подходы в MessagePack передаются массивами в порядке полей схемы, а не словарями:
+# ответ - [id, weight_per_exe, reps], тело запроса - [weight_per_exe, reps]
+PACKED_SET_FIELDS = tuple(SetResponse.model_fields)
+UNPACKED_SET_FIELDS = tuple(CreateSet.model_fields)
+
+
+def _media_types(value: str) -> list[str]:
+    return [part.split(';', 1)[0].strip().lower() for part in value.split(',')]
+
+
+def accepts_msgpack(headers: Headers) -> bool:
+    return any(media_type in MSGPACK_TYPES for media_type in _media_types(headers.get('accept', '')))
+
+
+def pack_sets(data):
+    """Заменяет полные словари подходов в списках sets на массивы. Урезанные через fields подходы остаются словарями"""
+    if isinstance(data, list):
+        return [pack_sets(item) for item in data]
+    if not isinstance(data, dict):
+        return data
+    packed = {}
+    for key, value in data.items():
+        if key == 'sets' and isinstance(value, list) and all(
+            isinstance(item, dict) and tuple(item) == PACKED_SET_FIELDS for item in value
+        ):
+            packed[key] = [[item[name] for name in PACKED_SET_FIELDS] for item in value]
+        else:
+            packed[key] = pack_sets(value)
+    return packed
+
+
+def unpack_sets(data):
+    """Обратное преобразование для тела запроса: массивы [weight_per_exe, reps] в sets становятся словарями CreateSet"""
+    if isinstance(data, list):
+        return [unpack_sets(item) for item in data]
+    if not isinstance(data, dict):
+        return data
+    unpacked = {}
+    for key, value in data.items():
+        if key == 'sets' and isinstance(value, list):
+            unpacked[key] = [
+                dict(zip(UNPACKED_SET_FIELDS, item)) if isinstance(item, (list, tuple)) else unpack_sets(item)
+                for item in value
+            ]
+        else:
+            unpacked[key] = unpack_sets(value)
+    return unpacked
+
+
+class MsgPackMiddleware:
+    """
+    Согласование формата для всех роутеров: тело запроса с Content-Type application/msgpack
+    декодируется в JSON до FastAPI, JSON-ответ при Accept: application/msgpack перекодируется в MessagePack.
+    Валидация и response_model работают как для JSON
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        content_types = _media_types(headers.get('content-type', ''))
+        if content_types[0] in MSGPACK_TYPES:
+            try:
+                scope, receive = await self._decode_request(scope, receive)
+            except (ValueError, TypeError, msgpack.UnpackException):
+                response = JSONResponse({'detail': 'Invalid MessagePack body'}, status_code=400)
+                await response(scope, receive, send)
+                return
+
+        if accepts_msgpack(headers):
+            send = self._encoding_send(send)
+        await self.app(scope, receive, send)
+
+    async def _decode_request(self, scope: Scope, receive: Receive) -> tuple[Scope, Receive]:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        body = orjson.dumps(unpack_sets(msgpack.unpackb(b''.join(chunks), raw=False)))
+
+        scope = dict(scope)
+        request_headers = MutableHeaders(scope=scope)
+        request_headers['content-type'] = 'application/json'
+        request_headers['content-length'] = str(len(body))
+
+        sent = False
+
+        async def decoded_receive() -> Message:
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            return await receive()
+
+        return scope, decoded_receive
+
+    def _encoding_send(self, send: Send) -> Send:
+        start: Message | None = None
+        chunks: list[bytes] = []
+
+        async def encoding_send(message: Message):
+            nonlocal start
+            if message['type'] == 'http.response.start':
+                response_headers = Headers(raw=message['headers'])
+                if _media_types(response_headers.get('content-type', ''))[0] == 'application/json':
+                    start = message
+                    return
+            elif message['type'] == 'http.response.body' and start is not None:
+                chunks.append(message.get('body', b''))
+                if message.get('more_body', False):
+                    return
+                body = b''.join(chunks)
+                if body:
+                    body = msgpack.packb(pack_sets(orjson.loads(body)), use_bin_type=True)
+                response_headers = MutableHeaders(raw=start['headers'])
+                response_headers['content-type'] = MSGPACK_TYPES[0]
+                response_headers['content-length'] = str(len(body))
+                response_headers.add_vary_header('Accept')
+                await send(start)
+                await send({'type': 'http.response.body', 'body': body, 'more_body': False})
+                return
+            await send(message)
+
+        return encoding_send
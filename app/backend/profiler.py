@@ -0,0 +1,111 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+
+# Корень пакета: пути файлов приложения в метках показываются относительно него
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+# Метка корня для стеков приостановленных корутин, чтобы они не смешивались с выполняющимся кодом
+SUSPENDED = '(suspended)'
+
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(APP_ROOT):
+        return filename[len(APP_ROOT):]
+    index = filename.rfind('site-packages' + os.sep)
+    if index != -1:
+        return filename[index + len('site-packages' + os.sep):]
+    #Стандартная библиотека: .../lib/python3.11/asyncio/tasks.py -> asyncio/tasks.py
+    index = filename.rfind(os.sep + 'lib' + os.sep + 'python')
+    if index != -1:
+        return filename.split(os.sep, filename[:index].count(os.sep) + 3)[-1]
+    return filename
+
+
+def _label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f'{code.co_qualname} ({_short_path(code.co_filename)}:{code.co_firstlineno})'
+
+
+def _thread_stack(frame: FrameType | None) -> list[str]:
+    """Стек потока от корня к листу. Выполняющаяся корутина на нем видна вместе с ожидающими ее"""
+    stack = []
+    while frame is not None:
+        stack.append(_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _coroutine_stack(coro) -> list[str]:
+    """Стек приостановленной задачи по цепочке await: от корутины задачи до той, что ждет future"""
+    stack = [SUSPENDED]
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None)
+        if frame is None:
+            break
+        stack.append(_label(frame))
+        coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+    return stack
+
+
+class SamplingProfiler:
+    """
+    Семплирующий профилировщик потока event loop. Отдельный поток раз в interval читает стек
+    потока loop через sys._current_frames(), код приложения не инструментируется. Поток существует
+    только на время профилирования, вне его профилировщик ничего не выполняет.
+    В режиме wall дополнительно семплируются приостановленные задачи asyncio - где корутины ждут ввода-вывода
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def _sample(self, loop: asyncio.AbstractEventLoop, thread_id: int, seconds: float, interval: float,
+                wall: bool, exclude: asyncio.Task | None) -> tuple[Counter, int]:
+        stacks = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        try:
+            while time.monotonic() < deadline:
+                frame = sys._current_frames().get(thread_id)
+                if frame is None:
+                    break
+                stacks[';'.join(_thread_stack(frame))] += 1
+                if wall:
+                    running = asyncio.current_task(loop)
+                    for task in asyncio.all_tasks(loop):
+                        if task is not running and task is not exclude:
+                            stacks[';'.join(_coroutine_stack(task.get_coro()))] += 1
+                samples += 1
+                time.sleep(interval)
+        finally:
+            #Освобождается потоком, а не запросом: при обрыве запроса поток дорабатывает, и второй не запустится
+            self._lock.release()
+        return stacks, samples
+
+    async def profile(self, seconds: float, interval: float, wall: bool = False) -> tuple[Counter, int] | None:
+        """
+        Профилирует текущий event loop seconds секунд. Возвращает (стек -> число семплов, число семплов)
+        или None, если профилирование уже идет
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        return await asyncio.to_thread(
+            self._sample, asyncio.get_running_loop(), threading.get_ident(), seconds, interval,
+            wall, asyncio.current_task()
+        )
+
+
+def collapsed(stacks: Counter) -> str:
+    """Формат collapsed stacks (flamegraph.pl, speedscope): 'корень;...;лист число' на строку"""
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,131 @@
+from datetime import date
+from functools import lru_cache
+from sqlalchemy import Select, and_, bindparam, distinct, func, literal, select
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import InstrumentedAttribute
+from app.backend.sparse import EXERCISE_TREE, MUSCLE_GROUP_TREE, SparseTree, TRAINING_TREE, TreeLevel
+from app.models import ArchivedTraining, Exercise, MuscleGroup, Set, Training
+
+# Запросы горячих путей строятся один раз при импорте, значения передаются bind-параметрами:
+# db.scalar(SET_BY_ID, {'id': set_id, 'user_id': user_id}). Построение select() с опциями загрузки и вычисление ключа
+# кэша компиляции на каждый запрос заметно дороже самого чтения строки по первичному ключу,
+# у готового запроса ключ кэша вычисляется один раз
+
+TRAINING_BY_ID = select(Training).where(Training.id == bindparam('id'))
+TRAINING_WITH_MUSCLE_GROUPS_BY_ID = (
+    select(Training)
+    .options(selectinload(Training.muscle_groups))
+    .where(Training.id == bindparam('id'))
+)
+ARCHIVED_TRAINING_BY_ID = select(ArchivedTraining).where(ArchivedTraining.id == bindparam('id'))
+ARCHIVED_TRAININGS_BY_IDS = select(ArchivedTraining).where(
+    ArchivedTraining.user_id == bindparam('user_id'), ArchivedTraining.id.in_(bindparam('ids', expanding=True))
+)
+ARCHIVED_TRAININGS_BY_DATES = (
+    select(ArchivedTraining)
+    .where(
+        ArchivedTraining.user_id == bindparam('user_id'),
+        ArchivedTraining.date.between(bindparam('date_from'), bindparam('date_to'))
+    )
+    .order_by(ArchivedTraining.date)
+    .limit(bindparam('limit'))
+)
+MUSCLE_GROUP_BY_ID = select(MuscleGroup).where(MuscleGroup.id == bindparam('id'))
+EXERCISE_BY_ID = select(Exercise).where(Exercise.id == bindparam('id'))
+EXERCISE_WITH_SETS_BY_ID = (
+    select(Exercise)
+    .options(selectinload(Exercise.sets))
+    .where(Exercise.id == bindparam('id'))
+)
+#sets секционирована по user_id: без условия по ключу секционирования поиск по ID проходит все секции
+SET_BY_ID = select(Set).where(Set.id == bindparam('id'), Set.user_id == bindparam('user_id'))
+#Для администратора, которому владелец подхода заранее неизвестен
+SET_BY_ID_ALL_PARTITIONS = select(Set).where(Set.id == bindparam('id'))
+#Агрегаты календаря по тренировкам пользователя за период: каждое соединение читает только покрывающие индексы
+CALENDAR_TRAININGS = (
+    select(
+        Training.id,
+        Training.date,
+        func.array_agg(distinct(MuscleGroup.muscle_group_catalog_id))
+        .filter(MuscleGroup.muscle_group_catalog_id.is_not(None))
+        .label('catalog_ids'),
+        func.count(Set.reps).label('sets'),
+        func.coalesce(func.sum(func.coalesce(Set.weight_per_exe, 0) * Set.reps), 0).label('volume')
+    )
+    .select_from(Training)
+    .outerjoin(MuscleGroup, MuscleGroup.training_id == Training.id)
+    .outerjoin(Exercise, Exercise.muscle_group_id == MuscleGroup.id)
+    .outerjoin(Set, and_(Set.exercise_id == Exercise.id, Set.user_id == bindparam('user_id')))
+    .where(Training.user_id == bindparam('user_id'), Training.date.between(bindparam('date_from'), bindparam('date_to')))
+    .group_by(Training.id, Training.date)
+)
+ARCHIVED_CALENDAR_TRAININGS = select(ArchivedTraining.id, ArchivedTraining.date, ArchivedTraining.document).where(
+    ArchivedTraining.user_id == bindparam('user_id'),
+    ArchivedTraining.date.between(bindparam('date_from'), bindparam('date_to'))
+)
+#Подходы пользователя для аналитики: дата - дни от EPOCH, вес без значения - 0
+EPOCH = date(1970, 1, 1)
+ANALYTICS_SETS = (
+    select(
+        Training.id,
+        (Training.date - literal(EPOCH)).label('day'),
+        MuscleGroup.muscle_group_catalog_id,
+        Exercise.exercise_catalog_id,
+        func.coalesce(Set.weight_per_exe, 0),
+        Set.reps
+    )
+    .select_from(Set)
+    .join(Exercise, Exercise.id == Set.exercise_id)
+    .join(MuscleGroup, MuscleGroup.id == Exercise.muscle_group_id)
+    .join(Training, Training.id == MuscleGroup.training_id)
+    .where(Set.user_id == bindparam('user_id'), Training.user_id == bindparam('user_id'))
+)
+ARCHIVED_DOCUMENTS_BY_USER = select(ArchivedTraining.id, ArchivedTraining.date, ArchivedTraining.document).where(
+    ArchivedTraining.user_id == bindparam('user_id')
+)
+SETS_BY_EXERCISE = select(Set).where(Set.exercise_id == bindparam('exercise_id'), Set.user_id == bindparam('user_id'))
+TRAINING_ID_BY_EXERCISE = (
+    select(MuscleGroup.training_id)
+    .join(Exercise, Exercise.muscle_group_id == MuscleGroup.id)
+    .where(Exercise.id == bindparam('exercise_id'))
+)
+
+# Корень дерева для GET с fields/depth -> (уровень, колонка ID, колонка владельца)
+TREE_ROOTS: dict[str, tuple[TreeLevel, InstrumentedAttribute, InstrumentedAttribute]] = {
+    'training': (TRAINING_TREE, Training.id, Training.user_id),
+    'muscle_group': (MUSCLE_GROUP_TREE, MuscleGroup.id, MuscleGroup.user_id),
+    'exercise': (EXERCISE_TREE, Exercise.id, Exercise.user_id),
+}
+
+
+@lru_cache(maxsize=256)
+def tree_by_id(root: str, fields: str | None, depth: int | None) -> tuple[SparseTree, Select]:
+    """
+    Запрошенная часть дерева и готовый запрос его загрузки по ID (параметр id).
+    Кэшируется по (корень, fields, depth): клиенты запрашивают немного разных сочетаний полей,
+    поэтому разбор fields и построение опций загрузки выполняются один раз на сочетание
+    """
+    level, id_column, owner_column = TREE_ROOTS[root]
+    tree = SparseTree.build(level, fields, depth)
+    query = select(level.model).options(*tree.loader_options(owner_column)).where(id_column == bindparam('id'))
+    return tree, query
+
+
+@lru_cache(maxsize=256)
+def training_batch(fields: str | None, depth: int | None, by_dates: bool) -> tuple[SparseTree, Select]:
+    """
+    Деревья нескольких тренировок пользователя (параметр user_id): по списку ID (ids)
+    или по диапазону дат (date_from, date_to, limit). Владелец проверяется на корне, вложенные уровни
+    загружаются selectinload - один запрос на уровень для всех тренировок сразу
+    """
+    tree = SparseTree.build(TRAINING_TREE, fields, depth)
+    query = select(Training).options(*tree.loader_options(Training.date)).where(Training.user_id == bindparam('user_id'))
+    if by_dates:
+        query = (
+            query.where(Training.date.between(bindparam('date_from'), bindparam('date_to')))
+            .order_by(Training.date)
+            .limit(bindparam('limit'))
+        )
+    else:
+        query = query.where(Training.id.in_(bindparam('ids', expanding=True)))
+    return tree, query
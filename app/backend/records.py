@@ -0,0 +1,160 @@
+from collections import defaultdict
+from typing import Iterable
+from sqlalchemy import Float, Integer, case, delete, func, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.backend.shards import shard_map
+from app.backend.tasks import task
+from app.models import ArchivedRepRecord, Exercise, PersonalRecord, RepRecord, Set
+
+# Подход без веса (weight_per_exe = NULL) учитывается в рекордах повторений как вес 0
+BODYWEIGHT = 0.0
+
+
+def estimated_1rm(weight: float, reps: int) -> float:
+    """Оценка разового максимума по формуле Эпли"""
+    return weight * (1 + reps / 30)
+
+
+async def record_sets(db: AsyncSession, user_id: int, entries: Iterable[tuple[int, float | None, int]]):
+    """
+    Инкрементально обновляет рекорды пользователя новыми подходами.
+    entries - (exercise_catalog_id, weight_per_exe, reps). Рекорды только растут, поэтому достаточно
+    сравнить текущее значение с лучшим из новых подходов - история подходов не читается
+    """
+    best_reps: dict[tuple[int, float], int] = {}
+    for catalog_id, weight, reps in entries:
+        key = (catalog_id, weight or BODYWEIGHT)
+        best_reps[key] = max(best_reps.get(key, 0), reps)
+    if not best_reps:
+        return
+
+    per_exercise: dict[int, list[tuple[float, int]]] = defaultdict(list)
+    for (catalog_id, weight), reps in best_reps.items():
+        per_exercise[catalog_id].append((weight, reps))
+
+    await db.execute(_upsert_rep_records_stmt([
+        {'user_id': user_id, 'exercise_catalog_id': catalog_id, 'weight': weight, 'reps': reps}
+        for (catalog_id, weight), reps in best_reps.items()
+    ]))
+    await db.execute(_upsert_personal_records_stmt([
+        _summary(user_id, catalog_id, weights) for catalog_id, weights in per_exercise.items()
+    ]))
+
+
+def _summary(user_id: int, catalog_id: int, weights: list[tuple[float, int]]) -> dict:
+    weighted = [(weight, reps) for weight, reps in weights if weight > BODYWEIGHT]
+    heaviest = max(weighted) if weighted else (None, None)
+    return {
+        'user_id': user_id,
+        'exercise_catalog_id': catalog_id,
+        'max_weight': heaviest[0],
+        'max_weight_reps': heaviest[1],
+        'best_e1rm': max((estimated_1rm(weight, reps) for weight, reps in weighted), default=None),
+        'max_reps': max(reps for _, reps in weights)
+    }
+
+
+def _upsert_rep_records_stmt(rows: list[dict]):
+    stmt = pg_insert(RepRecord).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[RepRecord.user_id, RepRecord.exercise_catalog_id, RepRecord.weight],
+        set_={'reps': func.greatest(RepRecord.reps, stmt.excluded.reps)}
+    )
+
+
+def _upsert_personal_records_stmt(rows: list[dict]):
+    stmt = pg_insert(PersonalRecord).values(rows)
+    new = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=[PersonalRecord.user_id, PersonalRecord.exercise_catalog_id],
+        set_={
+            #GREATEST в PostgreSQL пропускает NULL
+            'max_weight': func.greatest(PersonalRecord.max_weight, new.max_weight),
+            'max_weight_reps': case(
+                (PersonalRecord.max_weight.is_(None), new.max_weight_reps),
+                (new.max_weight > PersonalRecord.max_weight, new.max_weight_reps),
+                (new.max_weight == PersonalRecord.max_weight,
+                 func.greatest(PersonalRecord.max_weight_reps, new.max_weight_reps)),
+                else_=PersonalRecord.max_weight_reps
+            ),
+            'best_e1rm': func.greatest(PersonalRecord.best_e1rm, new.best_e1rm),
+            'max_reps': func.greatest(PersonalRecord.max_reps, new.max_reps),
+            'updated_at': func.now()
+        }
+    )
+
+
+async def recompute_records(db: AsyncSession, user_id: int, catalog_ids: Iterable[int]):
+    """
+    Пересчитывает рекорды пользователя только по указанным упражнениям каталога - после удаления подходов
+    или изменения подхода в меньшую сторону, когда инкрементальное обновление невозможно.
+    Рекорды повторений собираются из подходов (одна секция sets) и архивных максимумов, сводные рекорды - из рекордов повторений
+    """
+    catalog_ids = list(set(catalog_ids))
+    if not catalog_ids:
+        return
+    await db.flush()
+
+    for model in (RepRecord, PersonalRecord):
+        await db.execute(
+            delete(model)
+            .where(model.user_id == user_id, model.exercise_catalog_id.in_(catalog_ids))
+        )
+
+    weight = func.coalesce(Set.weight_per_exe, BODYWEIGHT)
+    await db.execute(pg_insert(RepRecord).from_select(
+        ['user_id', 'exercise_catalog_id', 'weight', 'reps'],
+        select(literal(user_id, Integer), Exercise.exercise_catalog_id, weight, func.max(Set.reps))
+        .select_from(Set)
+        .join(Exercise, Exercise.id == Set.exercise_id)
+        .where(
+            Set.user_id == user_id,
+            Exercise.user_id == user_id,
+            Exercise.exercise_catalog_id.in_(catalog_ids)
+        )
+        .group_by(Exercise.exercise_catalog_id, weight)
+    ))
+    #Подходов архивных тренировок в sets нет - их максимумы хранятся отдельно
+    archived = pg_insert(RepRecord).from_select(
+        ['user_id', 'exercise_catalog_id', 'weight', 'reps'],
+        select(
+            ArchivedRepRecord.user_id, ArchivedRepRecord.exercise_catalog_id, ArchivedRepRecord.weight, ArchivedRepRecord.reps
+        )
+        .where(ArchivedRepRecord.user_id == user_id, ArchivedRepRecord.exercise_catalog_id.in_(catalog_ids))
+    )
+    await db.execute(archived.on_conflict_do_update(
+        index_elements=[RepRecord.user_id, RepRecord.exercise_catalog_id, RepRecord.weight],
+        set_={'reps': func.greatest(RepRecord.reps, archived.excluded.reps)}
+    ))
+
+    weighted = RepRecord.weight > BODYWEIGHT
+    max_weight = func.max(RepRecord.weight).filter(weighted)
+    reps_by_weight = func.array_agg(
+        aggregate_order_by(RepRecord.reps, RepRecord.weight.desc()),
+        type_=ARRAY(Integer)
+    )
+    await db.execute(pg_insert(PersonalRecord).from_select(
+        ['user_id', 'exercise_catalog_id', 'max_weight', 'max_weight_reps', 'best_e1rm', 'max_reps'],
+        select(
+            RepRecord.user_id,
+            RepRecord.exercise_catalog_id,
+            max_weight,
+            case((max_weight.is_(None), None), else_=reps_by_weight[1]),
+            func.max(RepRecord.weight * (1 + RepRecord.reps / literal(30.0, Float))).filter(weighted),
+            func.max(RepRecord.reps)
+        )
+        .where(RepRecord.user_id == user_id, RepRecord.exercise_catalog_id.in_(catalog_ids))
+        .group_by(RepRecord.user_id, RepRecord.exercise_catalog_id)
+    ))
+
+
+@task('recompute_records')
+async def recompute_records_later(user_id: int, catalog_ids: list[int]):
+    """
+    Пересчет рекордов после удаления или уменьшения подходов вне запроса: роутер ставит задачу через
+    enqueue_after_commit, и запрос не ждет агрегации по всем подходам упражнения
+    """
+    async with (await shard_map.session_maker(user_id))() as session:
+        async with session.begin():
+            await recompute_records(session, user_id, catalog_ids)
@@ -0,0 +1,255 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, TypeVar
+from sqlalchemy import Table, delete, func, insert, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from app.backend.db import Base, async_session_maker, make_session_maker
+from app.backend.tasks import load_progress, save_progress, task
+from app.config import settings
+from app.logging_config import logger
+from app.models import ExerciseCatalog, MuscleGroupCatalog, User
+
+T = TypeVar('T')
+
+# Основная БД - шард 0 и справочник пользователей (users.shard). Только в ней живут refresh-токены и durable-задачи
+PRIMARY = 0
+PRIMARY_ONLY_TABLES = {'refresh_tokens'}
+
+# Шард -> фабрика сессий. Без DB_SHARDS шард один, и маршрутизация не делает ни одного запроса
+session_makers: dict[int, async_sessionmaker] = {PRIMARY: async_session_maker}
+session_makers.update((shard, make_session_maker(url)) for shard, url in settings.DB_SHARDS.items())
+
+# Данные пользователя, которые переезжают вместе с ним: таблицы с user_id в порядке внешних ключей.
+# Общие записи каталогов (user_id = NULL) есть на каждом шарде с теми же ID, их копирует prepare_shards
+USER_TABLES: list[Table] = [
+    table for table in Base.metadata.sorted_tables
+    if 'user_id' in table.c and table.name not in PRIMARY_ONLY_TABLES
+]
+SHARED_CATALOGS = (MuscleGroupCatalog, ExerciseCatalog)
+# Зазор между максимальным выданным ID и стартом последовательностей при подготовке шардов:
+# ID, выданные во время подготовки, не пересекутся с новыми
+ID_HEADROOM = 100000
+
+
+class UserMoving(Exception):
+    """Пользователь переносится на другой шард, его данные временно недоступны"""
+
+
+class ShardMap:
+    """
+    user_id -> шард по справочнику в основной БД с кэшем на SHARD_MAP_CACHE_SECONDS.
+    Перенос пользователя сначала помечает его shard_moving и ждет, пока истекут кэши всех воркеров,
+    поэтому устаревшая запись кэша не может направить запись на старый шард после переноса
+    """
+
+    def __init__(self):
+        self._cache: OrderedDict[int, tuple[int, bool, float]] = OrderedDict()
+
+    async def lookup(self, user_id: int) -> tuple[int, bool]:
+        """(шард, идет ли перенос)"""
+        if len(session_makers) == 1:
+            return PRIMARY, False
+        now = time.monotonic()
+        cached = self._cache.get(user_id)
+        if cached is not None and cached[2] > now:
+            self._cache.move_to_end(user_id)
+            return cached[0], cached[1]
+
+        async with async_session_maker() as session:
+            row = (await session.execute(
+                select(User.shard, User.shard_moving).where(User.id == user_id)
+            )).first()
+        shard, moving = (row.shard, row.shard_moving) if row else (PRIMARY, False)
+        self._cache[user_id] = (shard, moving, now + settings.SHARD_MAP_CACHE_SECONDS)
+        self._cache.move_to_end(user_id)
+        if len(self._cache) > settings.SHARD_MAP_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return shard, moving
+
+    def invalidate(self, user_id: int):
+        self._cache.pop(user_id, None)
+
+    async def session_maker(self, user_id: int) -> async_sessionmaker:
+        """Фабрика сессий шарда пользователя. UserMoving - пользователь переносится"""
+        shard, moving = await self.lookup(user_id)
+        if moving:
+            raise UserMoving(user_id)
+        return session_makers[shard]
+
+
+shard_map = ShardMap()
+
+
+async def scatter(fn: Callable[[int, AsyncSession], Awaitable[T]]) -> dict[int, T]:
+    """Выполняет fn(шард, сессия) на всех шардах параллельно, каждый в своей сессии: шард -> результат"""
+    async def run(shard: int, session_maker: async_sessionmaker) -> T:
+        async with session_maker() as session:
+            return await fn(shard, session)
+
+    results = await asyncio.gather(*(run(shard, session_maker) for shard, session_maker in session_makers.items()))
+    return dict(zip(session_makers, results))
+
+
+async def _replicate_user(user: User, shard: int):
+    """Копия строки пользователя на шарде для внешних ключей, без пароля"""
+    async with session_makers[shard]() as session:
+        async with session.begin():
+            await session.execute(
+                pg_insert(User)
+                .values(
+                    id=user.id, email=user.email, username=user.username, password='',
+                    is_admin=user.is_admin, is_guest=user.is_guest, shard=shard
+                )
+                .on_conflict_do_nothing(index_elements=[User.id])
+            )
+
+
+async def place_new_user(db: AsyncSession, user_id: int):
+    """
+    Размещает нового пользователя (уже вставленного в текущую транзакцию основной БД) на шарде
+    из SHARD_NEW_USERS. Копия строки на шарде создается до коммита справочника
+    """
+    shard = settings.SHARD_NEW_USERS[user_id % len(settings.SHARD_NEW_USERS)]
+    if shard == PRIMARY:
+        return
+    user = await db.get(User, user_id)
+    await _replicate_user(user, shard)
+    user.shard = shard
+    await db.flush()
+
+
+async def _delete_user_rows(session: AsyncSession, user_id: int):
+    """Удаляет данные пользователя на шарде снизу вверх по внешним ключам (строку users не трогает)"""
+    for table in reversed(USER_TABLES):
+        await session.execute(delete(table).where(table.c.user_id == user_id))
+
+
+async def _copy_user_rows(user_id: int, source: int, target: int) -> dict[str, int]:
+    """
+    Копирует данные пользователя с шарда source на target с теми же ID. Источник читается одним снимком
+    REPEATABLE READ, приемник пишется одной транзакцией: остатки прерванной попытки удаляются в ней же
+    """
+    copied = {}
+    async with session_makers[source]() as source_session, session_makers[target]() as target_session:
+        await source_session.connection(
+            execution_options={'isolation_level': 'REPEATABLE READ', 'postgresql_readonly': True}
+        )
+        async with target_session.begin():
+            await _delete_user_rows(target_session, user_id)
+            for table in USER_TABLES:
+                copied[table.name] = 0
+                result = await source_session.stream(select(table).where(table.c.user_id == user_id))
+                async for rows in result.mappings().partitions(settings.SHARD_MOVE_BATCH_SIZE):
+                    await target_session.execute(insert(table), [dict(row) for row in rows])
+                    copied[table.name] += len(rows)
+    return copied
+
+
+@task('move_user_shard')
+async def move_user_shard(user_id: int, target: int):
+    """
+    Переносит пользователя на шард target:
+    1. пометка shard_moving в справочнике и ожидание SHARD_MAP_CACHE_SECONDS - запросы пользователя получают 503;
+    2. копирование данных на target; 3. переключение справочника; 4. удаление данных со старого шарда.
+    Выполняется durable-задачей, пройденный этап сохраняется в ее строке: после рестарта воркера перенос
+    продолжается. Копирование сначала удаляет остатки прерванной попытки на target, после переключения
+    справочника повтор только дочищает старый шард. ID сохраняются, поэтому шарды должны быть подготовлены prepare_shards
+    """
+    progress = await load_progress() or {}
+    if progress.get('stage') == 'switched':
+        source = progress['source']
+    else:
+        async with async_session_maker() as session:
+            async with session.begin():
+                user = await session.scalar(select(User).where(User.id == user_id).with_for_update())
+                if user is None:
+                    raise ValueError(f"User {user_id} not found")
+                source = user.shard
+                user.shard_moving = source != target
+        shard_map.invalidate(user_id)
+        #Прерванная попытка переносила на другой шард: ее частичная копия там больше не нужна
+        if progress.get('target') not in (None, source, target):
+            async with session_makers[progress['target']]() as session:
+                async with session.begin():
+                    await _delete_user_rows(session, user_id)
+                    if progress['target'] != PRIMARY:
+                        await session.execute(delete(User).where(User.id == user_id))
+        if source == target:
+            logger.info(f"Пользователь {user_id} уже на шарде {target}")
+            return
+
+        await save_progress({'stage': 'copying', 'source': source, 'target': target})
+        logger.info(f"Перенос пользователя {user_id} с шарда {source} на шард {target}: ожидание кэшей воркеров")
+        await asyncio.sleep(settings.SHARD_MAP_CACHE_SECONDS)
+
+        if target != PRIMARY:
+            await _replicate_user(user, target)
+        copied = await _copy_user_rows(user_id, source, target)
+        logger.info(f"Данные пользователя {user_id} скопированы на шард {target}: {copied}")
+
+        #Справочник и этап переключаются одной транзакцией основной БД: повтор не потеряет старый шард
+        async with async_session_maker() as session:
+            async with session.begin():
+                await session.execute(update(User).where(User.id == user_id).values(shard=target, shard_moving=False))
+                await save_progress({'stage': 'switched', 'source': source, 'target': target}, session)
+        shard_map.invalidate(user_id)
+
+    async with session_makers[source]() as session:
+        async with session.begin():
+            await _delete_user_rows(session, user_id)
+            if source != PRIMARY:
+                await session.execute(delete(User).where(User.id == user_id))
+    logger.info(f"Пользователь {user_id} перенесен с шарда {source} на шард {target}")
+
+
+async def _sequences(session: AsyncSession) -> dict[str, int]:
+    """Последовательности serial-колонок id шарда -> последнее выданное значение"""
+    values = {}
+    for table in Base.metadata.sorted_tables:
+        if 'id' not in table.c:
+            continue
+        sequence = await session.scalar(select(func.pg_get_serial_sequence(table.name, 'id')))
+        if sequence is not None:
+            values[sequence] = await session.scalar(text(f'SELECT last_value FROM {sequence}'))
+    return values
+
+
+@task('prepare_shards')
+async def prepare_shards():
+    """
+    Готовит шарды к переносу пользователей с сохранением ID:
+    - последовательности шарда N выдают ID вида k * SHARD_ID_STRIDE + N выше максимума всех шардов,
+      поэтому ID строк не пересекаются между шардами;
+    - общие записи каталогов основной БД копируются на остальные шарды с теми же ID.
+    Запускается после подключения нового шарда и после добавления общих записей каталогов
+    """
+    stride = settings.SHARD_ID_STRIDE
+    if any(shard >= stride for shard in session_makers):
+        raise ValueError(f"Shard numbers must be less than SHARD_ID_STRIDE ({stride})")
+
+    sequences = await scatter(lambda shard, session: _sequences(session))
+    top: dict[str, int] = {}
+    for values in sequences.values():
+        for sequence, value in values.items():
+            top[sequence] = max(top.get(sequence, 0), value)
+
+    async with async_session_maker() as session:
+        shared = {
+            model: (await session.execute(select(model.__table__).where(model.user_id.is_(None)))).mappings().all()
+            for model in SHARED_CATALOGS
+        }
+
+    async def prepare(shard: int, session: AsyncSession):
+        async with session.begin():
+            for sequence in sequences[shard]:
+                start = ((top[sequence] + ID_HEADROOM) // stride + 1) * stride + shard
+                await session.execute(text(f'ALTER SEQUENCE {sequence} INCREMENT BY {stride} RESTART WITH {start}'))
+            if shard != PRIMARY:
+                for model, rows in shared.items():
+                    if rows:
+                        await session.execute(pg_insert(model).values([dict(row) for row in rows]).on_conflict_do_nothing())
+
+    await scatter(prepare)
+    logger.info(f"Шарды {sorted(session_makers)} подготовлены: шаг ID {stride}")
@@ -0,0 +1,152 @@
+from dataclasses import dataclass, field
+from fastapi import HTTPException, status
+from sqlalchemy.orm import lazyload, load_only, selectinload
+from sqlalchemy.orm.attributes import InstrumentedAttribute
+from app.models import Exercise, MuscleGroup, Set, Training
+
+# Выбор полей уровня: поле -> выбор полей вложенного уровня (None - все поля)
+Selection = dict[str, 'Selection | None']
+
+
+@dataclass
+class TreeLevel:
+    """
+    Описание уровня дерева ответа: поля-колонки, поля-названия из каталога (читаются через relationship)
+    и вложенный уровень. Поля совпадают с полями response-схемы уровня
+    """
+    model: type
+    columns: dict[str, InstrumentedAttribute]
+    catalog_names: dict[str, InstrumentedAttribute] = field(default_factory=dict)
+    child_field: str | None = None
+    child_relationship: InstrumentedAttribute | None = None
+    child: 'TreeLevel | None' = None
+
+    @property
+    def fields(self) -> list[str]:
+        names = [*self.columns, *self.catalog_names]
+        return names + [self.child_field] if self.child_field else names
+
+    @property
+    def max_depth(self) -> int:
+        return self.child.max_depth + 1 if self.child else 0
+
+
+SET_TREE = TreeLevel(
+    Set,
+    columns={'id': Set.id, 'weight_per_exe': Set.weight_per_exe, 'reps': Set.reps}
+)
+EXERCISE_TREE = TreeLevel(
+    Exercise,
+    columns={'id': Exercise.id, 'weight': Exercise.weight, 'numbers_reps': Exercise.numbers_reps},
+    catalog_names={'exercise_name': Exercise.catalog_entry},
+    child_field='sets', child_relationship=Exercise.sets, child=SET_TREE
+)
+MUSCLE_GROUP_TREE = TreeLevel(
+    MuscleGroup,
+    columns={'id': MuscleGroup.id},
+    catalog_names={'group_name': MuscleGroup.catalog_entry},
+    child_field='exercises', child_relationship=MuscleGroup.exercises, child=EXERCISE_TREE
+)
+TRAINING_TREE = TreeLevel(
+    Training,
+    columns={'id': Training.id, 'title': Training.title},
+    child_field='muscle_groups', child_relationship=Training.muscle_groups, child=MUSCLE_GROUP_TREE
+)
+
+
+def parse_fields(fields: str | None) -> Selection | None:
+    """'id,title,muscle_groups.group_name' -> {'id': None, 'title': None, 'muscle_groups': {'group_name': None}}"""
+    if not fields:
+        return None
+    selection: Selection = {}
+    for path in fields.split(','):
+        path = path.strip()
+        if not path:
+            continue
+        node = selection
+        *parents, leaf = path.split('.')
+        for name in parents:
+            if node.get(name) is None:
+                node[name] = {}
+            node = node[name]
+        node.setdefault(leaf, None)
+    return selection
+
+
+@dataclass
+class SparseTree:
+    """Запрошенная часть дерева: какие поля отдавать на каждом уровне и до какой глубины загружать"""
+    level: TreeLevel
+    selection: Selection | None
+    depth: int
+
+    @classmethod
+    def build(cls, level: TreeLevel, fields: str | None, depth: int | None) -> 'SparseTree':
+        tree = cls(level, parse_fields(fields), level.max_depth if depth is None else depth)
+        tree._validate()
+        return tree
+
+    def _validate(self):
+        if self.selection is None:
+            return
+        unknown = [name for name in self.selection if name not in self.level.fields]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(unknown)}"
+            )
+        child = self.child
+        if child is not None:
+            child._validate()
+
+    def _selected(self, name: str) -> bool:
+        return self.selection is None or name in self.selection
+
+    @property
+    def child(self) -> 'SparseTree | None':
+        level = self.level
+        if level.child is None or self.depth == 0 or not self._selected(level.child_field):
+            return None
+        selection = self.selection[level.child_field] if self.selection is not None else None
+        return SparseTree(level.child, selection or None, self.depth - 1)
+
+    def loader_options(self, *extra_columns: InstrumentedAttribute) -> list:
+        """
+        Опции загрузки уровня: load_only для выбранных колонок (и колонок, нужных для связей),
+        selectinload только для запрошенного вложенного уровня, join каталога только если нужно название
+        """
+        level = self.level
+        columns = [attr for name, attr in level.columns.items() if self._selected(name)]
+        columns += extra_columns
+        options = []
+
+        for name, relationship in level.catalog_names.items():
+            if self._selected(name):
+                columns += self._local_columns(relationship)
+            else:
+                options.append(lazyload(relationship))
+
+        child = self.child
+        if child is not None:
+            columns += self._local_columns(level.child_relationship)
+            options.append(selectinload(level.child_relationship).options(*child.loader_options()))
+
+        return [load_only(*columns), *options]
+
+    def _local_columns(self, relationship: InstrumentedAttribute) -> list[InstrumentedAttribute]:
+        return [getattr(self.level.model, column.key) for column in relationship.property.local_columns]
+
+    def serialize(self, obj) -> dict:
+        return self._serialize(obj, getattr)
+
+    def prune(self, document: dict) -> dict:
+        """То же, что serialize, но для готового документа в форме response-схемы (например, из архива)"""
+        return self._serialize(document, dict.__getitem__)
+
+    def _serialize(self, obj, get) -> dict:
+        level = self.level
+        data = {name: get(obj, name) for name in [*level.columns, *level.catalog_names] if self._selected(name)}
+        child = self.child
+        if child is not None:
+            data[level.child_field] = [child._serialize(item, get) for item in get(obj, level.child_field)]
+        return data
@@ -0,0 +1,293 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from functools import partial
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Awaitable, Callable
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.backend.db import async_session_maker, on_commit
+from app.config import settings
+from app.logging_config import logger
+from app.models import BackgroundJob
+
+TaskFunc = Callable[..., Awaitable[None]]
+
+# Имя задачи -> корутина. По имени задачи находятся и в памяти, и в таблице background_jobs
+_registry: dict[str, TaskFunc] = {}
+# (ID строки background_jobs, номер попытки) выполняющейся durable-задачи, для задач из памяти - None
+current_job: ContextVar[tuple[int, int] | None] = ContextVar('current_job', default=None)
+
+
+class LeaseLost(Exception):
+    """Аренда durable-задачи истекла, и ее забрал другой воркер - результаты этой попытки не записываются"""
+
+
+def _owned(job_id: int, attempts: int):
+    """
+    Условие: строка задачи все еще принадлежит попытке attempts. Каждый захват увеличивает attempts,
+    поэтому после повторного захвата другим воркером условие перестает выполняться
+    """
+    return and_(BackgroundJob.id == job_id, BackgroundJob.status == 'running', BackgroundJob.attempts == attempts)
+
+
+def task(name: str):
+    """Регистрирует корутину как фоновую задачу. Аргументы задачи передаются только по имени и должны сериализоваться в JSON"""
+    def decorator(func: TaskFunc) -> TaskFunc:
+        _registry[name] = func
+        return func
+    return decorator
+
+
+@dataclass
+class Job:
+    name: str
+    kwargs: dict
+    attempts: int = 0
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class TaskQueue:
+    """
+    Очередь фоновых задач внутри процесса: ограниченное число воркеров, повторы с экспоненциальной задержкой.
+    Для задач, которые не должны теряться при рестарте, есть durable-режим - таблица background_jobs,
+    из которой воркеры забирают задачи через SELECT ... FOR UPDATE SKIP LOCKED и аренду строки (locked_until)
+    """
+
+    def __init__(self):
+        self._queue: asyncio.Queue[Job] = asyncio.Queue(maxsize=settings.TASK_QUEUE_MAX_SIZE)
+        self._pending: dict[int, float] = {}
+        self._workers: list[asyncio.Task] = []
+        self.processed = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+        self.last_lag = 0.0
+
+    def enqueue(self, name: str, **kwargs):
+        if name not in _registry:
+            raise KeyError(f"Unknown task {name}")
+        self._put(Job(name=name, kwargs=kwargs))
+
+    def _put(self, job: Job):
+        try:
+            self._queue.put_nowait(job)
+            self._pending[id(job)] = job.enqueued_at
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.error(f"Очередь задач переполнена, задача {job.name} отброшена")
+
+    def _retry(self, job: Job):
+        job.enqueued_at = time.monotonic()
+        self._put(job)
+
+    async def _run(self, name: str, kwargs: dict):
+        await _registry[name](**kwargs)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self._pending.pop(id(job), None)
+            self.last_lag = time.monotonic() - job.enqueued_at
+            try:
+                await self._run(job.name, job.kwargs)
+                self.processed += 1
+            except Exception as e:
+                job.attempts += 1
+                if job.attempts < settings.TASK_MAX_ATTEMPTS:
+                    self.retried += 1
+                    delay = settings.TASK_RETRY_DELAY * 2 ** (job.attempts - 1)
+                    logger.warning(f"Задача {job.name} упала ({str(e)}), повтор через {delay} с")
+                    asyncio.get_running_loop().call_later(delay, self._retry, job)
+                else:
+                    self.failed += 1
+                    logger.error(f"Задача {job.name} не выполнена после {job.attempts} попыток: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _durable_worker(self):
+        while True:
+            try:
+                found = await self._run_durable_job()
+            except Exception as e:
+                logger.error(f"Ошибка воркера durable-задач: {str(e)}")
+                found = False
+            if not found:
+                await asyncio.sleep(settings.TASK_DURABLE_POLL_INTERVAL)
+
+    async def _claim_durable_job(self):
+        """
+        Забирает одну готовую задачу из background_jobs короткой транзакцией: строка помечается running
+        с арендой до locked_until, и транзакция сразу коммитится. Задача, воркер которой упал или был остановлен,
+        забирается повторно после истечения аренды, поэтому durable-задачи должны быть идемпотентными
+        """
+        lease = timedelta(seconds=settings.TASK_DURABLE_LEASE_SECONDS)
+        expired = and_(BackgroundJob.status == 'running', BackgroundJob.locked_until < func.now())
+        async with async_session_maker() as session:
+            async with session.begin():
+                #Задача, которая раз за разом роняет воркер, не забирается бесконечно
+                await session.execute(
+                    update(BackgroundJob)
+                    .where(expired, BackgroundJob.attempts >= settings.TASK_MAX_ATTEMPTS)
+                    .values(status='failed', last_error='Lease expired', locked_until=None)
+                )
+                ready = (
+                    select(BackgroundJob.id)
+                    .where(or_(and_(BackgroundJob.status == 'pending', BackgroundJob.run_at <= func.now()), expired))
+                    .order_by(BackgroundJob.run_at)
+                    .limit(1)
+                    .with_for_update(skip_locked=True)
+                    .scalar_subquery()
+                )
+                return (await session.execute(
+                    update(BackgroundJob)
+                    .where(BackgroundJob.id == ready)
+                    .values(status='running', attempts=BackgroundJob.attempts + 1, locked_until=func.now() + lease)
+                    .returning(BackgroundJob.id, BackgroundJob.name, BackgroundJob.payload, BackgroundJob.attempts)
+                )).first()
+
+    async def _extend_lease(self, job_id: int, attempts: int):
+        """Продлевает аренду, пока задача выполняется: долгая задача не будет забрана вторым воркером"""
+        lease = timedelta(seconds=settings.TASK_DURABLE_LEASE_SECONDS)
+        while True:
+            await asyncio.sleep(settings.TASK_DURABLE_LEASE_SECONDS / 3)
+            try:
+                async with async_session_maker() as session:
+                    async with session.begin():
+                        result = await session.execute(
+                            update(BackgroundJob).where(_owned(job_id, attempts)).values(locked_until=func.now() + lease)
+                        )
+                if result.rowcount == 0:
+                    logger.error(f"Аренда durable-задачи {job_id} потеряна (попытка {attempts})")
+                    return
+            except Exception as e:
+                logger.warning(f"Не удалось продлить аренду durable-задачи {job_id}: {str(e)}")
+
+    async def _run_durable_job(self) -> bool:
+        """
+        Выполняет одну durable-задачу. Соединение основной БД занято только на время захвата и записи результата,
+        сама задача работает в собственных транзакциях. Результат записывается, только если строка
+        все еще принадлежит этой попытке: поздний результат не затрет состояние воркера, забравшего задачу после истечения аренды
+        """
+        job = await self._claim_durable_job()
+        if not job:
+            return False
+
+        heartbeat = asyncio.create_task(self._extend_lease(job.id, job.attempts))
+        token = current_job.set((job.id, job.attempts))
+        try:
+            await self._run(job.name, job.payload)
+        except LeaseLost:
+            logger.error(f"Durable-задача {job.id} ({job.name}) прервана: аренду забрал другой воркер")
+            return True
+        except Exception as e:
+            if job.attempts < settings.TASK_MAX_ATTEMPTS:
+                delay = settings.TASK_RETRY_DELAY * 2 ** (job.attempts - 1)
+                result = update(BackgroundJob).values(
+                    status='pending', run_at=func.now() + timedelta(seconds=delay), locked_until=None, last_error=str(e)
+                )
+                logger.warning(f"Durable-задача {job.id} ({job.name}) упала ({str(e)}), повтор через {delay} с")
+            else:
+                result = update(BackgroundJob).values(status='failed', locked_until=None, last_error=str(e))
+                logger.error(f"Durable-задача {job.id} ({job.name}) не выполнена после {job.attempts} попыток: {str(e)}")
+        else:
+            result = update(BackgroundJob).values(status='done', locked_until=None)
+        finally:
+            current_job.reset(token)
+            heartbeat.cancel()
+
+        async with async_session_maker() as session:
+            async with session.begin():
+                written = await session.execute(result.where(_owned(job.id, job.attempts)))
+                if written.rowcount == 0:
+                    logger.error(f"Аренда durable-задачи {job.id} ({job.name}) потеряна, результат попытки {job.attempts} не записан")
+                    return True
+                #Выполненная задача удаляется, если не сохраняла прогресс: иначе он остается доступным для чтения
+                await session.execute(
+                    delete(BackgroundJob).where(BackgroundJob.id == job.id, BackgroundJob.status == 'done', BackgroundJob.progress.is_(None))
+                )
+        return True
+
+    async def start(self):
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(settings.TASK_WORKERS)]
+        self._workers += [asyncio.create_task(self._durable_worker()) for _ in range(settings.TASK_DURABLE_WORKERS)]
+        logger.info(f"Очередь задач запущена: воркеров {settings.TASK_WORKERS}, durable-воркеров {settings.TASK_DURABLE_WORKERS}")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        return {
+            'depth': self._queue.qsize(),
+            'lag_seconds': now - min(self._pending.values()) if self._pending else 0.0,
+            'last_lag_seconds': self.last_lag,
+            'workers': settings.TASK_WORKERS,
+            'processed': self.processed,
+            'retried': self.retried,
+            'failed': self.failed,
+            'dropped': self.dropped
+        }
+
+
+task_queue = TaskQueue()
+
+
+def enqueue_after_commit(db: AsyncSession, name: str, **kwargs):
+    """Ставит задачу в очередь только после успешного коммита текущей транзакции сессии, при откате задача отбрасывается"""
+    if name not in _registry:
+        raise KeyError(f"Unknown task {name}")
+    on_commit(db, partial(task_queue.enqueue, name, **kwargs))
+
+
+def enqueue_durable(db: AsyncSession, name: str, **kwargs):
+    """Сохраняет задачу в background_jobs в текущей транзакции: задача появится у воркеров вместе с коммитом"""
+    if name not in _registry:
+        raise KeyError(f"Unknown task {name}")
+    db.add(BackgroundJob(name=name, payload=kwargs))
+
+
+async def load_progress() -> dict | None:
+    """Прогресс, сохраненный прошлой попыткой текущей durable-задачи: повторная попытка продолжает с него"""
+    job_id, _ = current_job.get()
+    async with async_session_maker() as session:
+        return await session.scalar(select(BackgroundJob.progress).where(BackgroundJob.id == job_id))
+
+
+async def save_progress(progress: dict, db: AsyncSession | None = None):
+    """
+    Сохраняет прогресс текущей durable-задачи в ее строке background_jobs - его видит любой воркер.
+    db - сессия основной БД, чтобы прогресс записался атомарно с изменениями в ее транзакции.
+    LeaseLost - задачу уже забрал другой воркер (с db транзакция вызывающего откатится вместе с прогрессом)
+    """
+    stmt = update(BackgroundJob).where(_owned(*current_job.get())).values(progress=progress)
+    if db is not None:
+        result = await db.execute(stmt)
+    else:
+        async with async_session_maker() as session:
+            async with session.begin():
+                result = await session.execute(stmt)
+    if result.rowcount == 0:
+        raise LeaseLost(current_job.get()[0])
+
+
+async def durable_metrics(db: AsyncSession) -> dict:
+    depth, lag = (await db.execute(
+        select(
+            func.count(BackgroundJob.id),
+            func.extract('epoch', func.now() - func.min(BackgroundJob.run_at))
+        )
+        .where(BackgroundJob.status == 'pending', BackgroundJob.run_at <= func.now())
+    )).one()
+    running = await db.scalar(select(func.count(BackgroundJob.id)).where(BackgroundJob.status == 'running'))
+    failed = await db.scalar(select(func.count(BackgroundJob.id)).where(BackgroundJob.status == 'failed'))
+    return {
+        'depth': depth,
+        'lag_seconds': float(lag or 0),
+        'running': running,
+        'failed': failed
+    }
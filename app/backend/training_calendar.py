@@ -0,0 +1,175 @@
+import calendar
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date
+from sqlalchemy import String, literal, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.backend.archive import unpack_training
+from app.backend.catalog import muscle_group_catalog
+from app.backend.changelog import sync_state
+from app.backend.queries import ARCHIVED_CALENDAR_TRAININGS, CALENDAR_TRAININGS
+from app.config import settings
+from app.models import ChangeLog, Exercise, MuscleGroup, Set, Training
+
+Month = tuple[int, int]
+
+
+@dataclass
+class UserCalendar:
+    """
+    Посчитанные дни прошедших месяцев пользователя и версия журнала изменений, на которой они актуальны.
+    trainings - месяц каждой закэшированной тренировки: после переноса или удаления тренировки
+    по нему находится месяц, где она была раньше
+    """
+    version: int
+    months: dict[Month, list[dict]] = field(default_factory=dict)
+    trainings: dict[int, Month] = field(default_factory=dict)
+
+
+# user_id -> календарь, вытесняются давно не запрашивавшиеся пользователи
+_cache: OrderedDict[int, UserCalendar] = OrderedDict()
+
+
+def month_bounds(month: Month) -> tuple[date, date]:
+    year, number = month
+    return date(year, number, 1), date(year, number, calendar.monthrange(year, number)[1])
+
+
+def _training_dates(user_id: int, ids: dict[str, list[int]]):
+    """(сущность, ID, дата тренировки) для изменившихся сущностей, которые еще существуют"""
+    selects = {
+        'training': lambda entity_ids: select(literal('training', String), Training.id, Training.date)
+        .where(Training.user_id == user_id, Training.id.in_(entity_ids)),
+        'muscle_group': lambda entity_ids: select(literal('muscle_group', String), MuscleGroup.id, Training.date)
+        .join(Training, Training.id == MuscleGroup.training_id)
+        .where(MuscleGroup.user_id == user_id, MuscleGroup.id.in_(entity_ids)),
+        'exercise': lambda entity_ids: select(literal('exercise', String), Exercise.id, Training.date)
+        .join(MuscleGroup, MuscleGroup.id == Exercise.muscle_group_id)
+        .join(Training, Training.id == MuscleGroup.training_id)
+        .where(Exercise.user_id == user_id, Exercise.id.in_(entity_ids)),
+        'set': lambda entity_ids: select(literal('set', String), Set.id, Training.date)
+        .join(Exercise, Exercise.id == Set.exercise_id)
+        .join(MuscleGroup, MuscleGroup.id == Exercise.muscle_group_id)
+        .join(Training, Training.id == MuscleGroup.training_id)
+        .where(Set.user_id == user_id, Set.id.in_(entity_ids)),
+    }
+    return union_all(*[selects[entity](entity_ids) for entity, entity_ids in ids.items()])
+
+
+async def _changed_months(db: AsyncSession, user_id: int, cached: UserCalendar) -> set[Month] | None:
+    """
+    Месяцы, затронутые изменениями после версии кэша, по журналу изменений.
+    None - определить нельзя (слишком много изменений или транзакция только удаляла строки), сбрасывается всё
+    """
+    since = cached.version
+    entries = (await db.execute(
+        select(ChangeLog.version, ChangeLog.entity, ChangeLog.entity_id)
+        .where(ChangeLog.user_id == user_id, ChangeLog.version > since)
+        .limit(settings.CALENDAR_MAX_CHANGES + 1)
+    )).all()
+    if len(entries) > settings.CALENDAR_MAX_CHANGES:
+        return None
+
+    ids: dict[str, list[int]] = {}
+    for entry in entries:
+        ids.setdefault(entry.entity, []).append(entry.entity_id)
+    dates = {(entity, entity_id): day for entity, entity_id, day in await db.execute(_training_dates(user_id, ids))} if ids else {}
+
+    #Удаленных строк уже нет, но каждая правка через API обновляет и существующего родителя в той же версии
+    months_by_version: dict[int, set[Month]] = {}
+    for entry in entries:
+        months = months_by_version.setdefault(entry.version, set())
+        day = dates.get((entry.entity, entry.entity_id))
+        if day is not None:
+            months.add((day.year, day.month))
+        if entry.entity == 'training' and entry.entity_id in cached.trainings:
+            months.add(cached.trainings[entry.entity_id])
+    if any(not months for months in months_by_version.values()):
+        return None
+    return set().union(*months_by_version.values())
+
+
+async def _compute(db: AsyncSession, user_id: int, date_from: date, date_to: date) -> tuple[list[dict], dict[int, date]]:
+    """Дни с тренировками за период и даты тренировок по ID"""
+    params = {'user_id': user_id, 'date_from': date_from, 'date_to': date_to}
+    hot = (await db.execute(CALENDAR_TRAININGS, params)).all()
+    names = await muscle_group_catalog.names(db, {catalog_id for row in hot for catalog_id in row.catalog_ids or []})
+
+    days: dict[date, dict] = {}
+
+    def add(day: date, groups, sets: int, volume: float):
+        entry = days.setdefault(day, {'date': day, 'muscle_groups': set(), 'sets': 0, 'volume': 0.0})
+        entry['muscle_groups'].update(groups)
+        entry['sets'] += sets
+        entry['volume'] += volume
+
+    training_dates = {}
+    for row in hot:
+        training_dates[row.id] = row.date
+        add(row.date, (names[catalog_id] for catalog_id in row.catalog_ids or [] if catalog_id in names), row.sets, float(row.volume))
+
+    #Архивные тренировки читаются после рабочих: тренировка, заархивированная между запросами, попадет хотя бы в один из них
+    for training_id, day, document in await db.execute(ARCHIVED_CALENDAR_TRAININGS, params):
+        if training_id in training_dates:
+            continue
+        training_dates[training_id] = day
+        training = unpack_training(document)
+        sets = [
+            set_data
+            for muscle_group in training['muscle_groups']
+            for exercise in muscle_group['exercises']
+            for set_data in exercise['sets']
+        ]
+        add(
+            day,
+            (muscle_group['group_name'] for muscle_group in training['muscle_groups']),
+            len(sets),
+            sum((set_data['weight_per_exe'] or 0) * set_data['reps'] for set_data in sets)
+        )
+
+    return [
+        {**entry, 'muscle_groups': sorted(entry['muscle_groups'])}
+        for _, entry in sorted(days.items())
+    ], training_dates
+
+
+async def training_calendar(db: AsyncSession, user_id: int, months: list[Month]) -> list[dict]:
+    """
+    Дни с тренировками за месяцы months (по возрастанию). Прошедшие месяцы кэшируются в процессе и
+    сбрасываются, только если журнал изменений показывает правку тренировки этого месяца
+    """
+    version, floor = await sync_state(db, user_id)
+    cached = _cache.get(user_id)
+    if cached is None:
+        cached = _cache[user_id] = UserCalendar(version)
+        if len(_cache) > settings.CALENDAR_CACHE_USERS:
+            _cache.popitem(last=False)
+    else:
+        _cache.move_to_end(user_id)
+
+    if cached.version != version:
+        changed = None if cached.version < floor else await _changed_months(db, user_id, cached)
+        if changed is None:
+            cached.months.clear()
+            cached.trainings.clear()
+        else:
+            for month in changed:
+                cached.months.pop(month, None)
+            cached.trainings = {training_id: month for training_id, month in cached.trainings.items() if month not in changed}
+        cached.version = version
+
+    found = {month: cached.months[month] for month in months if month in cached.months}
+    stale = [month for month in months if month not in found]
+    if stale:
+        days, training_dates = await _compute(db, user_id, month_bounds(stale[0])[0], month_bounds(stale[-1])[1])
+        today = date.today()
+        for month in stale:
+            start, end = month_bounds(month)
+            found[month] = [day for day in days if start <= day['date'] <= end]
+            #Текущий и будущие месяцы еще меняются - в кэш попадают только прошедшие
+            if end < today:
+                cached.months[month] = found[month]
+                cached.trainings.update(
+                    (training_id, month) for training_id, day in training_dates.items() if start <= day <= end
+                )
+    return [day for month in months for day in found[month]]
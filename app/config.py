@@ -10,6 +10,52 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str
     FULL_RIGHTS: str
+    ACCESS_TOKEN_MINUTES: int = 20
+    REFRESH_TOKEN_DAYS: int = 30
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_SHARDS: dict[int, str] = {}
+    SHARD_NEW_USERS: list[int] = [0]
+    SHARD_ID_STRIDE: int = 16
+    SHARD_MAP_CACHE_SECONDS: float = 30
+    SHARD_MAP_CACHE_SIZE: int = 10000
+    SHARD_MOVE_BATCH_SIZE: int = 5000
+    READ_STATEMENT_TIMEOUT_MS: int = 5000
+    ROUTE_STATEMENT_TIMEOUTS_MS: dict[str, int] = {}
+    IMPORT_BATCH_SIZE: int = 1000
+    USER_DELETE_BATCH_SIZE: int = 5000
+    TASK_WORKERS: int = 4
+    TASK_DURABLE_WORKERS: int = 1
+    TASK_QUEUE_MAX_SIZE: int = 10000
+    TASK_MAX_ATTEMPTS: int = 3
+    TASK_RETRY_DELAY: float = 1.0
+    TASK_DURABLE_POLL_INTERVAL: float = 1.0
+    TASK_DURABLE_LEASE_SECONDS: float = 60
+    LIVE_MAX_CONNECTIONS_PER_USER: int = 5
+    LIVE_QUEUE_SIZE: int = 100
+    LIVE_MAX_BUFFER_BYTES: int = 256 * 1024
+    LIVE_MAX_MESSAGE_BYTES: int = 4096
+    IDEMPOTENCY_TTL_HOURS: int = 24
+    CHANGE_LOG_RETENTION_DAYS: int = 30
+    CHANGE_LOG_COMPACT_EVERY: int = 500
+    ARCHIVE_AFTER_DAYS: int = 365
+    ARCHIVE_BATCH_SIZE: int = 200
+    TRAINING_BATCH_MAX_SIZE: int = 50
+    CALENDAR_CACHE_USERS: int = 1000
+    CALENDAR_MAX_CHANGES: int = 1000
+    LOAD_SAMPLE_INTERVAL: float = 0.5
+    LOAD_PROBE_TIMEOUT: float = 5.0
+    LOAD_SHED_LOOP_LAG_MS: int = 200
+    LOAD_SHED_POOL_WAIT_MS: int = 500
+    LOAD_SHED_CRITICAL_FACTOR: float = 3.0
+    LOAD_SHED_RETRY_AFTER: int = 5
+    LOAD_SHED_LOW_PRIORITY_PATHS: list[str] = [
+        '/records/*', '/exercises/search', '/trainings/', '/sets/', '/sync/', '/analytics/*'
+    ]
+    PROFILE_MAX_SECONDS: int = 60
+    ANALYTICS_CACHE_USERS: int = 200
+    ANALYTICS_MAX_DAYS: int = 730
 
     def get_db_url(self) -> str:
         return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
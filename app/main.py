@@ -1,18 +1,40 @@
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from app.backend.admission import AdmissionMiddleware, load_monitor
+from app.backend.msgpack_codec import MsgPackMiddleware
+from app.backend.tasks import task_queue
 from app.routers import (
+	router_analytics,
 	router_exercise,
+	router_health,
+	router_import,
+	router_live,
 	router_muscle_group,
 	router_permission,
+	router_records,
 	router_set,
+	router_sync,
+	router_tasks,
 	router_training,
 	router_user,
 )
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await task_queue.start()
+    await load_monitor.start()
+    yield
+    await load_monitor.stop()
+    await task_queue.stop()
 
+
+app = FastAPI(lifespan=lifespan)
+
+app.add_middleware(MsgPackMiddleware)
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:8080"],
@@ -27,6 +49,13 @@ app.include_router(router_muscle_group)
 app.include_router(router_exercise)
 app.include_router(router_set)
 app.include_router(router_permission)
+app.include_router(router_import)
+app.include_router(router_tasks)
+app.include_router(router_records)
+app.include_router(router_live)
+app.include_router(router_sync)
+app.include_router(router_health)
+app.include_router(router_analytics)
 
 
 if __name__ == "__main__":
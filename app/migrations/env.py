@@ -26,6 +26,18 @@ from app.models import all_models
 
 target_metadata = Base.metadata
 
+#alembic -x shard=N upgrade head - миграции шарда N из DB_SHARDS, без -x - основная БД из alembic.ini
+shard = context.get_x_argument(as_dictionary=True).get('shard')
+if shard is not None:
+    config.set_main_option('sqlalchemy.url', settings.DB_SHARDS[int(shard)].replace('%', '%%'))
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Секции sets_p* создаются миграцией и не описаны в моделях - autogenerate не должен предлагать их удалить"""
+    if type_ == 'table' and reflected and name.startswith('sets_p') and name[len('sets_p'):].isdigit():
+        return False
+    return True
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -48,6 +60,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -57,7 +70,7 @@ def run_migrations_offline() -> None:
 
 
 def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(connection=connection, target_metadata=target_metadata, include_object=include_object)
 
     with context.begin_transaction():
         context.run_migrations()
@@ -0,0 +1,98 @@
+"""add exercise and muscle group catalog
+
+Revision ID: d3b68f10e5a7
+Revises: a41f7e9b2c08
+Create Date: 2026-10-19 15:31:58.204417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3b68f10e5a7'
+down_revision: Union[str, None] = 'a41f7e9b2c08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('exercise_catalog',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('exercise_name', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('exercise_name', 'user_id', name='uq_exercise_catalog_name_user', postgresql_nulls_not_distinct=True)
+    )
+    op.create_index('ix_exercise_catalog_exercise_name_trgm', 'exercise_catalog', ['exercise_name'], unique=False, postgresql_using='gin', postgresql_ops={'exercise_name': 'gin_trgm_ops'})
+    op.create_table('muscle_group_catalog',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('group_name', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('group_name', 'user_id', name='uq_muscle_group_catalog_name_user', postgresql_nulls_not_distinct=True)
+    )
+    op.add_column('exercises', sa.Column('exercise_catalog_id', sa.Integer(), nullable=True))
+    op.add_column('muscle_groups', sa.Column('muscle_group_catalog_id', sa.Integer(), nullable=True))
+
+    # Перенос данных: каждое название попадает в каталог один раз.
+    # Названия, которые встречаются у нескольких пользователей, становятся общими, остальные - записями своего пользователя
+    op.execute("""
+        INSERT INTO exercise_catalog (exercise_name, user_id)
+        SELECT exercise_name, CASE WHEN count(DISTINCT user_id) > 1 THEN NULL ELSE min(user_id) END
+        FROM exercises
+        GROUP BY exercise_name
+    """)
+    op.execute("""
+        UPDATE exercises SET exercise_catalog_id = exercise_catalog.id
+        FROM exercise_catalog
+        WHERE exercise_catalog.exercise_name = exercises.exercise_name
+    """)
+    op.execute("""
+        INSERT INTO muscle_group_catalog (group_name, user_id)
+        SELECT group_name, CASE WHEN count(DISTINCT user_id) > 1 THEN NULL ELSE min(user_id) END
+        FROM muscle_groups
+        GROUP BY group_name
+    """)
+    op.execute("""
+        UPDATE muscle_groups SET muscle_group_catalog_id = muscle_group_catalog.id
+        FROM muscle_group_catalog
+        WHERE muscle_group_catalog.group_name = muscle_groups.group_name
+    """)
+
+    op.alter_column('exercises', 'exercise_catalog_id', existing_type=sa.Integer(), nullable=False)
+    op.alter_column('muscle_groups', 'muscle_group_catalog_id', existing_type=sa.Integer(), nullable=False)
+    op.create_foreign_key(None, 'exercises', 'exercise_catalog', ['exercise_catalog_id'], ['id'])
+    op.create_foreign_key(None, 'muscle_groups', 'muscle_group_catalog', ['muscle_group_catalog_id'], ['id'])
+    op.create_index('ix_exercises_user_id_exercise_catalog_id', 'exercises', ['user_id', 'exercise_catalog_id'], unique=False)
+    op.drop_index('ix_exercises_user_id_exercise_name_trgm', table_name='exercises', postgresql_using='gin', postgresql_ops={'exercise_name': 'gin_trgm_ops'})
+    op.drop_column('exercises', 'exercise_name')
+    op.drop_column('muscle_groups', 'group_name')
+
+
+def downgrade() -> None:
+    op.add_column('muscle_groups', sa.Column('group_name', sa.VARCHAR(), autoincrement=False, nullable=True))
+    op.add_column('exercises', sa.Column('exercise_name', sa.VARCHAR(), autoincrement=False, nullable=True))
+    op.execute("""
+        UPDATE muscle_groups SET group_name = muscle_group_catalog.group_name
+        FROM muscle_group_catalog
+        WHERE muscle_group_catalog.id = muscle_groups.muscle_group_catalog_id
+    """)
+    op.execute("""
+        UPDATE exercises SET exercise_name = exercise_catalog.exercise_name
+        FROM exercise_catalog
+        WHERE exercise_catalog.id = exercises.exercise_catalog_id
+    """)
+    op.alter_column('muscle_groups', 'group_name', existing_type=sa.VARCHAR(), nullable=False)
+    op.alter_column('exercises', 'exercise_name', existing_type=sa.VARCHAR(), nullable=False)
+    op.create_index('ix_exercises_user_id_exercise_name_trgm', 'exercises', ['user_id', 'exercise_name'], unique=False, postgresql_using='gin', postgresql_ops={'exercise_name': 'gin_trgm_ops'})
+    op.drop_index('ix_exercises_user_id_exercise_catalog_id', table_name='exercises')
+    op.drop_column('muscle_groups', 'muscle_group_catalog_id')
+    op.drop_column('exercises', 'exercise_catalog_id')
+    op.drop_table('muscle_group_catalog')
+    op.drop_index('ix_exercise_catalog_exercise_name_trgm', table_name='exercise_catalog', postgresql_using='gin', postgresql_ops={'exercise_name': 'gin_trgm_ops'})
+    op.drop_table('exercise_catalog')
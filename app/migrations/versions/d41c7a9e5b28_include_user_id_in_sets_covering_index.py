@@ -0,0 +1,29 @@
+"""include user_id in sets covering index
+
+Revision ID: d41c7a9e5b28
+Revises: 6e0b8c2f4a17
+Create Date: 2026-10-20 12:26:40.193857
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41c7a9e5b28'
+down_revision: Union[str, None] = '6e0b8c2f4a17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Календарь соединяет sets по exercise_id и user_id: без user_id в индексе каждая строка читается из heap
+    op.drop_index('ix_sets_exercise_id', table_name='sets')
+    op.create_index('ix_sets_exercise_id', 'sets', ['exercise_id'], unique=False, postgresql_include=['user_id', 'weight_per_exe', 'reps'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sets_exercise_id', table_name='sets')
+    op.create_index('ix_sets_exercise_id', 'sets', ['exercise_id'], unique=False, postgresql_include=['weight_per_exe', 'reps'])
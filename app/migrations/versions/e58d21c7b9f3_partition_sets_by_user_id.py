@@ -0,0 +1,85 @@
+"""partition sets by user_id
+
+Revision ID: e58d21c7b9f3
+Revises: 7f2c9a4e8d15
+Create Date: 2026-10-19 18:22:09.640372
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e58d21c7b9f3'
+down_revision: Union[str, None] = '7f2c9a4e8d15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Число секций фиксируется при создании: смена требует повторного переноса данных
+SETS_PARTITIONS = 16
+
+
+def upgrade() -> None:
+    # Секционированную таблицу нельзя получить из обычной через ALTER, поэтому создаем новую и переносим строки.
+    # Последовательность sets_id_seq сохраняется, ID подходов не меняются
+    op.rename_table('sets', 'sets_old')
+    op.execute('ALTER TABLE sets_old RENAME CONSTRAINT sets_pkey TO sets_old_pkey')
+    op.execute('ALTER INDEX ix_sets_exercise_id RENAME TO ix_sets_old_exercise_id')
+    op.execute('ALTER INDEX ix_sets_user_id RENAME TO ix_sets_old_user_id')
+    op.execute("""
+        CREATE TABLE sets (
+            id INTEGER NOT NULL DEFAULT nextval('sets_id_seq'),
+            exercise_id INTEGER NOT NULL,
+            weight_per_exe DOUBLE PRECISION,
+            reps INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (id, user_id)
+        ) PARTITION BY HASH (user_id)
+    """)
+    for remainder in range(SETS_PARTITIONS):
+        op.execute(
+            f"CREATE TABLE sets_p{remainder} PARTITION OF sets "
+            f"FOR VALUES WITH (MODULUS {SETS_PARTITIONS}, REMAINDER {remainder})"
+        )
+
+    op.execute("""
+        INSERT INTO sets (id, exercise_id, weight_per_exe, reps, user_id)
+        SELECT id, exercise_id, weight_per_exe, reps, user_id FROM sets_old
+    """)
+    op.execute('ALTER SEQUENCE sets_id_seq OWNED BY sets.id')
+    op.drop_table('sets_old')
+
+    op.create_foreign_key('sets_exercise_id_fkey', 'sets', 'exercises', ['exercise_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('sets_user_id_fkey', 'sets', 'users', ['user_id'], ['id'])
+    op.create_index(op.f('ix_sets_exercise_id'), 'sets', ['exercise_id'], unique=False)
+    op.create_index(op.f('ix_sets_user_id'), 'sets', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.rename_table('sets', 'sets_partitioned')
+    op.execute('ALTER TABLE sets_partitioned RENAME CONSTRAINT sets_pkey TO sets_partitioned_pkey')
+    op.execute('ALTER INDEX ix_sets_exercise_id RENAME TO ix_sets_partitioned_exercise_id')
+    op.execute('ALTER INDEX ix_sets_user_id RENAME TO ix_sets_partitioned_user_id')
+    op.execute("""
+        CREATE TABLE sets (
+            id INTEGER NOT NULL DEFAULT nextval('sets_id_seq'),
+            exercise_id INTEGER NOT NULL,
+            weight_per_exe DOUBLE PRECISION,
+            reps INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (id)
+        )
+    """)
+    op.execute("""
+        INSERT INTO sets (id, exercise_id, weight_per_exe, reps, user_id)
+        SELECT id, exercise_id, weight_per_exe, reps, user_id FROM sets_partitioned
+    """)
+    op.execute('ALTER SEQUENCE sets_id_seq OWNED BY sets.id')
+    op.drop_table('sets_partitioned')
+
+    op.create_foreign_key('sets_exercise_id_fkey', 'sets', 'exercises', ['exercise_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('sets_user_id_fkey', 'sets', 'users', ['user_id'], ['id'])
+    op.create_index(op.f('ix_sets_exercise_id'), 'sets', ['exercise_id'], unique=False)
+    op.create_index(op.f('ix_sets_user_id'), 'sets', ['user_id'], unique=False)
@@ -1,9 +1,20 @@
-from .all_models import Training, MuscleGroup, Exercise, Set, User
+from .all_models import Training, MuscleGroup, Exercise, Set, User, BackgroundJob, ExerciseCatalog, MuscleGroupCatalog, RefreshToken, PersonalRecord, RepRecord, IdempotencyRecord, ChangeVersion, ChangeLog, ArchivedTraining, ArchivedRepRecord
 
 __all__ = [
     "Training",
     "MuscleGroup",
     "Exercise",
     "Set",
-    "User"
+    "User",
+    "BackgroundJob",
+    "ExerciseCatalog",
+    "MuscleGroupCatalog",
+    "RefreshToken",
+    "PersonalRecord",
+    "RepRecord",
+    "IdempotencyRecord",
+    "ChangeVersion",
+    "ChangeLog",
+    "ArchivedTraining",
+    "ArchivedRepRecord"
 ]
\ No newline at end of file
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, String, Integer, Float, ForeignKey, Date, Boolean, UniqueConstraint
+from sqlalchemy import Column, String, Integer, BigInteger, Float, LargeBinary, ForeignKey, Date, DateTime, Boolean, UniqueConstraint, Index, JSON, func
 from sqlalchemy.orm import relationship, mapped_column, Mapped
 from typing import List
+from datetime import datetime
 from ..backend import Base
 
 class User(Base):
@@ -12,14 +13,20 @@ class User(Base):
     password: Mapped[str] = mapped_column(String, nullable=False)
     is_admin: Mapped[bool] = mapped_column(Boolean, default=False)
     is_guest: Mapped[bool] = mapped_column(Boolean, default=True)
+    #Справочник шардов: значения актуальны в основной БД, в копиях строки на шардах нужны только для внешних ключей
+    shard: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
+    shard_moving: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False, server_default='false')
 
-    trainings: Mapped[List["Training"]] = relationship("Training", back_populates='user', cascade='all, delete-orphan')
+    trainings: Mapped[List["Training"]] = relationship("Training", back_populates='user', cascade='all, delete-orphan', passive_deletes=True)
 
 class Training(Base):
     __tablename__ = 'trainings'
 
-    #Добавим уникальное ограничение(чтобы в один день у каждого юзера была только 1 тренировка)
-    __table_args__ = (UniqueConstraint('user_id', 'date', name='uq_user_training_date'),)
+    #Добавим уникальное ограничение(чтобы в один день у каждого юзера была только 1 тренировка).
+    #INCLUDE (id) - календарь читает тренировки за период только из индекса
+    __table_args__ = (
+        Index('uq_user_training_date', 'user_id', 'date', unique=True, postgresql_include=['id']),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     date: Mapped[Date] =  mapped_column(Date, nullable=False)
@@ -30,40 +37,236 @@ class Training(Base):
     muscle_groups: Mapped[List["MuscleGroup"]] = relationship("MuscleGroup", back_populates='training')
 
 
+class MuscleGroupCatalog(Base):
+    __tablename__ = "muscle_group_catalog"
+
+    #user_id = NULL - общая запись каталога, иначе пользовательская. Названия не повторяются в пределах владельца
+    __table_args__ = (
+        UniqueConstraint('group_name', 'user_id', name='uq_muscle_group_catalog_name_user', postgresql_nulls_not_distinct=True),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    group_name: Mapped[str] = mapped_column(String, nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete="CASCADE"), nullable=True)
+
+
 class MuscleGroup(Base):
     __tablename__ = "muscle_groups"
 
+    #Покрывающие индексы по ссылке на родителя: агрегаты календаря считаются index-only сканированием
+    __table_args__ = (
+        Index('ix_muscle_groups_training_id', 'training_id', postgresql_include=['id', 'muscle_group_catalog_id']),
+    )
+
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     training_id: Mapped[int] = mapped_column(Integer, ForeignKey("trainings.id", ondelete="CASCADE"))
-    group_name: Mapped[str] = mapped_column(String, nullable=False)
-    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'))
+    muscle_group_catalog_id: Mapped[int] = mapped_column(Integer, ForeignKey("muscle_group_catalog.id"), nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), index=True)
 
 
     training: Mapped["Training"] = relationship("Training", back_populates='muscle_groups')
     exercises: Mapped[List["Exercise"]] = relationship("Exercise", back_populates="muscle_group")
+    catalog_entry: Mapped["MuscleGroupCatalog"] = relationship("MuscleGroupCatalog", lazy='joined', innerjoin=True)
+
+    @property
+    def group_name(self) -> str:
+        """Название из каталога. Для смены названия нужно менять muscle_group_catalog_id"""
+        return self.catalog_entry.group_name
+
+
+class ExerciseCatalog(Base):
+    __tablename__ = "exercise_catalog"
+
+    #user_id = NULL - общая запись каталога, иначе пользовательская. Названия не повторяются в пределах владельца
+    __table_args__ = (
+        UniqueConstraint('exercise_name', 'user_id', name='uq_exercise_catalog_name_user', postgresql_nulls_not_distinct=True),
+        #Триграммный GIN-индекс для поиска по названию (нужно расширение pg_trgm)
+        Index(
+            'ix_exercise_catalog_exercise_name_trgm', 'exercise_name',
+            postgresql_using='gin',
+            postgresql_ops={'exercise_name': 'gin_trgm_ops'}
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    exercise_name: Mapped[str] = mapped_column(String, nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete="CASCADE"), nullable=True)
+
 
 class Exercise(Base):
     __tablename__ = "exercises"
 
+    #Выборки и группировки упражнений пользователя по записи каталога
+    __table_args__ = (
+        Index('ix_exercises_user_id_exercise_catalog_id', 'user_id', 'exercise_catalog_id'),
+        Index('ix_exercises_muscle_group_id', 'muscle_group_id', postgresql_include=['id']),
+    )
+
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     muscle_group_id: Mapped[int] = mapped_column(Integer, ForeignKey("muscle_groups.id", ondelete="CASCADE"))
-    exercise_name: Mapped[str] = mapped_column(String, nullable=False)
+    exercise_catalog_id: Mapped[int] = mapped_column(Integer, ForeignKey("exercise_catalog.id"), nullable=False)
     weight: Mapped[float] = mapped_column(Float, nullable=True, default=0)
     numbers_reps: Mapped[int] = mapped_column(Integer, nullable=False)
-    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'))
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), index=True)
 
 
     muscle_group: Mapped["MuscleGroup"] = relationship("MuscleGroup", back_populates='exercises')
-    sets: Mapped[List["Set"]] = relationship("Set", back_populates='exercise')
+    #user_id в условии связи позволяет PostgreSQL отсечь лишние секции sets при загрузке подходов упражнения
+    sets: Mapped[List["Set"]] = relationship(
+        "Set",
+        back_populates='exercise',
+        primaryjoin="and_(Exercise.id == foreign(Set.exercise_id), Exercise.user_id == foreign(Set.user_id))"
+    )
+    catalog_entry: Mapped["ExerciseCatalog"] = relationship("ExerciseCatalog", lazy='joined', innerjoin=True)
+
+    @property
+    def exercise_name(self) -> str:
+        """Название из каталога. Для смены названия нужно менять exercise_catalog_id"""
+        return self.catalog_entry.exercise_name
 
 class Set(Base):
     __tablename__ = "sets"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    #Таблица секционирована по хэшу user_id (секции sets_p0..sets_pN создаются миграцией),
+    #поэтому user_id входит в первичный ключ, а запросы с условием на user_id читают одну секцию
+    __table_args__ = (
+        Index('ix_sets_exercise_id', 'exercise_id', postgresql_include=['user_id', 'weight_per_exe', 'reps']),
+        {'postgresql_partition_by': 'HASH (user_id)'},
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     exercise_id: Mapped[int] = mapped_column(Integer, ForeignKey("exercises.id", ondelete="CASCADE"))
     weight_per_exe: Mapped[float] = mapped_column(Float, nullable=True)
     reps: Mapped[int] = mapped_column(Integer, nullable=False)
-    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'))
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), primary_key=True, index=True)
+
+
+    exercise: Mapped["Exercise"] = relationship(
+        "Exercise",
+        back_populates="sets",
+        primaryjoin="and_(Exercise.id == foreign(Set.exercise_id), Exercise.user_id == foreign(Set.user_id))"
+    )
+
+
+class BackgroundJob(Base):
+    __tablename__ = "background_jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(String, nullable=False)
+    payload: Mapped[dict] = mapped_column(JSON, nullable=False, default=dict)
+    status: Mapped[str] = mapped_column(String, nullable=False, default='pending')
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_error: Mapped[str] = mapped_column(String, nullable=True)
+    #Аренда выполняющейся задачи: после этого времени задачу может забрать другой воркер
+    locked_until: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    #Прогресс долгой задачи (save_progress): строка выполненной задачи с прогрессом остается со статусом done
+    progress: Mapped[dict] = mapped_column(JSON, nullable=True)
+    run_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now(), index=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
 
 
-    exercise: Mapped["Exercise"] = relationship("Exercise", back_populates="sets")
\ No newline at end of file
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete="CASCADE"), index=True, nullable=False)
+    #Храним только sha256 от токена: сам токен случайный и длинный, медленный хэш не нужен
+    token_hash: Mapped[str] = mapped_column(String, unique=True, index=True, nullable=False)
+    device: Mapped[str] = mapped_column(String, nullable=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    revoked_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
+
+
+class PersonalRecord(Base):
+    __tablename__ = "personal_records"
+
+    #Сводные рекорды по упражнению каталога - обновляются при записи подходов, чтение без обхода истории sets
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete="CASCADE"), primary_key=True)
+    exercise_catalog_id: Mapped[int] = mapped_column(Integer, ForeignKey('exercise_catalog.id', ondelete="CASCADE"), primary_key=True)
+    max_weight: Mapped[float] = mapped_column(Float, nullable=True)
+    max_weight_reps: Mapped[int] = mapped_column(Integer, nullable=True)
+    best_e1rm: Mapped[float] = mapped_column(Float, nullable=True)
+    max_reps: Mapped[int] = mapped_column(Integer, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
+
+    catalog_entry: Mapped["ExerciseCatalog"] = relationship("ExerciseCatalog", lazy='joined', innerjoin=True)
+
+    @property
+    def exercise_name(self) -> str:
+        return self.catalog_entry.exercise_name
+
+
+class RepRecord(Base):
+    __tablename__ = "rep_records"
+
+    #Максимум повторений на каждом весе упражнения (подходы без веса - вес 0)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete="CASCADE"), primary_key=True)
+    exercise_catalog_id: Mapped[int] = mapped_column(Integer, ForeignKey('exercise_catalog.id', ondelete="CASCADE"), primary_key=True)
+    weight: Mapped[float] = mapped_column(Float, primary_key=True)
+    reps: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_keys"
+
+    #Ответ на запрос с заголовком Idempotency-Key, сохраняется в той же транзакции, что и сама запись
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete="CASCADE"), primary_key=True)
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+    status_code: Mapped[int] = mapped_column(Integer, nullable=True)
+    response: Mapped[dict] = mapped_column(JSON, nullable=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+
+
+class ChangeVersion(Base):
+    __tablename__ = "change_versions"
+
+    #Счетчик версий журнала изменений пользователя. floor - максимальная версия, удаленная при сжатии журнала:
+    #курсор ниже floor означает, что часть изменений потеряна и нужна полная синхронизация
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete="CASCADE"), primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    floor: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+
+class ChangeLog(Base):
+    __tablename__ = "change_log"
+
+    __table_args__ = (
+        Index('ix_change_log_user_id_version_id', 'user_id', 'version', 'id'),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    entity: Mapped[str] = mapped_column(String, nullable=False)
+    entity_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    op: Mapped[str] = mapped_column(String, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
+
+
+class ArchivedTraining(Base):
+    __tablename__ = "archived_trainings"
+
+    #Холодное хранилище: тренировка целиком в виде сжатого JSON-документа в форме TrainingResponse.
+    #ID сохраняется из trainings, поэтому запрос тренировки по ID прозрачно находит ее и после архивации
+    __table_args__ = (
+        Index('ix_archived_trainings_user_id_date', 'user_id', 'date'),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
+    date: Mapped[Date] = mapped_column(Date, nullable=False)
+    title: Mapped[str] = mapped_column(String, nullable=True)
+    document: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    archived_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
+
+
+class ArchivedRepRecord(Base):
+    __tablename__ = "archived_rep_records"
+
+    #Максимум повторений на каждом весе по архивным подходам - пересчет рекордов учитывает его вместе с sets
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete="CASCADE"), primary_key=True)
+    exercise_catalog_id: Mapped[int] = mapped_column(Integer, ForeignKey('exercise_catalog.id', ondelete="CASCADE"), primary_key=True)
+    weight: Mapped[float] = mapped_column(Float, primary_key=True)
+    reps: Mapped[int] = mapped_column(Integer, nullable=False)
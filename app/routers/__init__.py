@@ -4,4 +4,11 @@ from .muscle_group import router as router_muscle_group
 from .exercise import router as router_exercise
 from .set import router as router_set
 from .permission import router as router_permission
-from .dependencies import db_session, current_user
\ No newline at end of file
+from .bulk_import import router as router_import
+from .tasks import router as router_tasks
+from .records import router as router_records
+from .live import router as router_live
+from .sync import router as router_sync
+from .health import router as router_health
+from .analytics import router as router_analytics
+from .dependencies import db_session, db_read_session, primary_db_session, primary_db_read_session, current_user, idempotency_key
\ No newline at end of file
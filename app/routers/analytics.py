@@ -0,0 +1,64 @@
+from datetime import date
+from typing import List
+from fastapi import APIRouter, Query
+from app.backend.analytics import e1rm_trends, fatigue, set_history, to_day, weekly_volume, workload
+from app.config import settings
+from app.routers.dependencies import current_user, db_read_session
+from app.schemas.response_schemas import E1rmTrend, FatigueDay, WeeklyVolume, WorkloadDay
+from logging_config import logger
+
+router = APIRouter(prefix='/analytics', tags=['analytics'])
+
+MAX_WEEKS = settings.ANALYTICS_MAX_DAYS // 7
+
+
+@router.get('/workload', response_model=List[WorkloadDay])
+async def get_workload(
+    db: db_read_session,
+    get_user: current_user,
+    days: int = Query(28, ge=1, le=settings.ANALYTICS_MAX_DAYS)
+):
+    """Дневной объем и отношение острой (7 дней) к хронической (28 дней) нагрузке за последние days дней"""
+    user_id = get_user.get('id')
+    logger.info(f"Пользователь {user_id} получает нагрузку за {days} дней")
+    return workload(await set_history(db, user_id), to_day(date.today()), days)
+
+
+@router.get('/volume', response_model=List[WeeklyVolume])
+async def get_weekly_volume(
+    db: db_read_session,
+    get_user: current_user,
+    weeks: int = Query(12, ge=1, le=MAX_WEEKS)
+):
+    """Подходы и объем по группам мышц за каждую из последних weeks недель (с понедельника)"""
+    user_id = get_user.get('id')
+    logger.info(f"Пользователь {user_id} получает недельный объем за {weeks} недель")
+    return weekly_volume(await set_history(db, user_id), to_day(date.today()), weeks)
+
+
+@router.get('/e1rm', response_model=List[E1rmTrend])
+async def get_e1rm_trends(
+    db: db_read_session,
+    get_user: current_user,
+    weeks: int = Query(26, ge=1, le=MAX_WEEKS),
+    exercise_name: str | None = Query(None, min_length=1, max_length=50)
+):
+    """Лучший расчетный 1ПМ по неделям и наклон тренда для каждого упражнения (или только для exercise_name)"""
+    user_id = get_user.get('id')
+    logger.info(f"Пользователь {user_id} получает тренды 1ПМ за {weeks} недель")
+    trends = e1rm_trends(await set_history(db, user_id), to_day(date.today()), weeks)
+    if exercise_name is not None:
+        trends = [trend for trend in trends if trend['exercise_name'] == exercise_name]
+    return trends
+
+
+@router.get('/fatigue', response_model=List[FatigueDay])
+async def get_fatigue(
+    db: db_read_session,
+    get_user: current_user,
+    days: int = Query(90, ge=1, le=settings.ANALYTICS_MAX_DAYS)
+):
+    """Кривые тренированности, усталости и готовности (модель Banister) за последние days дней"""
+    user_id = get_user.get('id')
+    logger.info(f"Пользователь {user_id} получает кривую усталости за {days} дней")
+    return fatigue(await set_history(db, user_id), to_day(date.today()), days)
@@ -1,8 +1,11 @@
+import hashlib
+import secrets
 from fastapi import APIRouter, Depends, HTTPException, status
 from app.backend.db_depends import get_db
-from app.models.all_models import User
-from app.schemas.create_schemas import CreateUser
-from sqlalchemy import insert, or_, select
+from app.backend.shards import place_new_user
+from app.models.all_models import User, RefreshToken
+from app.schemas.create_schemas import CreateUser, RefreshTokenRequest
+from sqlalchemy import insert, or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Annotated
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
@@ -38,6 +41,30 @@ async def create_access_token(username: str, user_id: int, is_admin: bool, is_gu
         )
 
 
+def hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def create_refresh_token(db: AsyncSession, user_id: int, device: str | None) -> str:
+    """Создает refresh-токен для пользователя и устройства. В БД сохраняется только хэш, сам токен возвращается клиенту"""
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        user_id=user_id,
+        token_hash=hash_refresh_token(token),
+        device=device,
+        expires_at=datetime.now() + timedelta(days=settings.REFRESH_TOKEN_DAYS)
+    ))
+    return token
+
+
+async def revoke_refresh_tokens(db: AsyncSession, user_id: int, device: str | None = None, all_devices: bool = False):
+    """Отзывает активные refresh-токены пользователя: для одного устройства или для всех"""
+    query = update(RefreshToken).where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+    if not all_devices:
+        query = query.where(RefreshToken.device.is_not_distinct_from(device))
+    await db.execute(query.values(revoked_at=datetime.now()))
+
+
 async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
     try:
         payload = jwt.decode(token, secret_key, algorithms=algorithm)
@@ -119,10 +146,13 @@ async def login(
                 detail="Could not validate user"
             )
         
-        token = await create_access_token(user.username, user.id, user.is_admin, user.is_guest, expires_delta=timedelta(minutes=20))
+        token = await create_access_token(user.username, user.id, user.is_admin, user.is_guest, expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_MINUTES))
+        refresh_token = await create_refresh_token(db, user.id, form_data.client_id)
+        await db.commit()
         logger.info(f"Token issued for user {user.username}")
         return {
             'access_token': token,
+            'refresh_token': refresh_token,
             'token_type': 'bearer'
         }
     except Exception as e:
@@ -130,6 +160,76 @@ async def login(
         raise
 
 
+@router.post('/refresh')
+async def refresh_access_token(db: Annotated[AsyncSession, Depends(get_db)], refresh_data: RefreshTokenRequest):
+    """
+    Выдает новую пару access/refresh по refresh-токену без проверки пароля: один поиск по индексу token_hash.
+    Использованный refresh-токен отзывается (ротация) одним UPDATE ... WHERE revoked_at IS NULL RETURNING:
+    из одновременных обновлений одним токеном новую пару получает только одно. Повторное предъявление
+    отозванного токена считается утечкой - отзываются все токены этого устройства
+    """
+    token_hash = hash_refresh_token(refresh_data.refresh_token)
+    rotated = (await db.execute(
+        update(RefreshToken)
+        .where(
+            RefreshToken.token_hash == token_hash,
+            RefreshToken.revoked_at.is_(None),
+            RefreshToken.expires_at > datetime.now()
+        )
+        .values(revoked_at=datetime.now())
+        .returning(RefreshToken.user_id, RefreshToken.device)
+    )).first()
+    if not rotated:
+        stored_token = await db.scalar(select(RefreshToken).where(RefreshToken.token_hash == token_hash))
+        if not stored_token:
+            logger.warning("Refresh attempt with unknown token")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail='Could not validate refresh token'
+            )
+        if stored_token.revoked_at is not None:
+            logger.warning(f"Reuse of revoked refresh token for user {stored_token.user_id}, revoking device {stored_token.device}")
+            await revoke_refresh_tokens(db, stored_token.user_id, stored_token.device)
+            await db.commit()
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail='Refresh token revoked'
+            )
+        logger.warning(f"Refresh token for user {stored_token.user_id} has expired")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Refresh token expired'
+        )
+
+    user = await db.scalar(select(User).where(User.id == rotated.user_id))
+    refresh_token = await create_refresh_token(db, user.id, rotated.device)
+    token = await create_access_token(user.username, user.id, user.is_admin, user.is_guest, expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_MINUTES))
+    await db.commit()
+    logger.info(f"Token refreshed for user {user.username}")
+    return {
+        'access_token': token,
+        'refresh_token': refresh_token,
+        'token_type': 'bearer'
+    }
+
+
+@router.post('/logout', status_code=status.HTTP_204_NO_CONTENT)
+async def logout(db: Annotated[AsyncSession, Depends(get_db)], refresh_data: RefreshTokenRequest, all_devices: bool = False):
+    """Отзывает refresh-токены устройства, к которому относится токен, или всех устройств пользователя"""
+    stored_token = await db.scalar(
+        select(RefreshToken).where(RefreshToken.token_hash == hash_refresh_token(refresh_data.refresh_token))
+    )
+    if not stored_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Could not validate refresh token'
+        )
+    await revoke_refresh_tokens(db, stored_token.user_id, stored_token.device, all_devices)
+    await db.commit()
+    logger.info(f"Refresh tokens of user {stored_token.user_id} revoked ({'all devices' if all_devices else stored_token.device})")
+    return None
+
+
 @router.post('/')
 async def create_user(db: Annotated[AsyncSession, Depends(get_db)], create_user: CreateUser):
     try:
@@ -139,11 +239,12 @@ async def create_user(db: Annotated[AsyncSession, Depends(get_db)], create_user:
             logger.warning(f"User with username {create_user.username} already exists")
             raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Такой user уже существует")
         
-        await db.execute(insert(User).values(
+        user_id = await db.scalar(insert(User).values(
             username=create_user.username,
             password=bcrypt_context.hash(create_user.password),
             email=create_user.email
-        ))
+        ).returning(User.id))
+        await place_new_user(db, user_id)
         await db.commit()
         logger.info(f"User {create_user.username} created successfully")
         return {
@@ -0,0 +1,383 @@
+import codecs
+import csv
+from datetime import date
+from fastapi import APIRouter, HTTPException, Request, status
+from pydantic import ValidationError
+from sqlalchemy import Column, Date, Float, Integer, MetaData, String, Table, insert, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from app.backend.db import next_id
+from app.backend.catalog import exercise_catalog, muscle_group_catalog
+from app.backend.records import recompute_records
+from app.backend.changelog import UPSERT, log_tree
+from app.backend.archive import archived_on
+from app.config import settings
+from app.models import Training, MuscleGroup, Exercise, Set
+from app.routers.dependencies import db_session, current_user
+from app.schemas.create_schemas import CreateTraining
+from app.schemas.response_schemas import ImportReport, ImportRowError
+from logging_config import logger
+
+router = APIRouter(prefix='/import', tags=['import'])
+
+MAX_REPORTED_ERRORS = 100
+CSV_COLUMNS = ['date', 'group_name', 'exercise_name', 'weight', 'weight_per_exe', 'reps']
+
+# Staging-таблицы живут только внутри транзакции импорта (ON COMMIT DROP) и не попадают в миграции alembic.
+# *_key - ключи, выданные при разборе файла, new_id - ID строк, созданных при слиянии в основные таблицы
+staging_metadata = MetaData()
+
+
+def _staging_table(name: str, *columns: Column) -> Table:
+    return Table(name, staging_metadata, *columns, prefixes=['TEMPORARY'], postgresql_on_commit='DROP')
+
+
+staging_trainings = _staging_table(
+    'import_trainings',
+    Column('training_key', Integer, primary_key=True, autoincrement=False),
+    Column('date', Date, nullable=False),
+    Column('title', String, nullable=False),
+    Column('new_id', Integer)
+)
+staging_muscle_groups = _staging_table(
+    'import_muscle_groups',
+    Column('group_key', Integer, primary_key=True, autoincrement=False),
+    Column('training_key', Integer, nullable=False),
+    Column('group_name', String, nullable=False),
+    Column('new_id', Integer)
+)
+staging_exercises = _staging_table(
+    'import_exercises',
+    Column('exercise_key', Integer, primary_key=True, autoincrement=False),
+    Column('group_key', Integer, nullable=False),
+    Column('exercise_name', String, nullable=False),
+    Column('weight', Float),
+    Column('numbers_reps', Integer, nullable=False),
+    Column('new_id', Integer)
+)
+staging_sets = _staging_table(
+    'import_sets',
+    Column('exercise_key', Integer, nullable=False),
+    Column('weight_per_exe', Float),
+    Column('reps', Integer, nullable=False)
+)
+
+
+class _LineReader:
+    """Построчно читает тело запроса по мере поступления, не загружая файл в память целиком"""
+
+    def __init__(self, request: Request):
+        self.request = request
+        self.lines_read = 0
+
+    async def __aiter__(self):
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        tail = ''
+        async for chunk in self.request.stream():
+            tail += decoder.decode(chunk)
+            *lines, tail = tail.split('\n')
+            for line in lines:
+                self.lines_read += 1
+                yield self.lines_read, line.rstrip('\r')
+        tail += decoder.decode(b'', final=True)
+        if tail.strip():
+            self.lines_read += 1
+            yield self.lines_read, tail.rstrip('\r')
+
+
+class _StagingBuffer:
+    """Накапливает провалидированные тренировки в виде строк staging-таблиц и сбрасывает их через COPY"""
+
+    def __init__(self):
+        self.trainings = []
+        self.muscle_groups = []
+        self.exercises = []
+        self.sets = []
+        self.training_key = 0
+        self.group_key = 0
+        self.exercise_key = 0
+
+    def __len__(self) -> int:
+        return len(self.trainings)
+
+    def add(self, training: CreateTraining):
+        self.training_key += 1
+        group_names = []
+        for muscle_group_data in training.muscle_groups:
+            self.group_key += 1
+            group_name = muscle_group_data.group_name.title()
+            group_names.append(group_name)
+            self.muscle_groups.append((self.group_key, self.training_key, group_name))
+
+            for exercise_data in muscle_group_data.exercises:
+                self.exercise_key += 1
+                self.exercises.append((
+                    self.exercise_key,
+                    self.group_key,
+                    exercise_data.exercise_name,
+                    exercise_data.weight,
+                    len(exercise_data.sets)
+                ))
+                self.sets.extend(
+                    (self.exercise_key, set_data.weight_per_exe, set_data.reps) for set_data in exercise_data.sets
+                )
+
+        title = f"{training.date.strftime('%d.%m.%Y')}-" + ', '.join(group_names)
+        self.trainings.append((self.training_key, training.date, title))
+
+    async def copy_to(self, connection):
+        """connection - asyncpg-соединение текущей транзакции"""
+        for table, records, columns in (
+            (staging_trainings, self.trainings, ['training_key', 'date', 'title']),
+            (staging_muscle_groups, self.muscle_groups, ['group_key', 'training_key', 'group_name']),
+            (staging_exercises, self.exercises, ['exercise_key', 'group_key', 'exercise_name', 'weight', 'numbers_reps']),
+            (staging_sets, self.sets, ['exercise_key', 'weight_per_exe', 'reps']),
+        ):
+            if records:
+                await connection.copy_records_to_table(table.name, records=records, columns=columns)
+            records.clear()
+
+
+def _format_errors(e: ValidationError) -> list[str]:
+    return [f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in e.errors()]
+
+
+async def _parse_ndjson(lines: _LineReader):
+    """Каждая непустая строка - отдельная тренировка в формате CreateTraining"""
+    async for line_no, line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield line_no, CreateTraining.model_validate_json(line), None
+        except ValidationError as e:
+            yield line_no, None, _format_errors(e)
+
+
+async def _parse_csv(lines: _LineReader):
+    """
+    Каждая строка - один подход (колонки CSV_COLUMNS, первая строка - заголовок).
+    Подходы одной тренировки идут подряд, гр. мышц и упражнения группируются по названию
+    """
+    header = None
+    current = None
+    first_line = 0
+
+    def build():
+        return CreateTraining.model_validate({
+            'date': current['date'],
+            'muscle_groups': [
+                {
+                    'group_name': group_name,
+                    'exercises': [
+                        {'exercise_name': exercise_name, 'weight': exercise['weight'], 'sets': exercise['sets']}
+                        for exercise_name, exercise in exercises.items()
+                    ]
+                }
+                for group_name, exercises in current['groups'].items()
+            ]
+        })
+
+    async for line_no, line in lines:
+        if not line.strip():
+            continue
+        row = next(csv.reader([line]))
+        if header is None:
+            header = [column.strip() for column in row]
+            if sorted(header) != sorted(CSV_COLUMNS):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"CSV header must contain columns: {', '.join(CSV_COLUMNS)}"
+                )
+            continue
+        if len(row) != len(header):
+            yield line_no, None, [f"expected {len(header)} columns, got {len(row)}"]
+            continue
+
+        values = dict(zip(header, (value.strip() for value in row)))
+        if current is not None and values['date'] != current['date']:
+            try:
+                yield first_line, build(), None
+            except ValidationError as e:
+                yield first_line, None, _format_errors(e)
+            current = None
+
+        if current is None:
+            current = {'date': values['date'], 'groups': {}}
+            first_line = line_no
+        exercises = current['groups'].setdefault(values['group_name'], {})
+        exercise = exercises.setdefault(values['exercise_name'], {'weight': values['weight'], 'sets': []})
+        exercise['sets'].append({'weight_per_exe': values['weight_per_exe'], 'reps': values['reps']})
+
+    if current is not None:
+        try:
+            yield first_line, build(), None
+        except ValidationError as e:
+            yield first_line, None, _format_errors(e)
+
+
+async def _merge_staging(db, user_id: int) -> set[date]:
+    """
+    Переносит строки из staging-таблиц в основные. Тренировки на уже занятые даты (uq_user_training_date и архивные тренировки)
+    пропускаются вместе со всем поддеревом. Новые названия гр. мышц и упражнений добавляются в каталог пользователя.
+    Возвращает даты, для которых тренировки были созданы
+    """
+    inserted_trainings = (
+        pg_insert(Training)
+        .from_select(
+            ['date', 'title', 'user_id'],
+            select(staging_trainings.c.date, staging_trainings.c.title, literal(user_id, Integer))
+            .where(~archived_on(user_id, staging_trainings.c.date))
+        )
+        .on_conflict_do_nothing()
+        .returning(Training.id, Training.date)
+        .cte('inserted_trainings')
+    )
+    inserted_dates = await db.scalars(
+        update(staging_trainings)
+        .values(new_id=inserted_trainings.c.id)
+        .where(staging_trainings.c.date == inserted_trainings.c.date)
+        .returning(staging_trainings.c.date)
+    )
+    inserted_dates = set(inserted_dates.all())
+
+    await db.execute(
+        update(staging_muscle_groups)
+        .values(new_id=next_id(MuscleGroup.__tablename__))
+        .where(
+            staging_muscle_groups.c.training_key == staging_trainings.c.training_key,
+            staging_trainings.c.new_id.is_not(None)
+        )
+    )
+    await db.execute(muscle_group_catalog.insert_missing_stmt(select(staging_muscle_groups.c.group_name), user_id))
+    await db.execute(insert(MuscleGroup).from_select(
+        ['id', 'training_id', 'muscle_group_catalog_id', 'user_id'],
+        select(
+            staging_muscle_groups.c.new_id,
+            staging_trainings.c.new_id,
+            muscle_group_catalog.id_subquery(staging_muscle_groups.c.group_name, user_id),
+            literal(user_id, Integer)
+        )
+        .join(staging_trainings, staging_trainings.c.training_key == staging_muscle_groups.c.training_key)
+        .where(staging_muscle_groups.c.new_id.is_not(None))
+    ))
+
+    await db.execute(
+        update(staging_exercises)
+        .values(new_id=next_id(Exercise.__tablename__))
+        .where(
+            staging_exercises.c.group_key == staging_muscle_groups.c.group_key,
+            staging_muscle_groups.c.new_id.is_not(None)
+        )
+    )
+    await db.execute(exercise_catalog.insert_missing_stmt(select(staging_exercises.c.exercise_name), user_id))
+    await db.execute(insert(Exercise).from_select(
+        ['id', 'muscle_group_id', 'exercise_catalog_id', 'weight', 'numbers_reps', 'user_id'],
+        select(
+            staging_exercises.c.new_id,
+            staging_muscle_groups.c.new_id,
+            exercise_catalog.id_subquery(staging_exercises.c.exercise_name, user_id),
+            staging_exercises.c.weight,
+            staging_exercises.c.numbers_reps,
+            literal(user_id, Integer)
+        )
+        .join(staging_muscle_groups, staging_muscle_groups.c.group_key == staging_exercises.c.group_key)
+        .where(staging_exercises.c.new_id.is_not(None))
+    ))
+
+    await db.execute(insert(Set).from_select(
+        ['exercise_id', 'weight_per_exe', 'reps', 'user_id'],
+        select(
+            staging_exercises.c.new_id,
+            staging_sets.c.weight_per_exe,
+            staging_sets.c.reps,
+            literal(user_id, Integer)
+        )
+        .join(staging_exercises, staging_exercises.c.exercise_key == staging_sets.c.exercise_key)
+        .where(staging_exercises.c.new_id.is_not(None))
+    ))
+
+    imported_catalog_ids = await db.scalars(
+        select(Exercise.exercise_catalog_id)
+        .where(Exercise.user_id == user_id, Exercise.id.in_(select(staging_exercises.c.new_id)))
+        .distinct()
+    )
+    await recompute_records(db, user_id, imported_catalog_ids.all())
+
+    imported_training_ids = await db.scalars(
+        select(staging_trainings.c.new_id).where(staging_trainings.c.new_id.is_not(None))
+    )
+    await log_tree(db, user_id, UPSERT, 'training', imported_training_ids.all())
+    return inserted_dates
+
+
+@router.post('/trainings', response_model=ImportReport)
+async def import_trainings(db: db_session, get_user: current_user, request: Request):
+    """
+    Массовый импорт истории тренировок. Тело запроса - NDJSON (по одной CreateTraining на строку)
+    или CSV (Content-Type: text/csv, по одному подходу на строку с колонками CSV_COLUMNS).
+    Строки валидируются по мере чтения, валидные тренировки пачками загружаются через COPY в staging-таблицы
+    и одним набором запросов сливаются в основные. Тренировки на даты, где у пользователя уже есть тренировка,
+    пропускаются и попадают в список ошибок
+    """
+    user_id = get_user.get('id')
+    is_csv = 'csv' in request.headers.get('content-type', '')
+    logger.info(f"Пользователь {user_id} начал импорт тренировок ({'CSV' if is_csv else 'NDJSON'})")
+
+    lines = _LineReader(request)
+    parser = _parse_csv(lines) if is_csv else _parse_ndjson(lines)
+    errors = []
+    error_count = 0
+    lines_by_date = {}
+
+    def add_error(line_no: int, messages: list[str]):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append(ImportRowError(line=line_no, errors=messages))
+
+    try:
+        async with db.begin():
+            connection = await db.connection()
+            await connection.run_sync(staging_metadata.create_all, checkfirst=False)
+            raw_connection = (await connection.get_raw_connection()).driver_connection
+
+            buffer = _StagingBuffer()
+            async for line_no, training, row_errors in parser:
+                if row_errors:
+                    add_error(line_no, row_errors)
+                    continue
+                if training.date in lines_by_date:
+                    add_error(line_no, [f"date: duplicate of training on line {lines_by_date[training.date]}"])
+                    continue
+                lines_by_date[training.date] = line_no
+                buffer.add(training)
+
+                if len(buffer) >= settings.IMPORT_BATCH_SIZE:
+                    await buffer.copy_to(raw_connection)
+                    logger.info(f"Импорт пользователя {user_id}: прочитано строк {lines.lines_read}, "
+                                f"валидных тренировок {len(lines_by_date)}, ошибок {error_count}")
+            await buffer.copy_to(raw_connection)
+
+            inserted_dates = await _merge_staging(db, user_id)
+
+    except IntegrityError as e:
+        await db.rollback()
+        logger.error(f"Ошибка целостности базы данных при импорте: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to import trainings: {str(e)}"
+        )
+
+    skipped = sorted(line_no for training_date, line_no in lines_by_date.items() if training_date not in inserted_dates)
+    for line_no in skipped:
+        add_error(line_no, ['date: training for this date already exists'])
+
+    logger.info(f"Импорт пользователя {user_id} завершен: создано тренировок {len(inserted_dates)}, "
+                f"пропущено {len(skipped)}, ошибок {error_count}")
+    return ImportReport(
+        lines_read=lines.lines_read,
+        trainings_valid=len(lines_by_date),
+        trainings_imported=len(inserted_dates),
+        trainings_skipped=len(skipped),
+        errors=errors
+    )
@@ -1,9 +1,61 @@
 from typing import Annotated
-from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from fastapi import Depends, Header, HTTPException, Request, status
+from app.config import settings
 
 from app.routers.auth import get_current_user
-from app.backend.db_depends import get_db
+from app.backend.db_depends import get_db, get_read_db, read_only_session
+from app.backend.idempotency import IdempotencyKey, request_fingerprint
+from app.backend.shards import UserMoving, shard_map
 
-db_session = Annotated[AsyncSession, Depends(get_db)]
-current_user = Annotated[dict, Depends(get_current_user)]
\ No newline at end of file
+current_user = Annotated[dict, Depends(get_current_user)]
+
+
+async def user_session_maker(get_user: current_user) -> async_sessionmaker:
+    """Фабрика сессий шарда аутентифицированного пользователя"""
+    try:
+        return await shard_map.session_maker(get_user.get('id'))
+    except UserMoving:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='User data is being moved, retry later',
+            headers={'Retry-After': str(settings.LOAD_SHED_RETRY_AFTER)}
+        )
+
+
+async def get_user_db(session_maker: Annotated[async_sessionmaker, Depends(user_session_maker)]) -> AsyncSession: # type: ignore
+    async with session_maker() as session:
+        yield session
+
+
+async def get_user_read_db(
+    request: Request,
+    session_maker: Annotated[async_sessionmaker, Depends(user_session_maker)]
+) -> AsyncSession: # type: ignore
+    async with read_only_session(request, session_maker) as session:
+        yield session
+
+
+#Данные пользователя - на его шарде, справочник пользователей, токены и durable-задачи - в основной БД
+db_session = Annotated[AsyncSession, Depends(get_user_db)]
+db_read_session = Annotated[AsyncSession, Depends(get_user_read_db)]
+primary_db_session = Annotated[AsyncSession, Depends(get_db)]
+primary_db_read_session = Annotated[AsyncSession, Depends(get_read_db)]
+
+
+async def get_idempotency_key(
+    request: Request,
+    get_user: current_user,
+    idempotency_key: Annotated[str | None, Header(min_length=1, max_length=255)] = None
+) -> IdempotencyKey | None:
+    """Заголовок Idempotency-Key: ключ действует для пользователя и привязан к методу, пути, параметрам и телу запроса"""
+    if idempotency_key is None:
+        return None
+    return IdempotencyKey(
+        key=idempotency_key,
+        user_id=get_user.get('id'),
+        fingerprint=request_fingerprint(request.method, request.url.path, request.url.query, await request.body())
+    )
+
+
+idempotency_key = Annotated[IdempotencyKey | None, Depends(get_idempotency_key)]
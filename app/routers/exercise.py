@@ -1,11 +1,20 @@
-from app.models import Set, Exercise, MuscleGroup
+from typing import Literal
+from app.models import Set, Exercise, ExerciseCatalog, MuscleGroup, MuscleGroupCatalog, Training
 from app.schemas.create_schemas import CreateExercise
-from app.schemas.response_schemas import ExerciseResponse
-from fastapi import APIRouter, HTTPException, status
-from sqlalchemy import select, delete
+from app.schemas.response_schemas import ExerciseResponse, ExerciseSearchResponse
+from fastapi import APIRouter, HTTPException, Query, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import select, delete, func
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import selectinload
-from app.routers.dependencies import current_user, db_session
+from app.routers.dependencies import current_user, db_session, db_read_session, idempotency_key
+from app.backend.catalog import exercise_catalog
+from app.backend.records import record_sets
+from app.backend.tasks import enqueue_after_commit
+from app.backend.sparse import EXERCISE_TREE
+from app.backend.queries import EXERCISE_BY_ID, EXERCISE_WITH_SETS_BY_ID, MUSCLE_GROUP_BY_ID, tree_by_id
+from app.backend.changelog import DELETE, UPSERT, log_changes, log_tree
 from sqlalchemy.orm import selectinload
 from logging_config import logger
 
@@ -17,13 +26,16 @@ async def create_exercise(
     db: db_session,
     get_user: current_user,
     create_data: CreateExercise,
-    muscle_group_id: int
+    muscle_group_id: int,
+    idempotency: idempotency_key
 ):
     try:
         logger.info(f"Попытка создать упражнение для гр. мышц с ID {muscle_group_id} пользователем {get_user.get('id')}")
 
         async with db.begin():
-            muscle_group = await db.scalar(select(MuscleGroup).where(MuscleGroup.id == muscle_group_id))
+            if idempotency and (stored := await idempotency.claim(db)):
+                return stored
+            muscle_group = await db.scalar(MUSCLE_GROUP_BY_ID, {'id': muscle_group_id})
             if not muscle_group:
                 logger.error(f"Мышечная гр. с ID {muscle_group_id} не найдена")
                 raise HTTPException(
@@ -36,7 +48,7 @@ async def create_exercise(
             if get_user.get('is_admin') or get_user.get('id') == user_id:
                 new_exercise = Exercise(
                     muscle_group_id=muscle_group_id,
-                    exercise_name=create_data.exercise_name,
+                    exercise_catalog_id=await exercise_catalog.get_id(db, create_data.exercise_name, user_id),
                     weight=create_data.weight,
                     numbers_reps=1,
                     user_id=user_id
@@ -56,12 +68,20 @@ async def create_exercise(
                     cnt += 1
 
                 new_exercise.numbers_reps = cnt
+                await record_sets(
+                    db, user_id,
+                    [(new_exercise.exercise_catalog_id, set_data.weight_per_exe, set_data.reps) for set_data in create_data.sets]
+                )
+                await log_tree(db, user_id, UPSERT, 'exercise', [new_exercise.id])
 
                 logger.success(f"Упражнение успешно создано для гр. мышц с ID {muscle_group_id}")
-                return {
+                response = {
                     'status': status.HTTP_201_CREATED,
                     'transaction': 'successful'
                 }
+                if idempotency:
+                    await idempotency.save(db, status.HTTP_200_OK, response)
+                return response
             else:
                 logger.warning(f"Пользователь {get_user.get('id')} не имеет необходимых прав для выполнения метода")
                 raise HTTPException(
@@ -78,20 +98,79 @@ async def create_exercise(
         )
 
 
+@router.get('/search', response_model=ExerciseSearchResponse)
+async def search_exercises(
+    db: db_read_session,
+    get_user: current_user,
+    q: str = Query(..., min_length=1, max_length=50),
+    mode: Literal['prefix', 'fuzzy'] = 'prefix',
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+):
+    """
+    Поиск упражнений текущего пользователя по названию вместе с датой тренировки.
+    prefix - название начинается с q (без учета регистра), самые свежие тренировки первыми;
+    fuzzy - нечеткое совпадение по словам (pg_trgm word_similarity), самые похожие первыми.
+    Совпадения ищутся по каталогу названий (GIN-индекс ix_exercise_catalog_exercise_name_trgm),
+    упражнения пользователя по найденным записям - по индексу ix_exercises_user_id_exercise_catalog_id
+    """
+    user_id = get_user.get('id')
+    logger.info(f"Пользователь {user_id} ищет упражнения по запросу '{q}' ({mode})")
+    query = (
+        select(
+            Exercise.id,
+            ExerciseCatalog.exercise_name,
+            Exercise.weight,
+            Exercise.numbers_reps,
+            MuscleGroupCatalog.group_name,
+            Training.id.label('training_id'),
+            Training.date.label('training_date')
+        )
+        .select_from(Exercise)
+        .join(ExerciseCatalog, ExerciseCatalog.id == Exercise.exercise_catalog_id)
+        .join(MuscleGroup, MuscleGroup.id == Exercise.muscle_group_id)
+        .join(MuscleGroupCatalog, MuscleGroupCatalog.id == MuscleGroup.muscle_group_catalog_id)
+        .join(Training, Training.id == MuscleGroup.training_id)
+        .where(Exercise.user_id == user_id)
+    )
+    if mode == 'prefix':
+        query = (
+            query
+            .where(ExerciseCatalog.exercise_name.istartswith(q, autoescape=True))
+            .order_by(Training.date.desc(), Exercise.id)
+        )
+    else:
+        query = (
+            query
+            .where(ExerciseCatalog.exercise_name.op('%>')(q))
+            .order_by(func.word_similarity(q, ExerciseCatalog.exercise_name).desc(), Training.date.desc(), Exercise.id)
+        )
+
+    result = await db.execute(query.limit(limit).offset(offset))
+    return {
+        'limit': limit,
+        'offset': offset,
+        'items': result.mappings().all()
+    }
+
+
 @router.get('/{exercise_id}', response_model=ExerciseResponse)
 async def get_exercise(
-    db: db_session,
+    db: db_read_session,
     exercise_id: int,
-    get_user: current_user
+    get_user: current_user,
+    fields: str | None = None,
+    depth: int | None = Query(None, ge=0, le=EXERCISE_TREE.max_depth)
 ):
+    """
+    fields - поля ответа через запятую, вложенные через точку (например exercise_name,sets.reps);
+    depth - 0, чтобы не загружать подходы
+    """
     try:
         logger.info(f"Попытка получения упражнения с ID {exercise_id} для пользователя {get_user.get('id')}")
 
-        exercise = await db.scalar(
-            select(Exercise)
-            .options(selectinload(Exercise.sets))
-            .where(Exercise.id == exercise_id)
-        )
+        tree, query = tree_by_id('exercise', fields, depth)
+        exercise = await db.scalar(query, {'id': exercise_id})
         if not exercise:
             logger.warning(f"Упражнение с ID {exercise_id} не найдено")
             raise HTTPException(
@@ -99,9 +178,9 @@ async def get_exercise(
                 detail="Exercise not found"
             )
         
-        if get_user.get('is_admin') or get_user.get('user_id') == exercise.user_id:
+        if get_user.get('is_admin') or get_user.get('id') == exercise.user_id:
             logger.info(f"Пользователь с ID {get_user.get('id')} успешно получил упражнение с ID {exercise_id}")
-            return exercise
+            return JSONResponse(jsonable_encoder(tree.serialize(exercise)))
         else:
             logger.warning(f"Пользователь {get_user.get('id')} не имеет необходимых прав для получения упражнения с ID {exercise_id}")
             raise HTTPException(
@@ -134,7 +213,7 @@ async def update_exercise(db: db_session, get_user: current_user, exercise_id: i
                     detail='New weight must be ge 0'
                 )
             
-            exercise = await db.scalar(select(Exercise).options(selectinload(Exercise.sets)).where(Exercise.id == exercise_id))
+            exercise = await db.scalar(EXERCISE_WITH_SETS_BY_ID, {'id': exercise_id})
 
             if not exercise:
                 logger.warning(f"User {get_user.get('id')} attempted to update non-existent exercise with ID {exercise_id}")
@@ -150,6 +229,7 @@ async def update_exercise(db: db_session, get_user: current_user, exercise_id: i
                 exercise.weight = new_weight
                 db.add(exercise)
                 await db.flush()
+                await log_changes(db, exercise.user_id, [('exercise', exercise.id, UPSERT)])
             else:
                 logger.warning(f"User {get_user.get('id')} attempted unauthorized access to exercise {exercise_id}")
                 raise HTTPException(
@@ -179,7 +259,7 @@ async def delete_exercise(db: db_session, get_user: current_user, exercise_id: i
     try:
         async with db.begin():
             logger.info(f"Пользователь {get_user.get('id')} птыается удалить упражнение {exercise_id}")
-            exercise = await db.scalar(select(Exercise).where(Exercise.id == exercise_id))
+            exercise = await db.scalar(EXERCISE_BY_ID, {'id': exercise_id})
             if not exercise:
                 logger.warning(f"Упражнения с ID {exercise_id} нет")
                 raise HTTPException(
@@ -198,7 +278,9 @@ async def delete_exercise(db: db_session, get_user: current_user, exercise_id: i
                         status_code=status.HTTP_409_CONFLICT,
                         detail='Can`t delete last exercise in muscle group'
                     )
+                await log_tree(db, exercise.user_id, DELETE, 'exercise', [exercise_id])
                 await db.execute(delete(Exercise).where(Exercise.id == exercise_id))
+                enqueue_after_commit(db, 'recompute_records', user_id=exercise.user_id, catalog_ids=[exercise.exercise_catalog_id])
                 logger.info(f"Упражнение с ID {exercise_id} успешно удалено")
                 return None
             
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+from app.backend.admission import HIGH, load_monitor
+
+router = APIRouter(prefix='/health', tags=['health'])
+
+
+@router.get('/live')
+async def liveness():
+    """Процесс жив: event loop отвечает и фоновые замеры нагрузки работают. БД не проверяется - ее недоступность не лечится рестартом"""
+    if not load_monitor.running:
+        return JSONResponse({'status': 'down', 'detail': 'Load monitor stopped'}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return {'status': 'ok', 'loop_lag_ms': load_monitor.metrics()['loop_lag_ms']}
+
+
+@router.get('/ready')
+async def readiness():
+    """
+    Готовность принимать трафик: БД доступна и процесс не в критической перегрузке.
+    При обычной перегрузке воркер остается в балансировке и сам отбрасывает низкоприоритетные запросы
+    """
+    metrics = load_monitor.metrics()
+    if not metrics['db_available'] or load_monitor.shed_below >= HIGH:
+        return JSONResponse({'status': 'unavailable', **metrics}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return {'status': 'ok', **metrics}
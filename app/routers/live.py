@@ -0,0 +1,177 @@
+import anyio
+from typing import Annotated, Union
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
+from pydantic import Field, TypeAdapter, ValidationError
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from app.backend.live import LiveConnection, LiveLimitError, live_hub
+from app.backend.queries import EXERCISE_BY_ID
+from app.backend.shards import UserMoving, session_makers, shard_map
+from app.config import settings
+from app.models import Exercise, MuscleGroup, Training
+from app.routers.auth import get_current_user
+from app.routers.dependencies import current_user
+from app.routers.set import add_set
+from app.schemas.create_schemas import LiveLogSet, LiveWatchTraining
+from app.schemas.response_schemas import TrainingResponse
+from logging_config import logger
+
+router = APIRouter(prefix='/live', tags=['live'])
+
+live_message = TypeAdapter(Annotated[Union[LiveWatchTraining, LiveLogSet], Field(discriminator='action')])
+
+
+def _bearer_token(websocket: WebSocket, token: str | None) -> str | None:
+    """Браузер не может передать заголовок при открытии WebSocket, поэтому токен принимается и в параметре token"""
+    if token:
+        return token
+    scheme, _, credentials = websocket.headers.get('authorization', '').partition(' ')
+    return credentials if scheme.lower() == 'bearer' and credentials else None
+
+
+def _allowed(user: dict, owner_id: int) -> bool:
+    return bool(user.get('is_admin')) or user.get('id') == owner_id
+
+
+async def _watch(connection: LiveConnection, user: dict, message: LiveWatchTraining) -> dict:
+    async with (await shard_map.session_maker(user.get('id')))() as db:
+        training = await db.scalar(
+            select(Training)
+            .options(
+                selectinload(Training.muscle_groups).options(
+                    selectinload(MuscleGroup.exercises).options(selectinload(Exercise.sets))
+                )
+            )
+            .where(Training.id == message.training_id)
+        )
+        if not training:
+            return {'type': 'error', 'detail': 'Training not found'}
+        if not _allowed(user, training.user_id):
+            return {'type': 'error', 'detail': 'You are not authorized to use this method'}
+
+        connection.training_id = training.id
+        return {
+            'type': 'snapshot',
+            'training_id': training.id,
+            'training': TrainingResponse.model_validate(training).model_dump(mode='json')
+        }
+
+
+async def _log_set(user: dict, message: LiveLogSet) -> dict:
+    try:
+        async with (await shard_map.session_maker(user.get('id')))() as db:
+            async with db.begin():
+                exercise = await db.scalar(EXERCISE_BY_ID, {'id': message.exercise_id})
+                if not exercise:
+                    return {'type': 'error', 'detail': 'Exercise not found'}
+                if not _allowed(user, exercise.user_id):
+                    return {'type': 'error', 'detail': 'You are not authorized to use this method'}
+                new_set = await add_set(db, exercise, message)
+            logger.info(f"Пользователь {user.get('id')} записал set {new_set.id} через live-соединение")
+            return {'type': 'ack', 'action': message.action, 'set_id': new_set.id}
+    except IntegrityError as e:
+        logger.error(f"Ошибка целостности базы данных: {str(e)}")
+        return {'type': 'error', 'detail': 'Failed to create set'}
+
+
+async def _read(websocket: WebSocket, connection: LiveConnection, user: dict):
+    """
+    Читает команды клиента. Сессия БД открывается на время одной команды, а не соединения,
+    иначе каждое открытое соединение держало бы подключение из пула
+    """
+    while True:
+        data = await websocket.receive_text()
+        if len(data) > settings.LIVE_MAX_MESSAGE_BYTES:
+            reply = {'type': 'error', 'detail': 'Message too large'}
+        else:
+            try:
+                message = live_message.validate_json(data)
+            except ValidationError as e:
+                reply = {'type': 'error', 'detail': e.errors(include_url=False, include_context=False)}
+            else:
+                try:
+                    if isinstance(message, LiveWatchTraining):
+                        reply = await _watch(connection, user, message)
+                    else:
+                        reply = await _log_set(user, message)
+                except UserMoving:
+                    reply = {'type': 'error', 'detail': 'User data is being moved, retry later'}
+
+        #Ответ идет через ту же очередь, что и события: писать в сокет может только _write
+        live_hub.reply(connection, reply)
+
+
+async def _write(websocket: WebSocket, connection: LiveConnection):
+    while True:
+        await websocket.send_text(await connection.next_message())
+
+
+@router.websocket('/ws')
+async def live_session(websocket: WebSocket, token: str | None = None):
+    """
+    Живая сессия тренировки. Аутентификация - тот же JWT, что и для REST (параметр token или заголовок Authorization).
+    Команды клиента: {"action": "watch", "training_id": ...} - получить снимок тренировки и подписаться на ее события;
+    {"action": "log_set", "exercise_id": ..., "weight_per_exe": ..., "reps": ...} - записать подход.
+    События set_created / set_updated / set_deleted приходят после коммита, в том числе для изменений через REST
+    """
+    token = _bearer_token(websocket, token)
+    try:
+        if not token:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate user')
+        user = await get_current_user(token)
+    except HTTPException as e:
+        logger.warning(f"Live-соединение отклонено: {e.detail}")
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    try:
+        connection = live_hub.connect(user.get('id'))
+    except LiveLimitError as e:
+        logger.warning(str(e))
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+
+    await websocket.accept()
+    logger.info(f"Пользователь {user.get('id')} открыл live-соединение")
+    try:
+        async with anyio.create_task_group() as task_group:
+            async def run_until_done(job):
+                #Завершение любой из задач (отключение клиента, ошибка, переполнение буфера) закрывает сессию
+                try:
+                    await job
+                except WebSocketDisconnect:
+                    pass
+                finally:
+                    task_group.cancel_scope.cancel()
+
+            task_group.start_soon(run_until_done, _read(websocket, connection, user))
+            task_group.start_soon(run_until_done, _write(websocket, connection))
+            task_group.start_soon(run_until_done, connection.overflowed.wait())
+
+        if connection.overflowed.is_set():
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+    except Exception as e:
+        logger.error(f"Ошибка live-соединения пользователя {user.get('id')}: {str(e)}")
+    finally:
+        live_hub.disconnect(connection)
+        logger.info(f"Live-соединение пользователя {user.get('id')} закрыто")
+
+
+@router.get('/metrics')
+async def get_live_metrics(get_user: current_user):
+    """
+    Число live-соединений и объем неотправленных событий на этом воркере.
+    db_connections - подключения, выданные пулами всех шардов этого воркера: открытые live-соединения
+    не должны их держать, сессия БД берется только на время команды
+    """
+    if get_user.get('is_admin'):
+        return {
+            **live_hub.metrics(),
+            'db_connections': sum(session_maker.kw['bind'].pool.checkedout() for session_maker in session_makers.values())
+        }
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='You don`t have admin permission'
+        )
@@ -1,11 +1,19 @@
-from fastapi import HTTPException, APIRouter, status
+from fastapi import HTTPException, APIRouter, Query, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from app.models.all_models import MuscleGroup, Training, Exercise, Set
 from app.schemas.create_schemas import CreateMuscleGroup
 from app.schemas.response_schemas import MuscleGroupResponse, MuscleGroupResponsePatch
 from sqlalchemy import select, delete
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import selectinload
-from app.routers.dependencies import db_session, current_user
+from app.routers.dependencies import db_session, db_read_session, current_user
+from app.backend.catalog import exercise_catalog, muscle_group_catalog
+from app.backend.coalesce import single_flight
+from app.backend.records import record_sets
+from app.backend.tasks import enqueue_after_commit
+from app.backend.sparse import MUSCLE_GROUP_TREE
+from app.backend.queries import MUSCLE_GROUP_BY_ID, TRAINING_BY_ID, tree_by_id
+from app.backend.changelog import DELETE, UPSERT, log_changes, log_tree
 from sqlalchemy.exc import IntegrityError
 from logging_config import logger
 
@@ -22,7 +30,7 @@ async def create_muscle_group(
     try:
         async with db.begin():
             logger.info(f"Пользователь {get_user.get('id')} пытается создать новую мыш. группу")
-            training = await db.scalar(select(Training).where(Training.id == training_id))
+            training = await db.scalar(TRAINING_BY_ID, {'id': training_id})
             if not training:
                 logger.warning(f"Пользователь {get_user.get('id')} пытается создать новую группу мышц в несуществующей тренировке")
                 raise HTTPException(
@@ -33,22 +41,24 @@ async def create_muscle_group(
             user_id = training.user_id
 
             if get_user.get('is_admin') or get_user.get('id') == user_id:
+                group_name = create_data.group_name.title()
                 new_muscle_group = MuscleGroup(
                     training_id=training_id,
-                    group_name=create_data.group_name.title(),
+                    muscle_group_catalog_id=await muscle_group_catalog.get_id(db, group_name, user_id),
                     user_id=user_id
                 )
                 db.add(new_muscle_group)
                 await db.flush()
 
-                new_title = training.title + f", {new_muscle_group.group_name}"
+                new_title = training.title + f", {group_name}"
                 training.title = new_title
                 db.add(training)
 
+                new_sets = []
                 for exercise_data in create_data.exercises:
                     new_exercise = Exercise(
                         muscle_group_id=new_muscle_group.id,
-                        exercise_name=exercise_data.exercise_name,
+                        exercise_catalog_id=await exercise_catalog.get_id(db, exercise_data.exercise_name, user_id),
                         weight=exercise_data.weight,
                         numbers_reps=1,
                         user_id=user_id
@@ -66,16 +76,21 @@ async def create_muscle_group(
                             user_id=user_id
                         )
                         db.add(new_set)
+                        new_sets.append((new_exercise.exercise_catalog_id, set_data.weight_per_exe, set_data.reps))
                         cnt += 1
                     new_exercise.numbers_reps = cnt
 
+                await record_sets(db, user_id, new_sets)
+                await log_tree(db, user_id, UPSERT, 'muscle_group', [new_muscle_group.id])
+                await log_changes(db, user_id, [('training', training.id, UPSERT)])
+
             else:
                 logger.warning(f"Пользователь {get_user.get('id')} не имеет необходимых прав для выполнения этого метода")
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail='You are not authorized to use this method'
                 )
-            logger.info(f"Пользователь {get_user.get('id')} успешно создал мышечную группу '{new_muscle_group.group_name}' с ID {new_muscle_group.id}")
+            logger.info(f"Пользователь {get_user.get('id')} успешно создал мышечную группу '{group_name}' с ID {new_muscle_group.id}")
             return {
             'status': status.HTTP_201_CREATED,
             'transaction': 'successful'
@@ -94,26 +109,17 @@ async def create_muscle_group(
             detail="Internal Server Error"
         )
 
-@router.get('/{muscle_group_id}', response_model=MuscleGroupResponse)
-async def get_muscle_group(db: db_session, muscle_group_id: int, get_user: current_user):
-    logger.info(f"Пользователь {get_user.get('id')} пытается получить гр. мышц с ID {muscle_group_id}")
-    muscle_group = await db.scalar(
-        select(MuscleGroup)
-        .options(
-            selectinload(MuscleGroup.exercises).options(
-                selectinload(Exercise.sets)
-            )
-        )
-        .where(MuscleGroup.id == muscle_group_id)
-    )
+async def _muscle_group_body(db, muscle_group_id: int, get_user: dict, fields: str | None, depth: int | None) -> bytes:
+    tree, query = tree_by_id('muscle_group', fields, depth)
+    muscle_group = await db.scalar(query, {'id': muscle_group_id})
 
     if not muscle_group:
         logger.warning(f"Гр. мышц {muscle_group_id} нет")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Muslce gtoup not found")
 
-    if get_user.get('is_admin') or get_user.get('user_id') == muscle_group.user_id:
+    if get_user.get('is_admin') or get_user.get('id') == muscle_group.user_id:
         logger.info(f"Пользователь {get_user.get('id')} успешно получил гр. мышц {muscle_group_id}")
-        return muscle_group
+        return JSONResponse(jsonable_encoder(tree.serialize(muscle_group))).body
     else:
         logger.warning(f"Пользователь {get_user.get('id')} не имеет необходимых правв для получения гр. мышц {muscle_group_id}")
         raise HTTPException(
@@ -121,6 +127,26 @@ async def get_muscle_group(db: db_session, muscle_group_id: int, get_user: curre
             detail='You are not authorized to use this method'
         )
 
+
+@router.get('/{muscle_group_id}', response_model=MuscleGroupResponse)
+async def get_muscle_group(
+    db: db_read_session,
+    muscle_group_id: int,
+    get_user: current_user,
+    fields: str | None = None,
+    depth: int | None = Query(None, ge=0, le=MUSCLE_GROUP_TREE.max_depth)
+):
+    """
+    fields - поля ответа через запятую, вложенные через точку (например group_name,exercises.exercise_name);
+    depth - сколько уровней вложенности загружать (0 - только гр. мышц).
+    Одновременные одинаковые запросы пользователя выполняют одну загрузку
+    """
+    logger.info(f"Пользователь {get_user.get('id')} пытается получить гр. мышц с ID {muscle_group_id}")
+    return await single_flight.json(
+        ('get_muscle_group', muscle_group_id, fields, depth, get_user.get('id'), get_user.get('is_admin')),
+        lambda: _muscle_group_body(db, muscle_group_id, get_user, fields, depth)
+    )
+
 @router.delete('/{muscle_group_id}', status_code=status.HTTP_204_NO_CONTENT)
 async def delete_muscle_group(
     db: db_session,
@@ -130,7 +156,7 @@ async def delete_muscle_group(
     try:
         async with db.begin():
             logger.info(f"Пользователь {get_user.get('id')} пытается удалить гр. мышц {muscle_group_id}")
-            muscle_group = await db.scalar(select(MuscleGroup).where(MuscleGroup.id == muscle_group_id))
+            muscle_group = await db.scalar(MUSCLE_GROUP_BY_ID, {'id': muscle_group_id})
             if not muscle_group:
                 logger.warning(f"Гр. мышц с ID {muscle_group_id} нет")
                 raise HTTPException(
@@ -138,7 +164,7 @@ async def delete_muscle_group(
                     detail="Muscle group not found"
                 )
             if get_user.get('is_admin') or get_user.get('id') == muscle_group.user_id:
-                training = await db.scalar(select(Training).where(Training.id == muscle_group.training_id))
+                training = await db.scalar(TRAINING_BY_ID, {'id': muscle_group.training_id})
                 group_names = [name.strip() for name in training.title.split("-")[1].split(",") if name.strip()]
                 if len(group_names) == 1:
                     logger.info(f"Пользователь {get_user.get('id')} пытается удалить единственную гр. мышц в тренировке {training.id}")
@@ -155,7 +181,14 @@ async def delete_muscle_group(
 
                 db.add(training)
 
+                catalog_ids = await db.scalars(
+                    select(Exercise.exercise_catalog_id).where(Exercise.muscle_group_id == muscle_group_id)
+                )
+                catalog_ids = catalog_ids.all()
+                await log_tree(db, muscle_group.user_id, DELETE, 'muscle_group', [muscle_group_id])
+                await log_changes(db, muscle_group.user_id, [('training', training.id, UPSERT)])
                 await db.execute(delete(MuscleGroup).where(MuscleGroup.id == muscle_group_id))
+                enqueue_after_commit(db, 'recompute_records', user_id=muscle_group.user_id, catalog_ids=catalog_ids)
                 logger.info(f"Гр. мышц {muscle_group_id} успешно удалена")
                 return None
             
@@ -180,7 +213,7 @@ async def rename_muscle_group(db: db_session, get_user: current_user, muscle_gro
     try:
         async with db.begin():
             logger.info(f"Пользователь {get_user.get('if')} пытается изменить название для гр. мышц {muscle_group_id}")
-            updated_muscle_group = await db.scalar(select(MuscleGroup).where(MuscleGroup.id == muscle_group_id))
+            updated_muscle_group = await db.scalar(MUSCLE_GROUP_BY_ID, {'id': muscle_group_id})
             if not updated_muscle_group:
                 logger.warning(f"Гр. мышц с ID {muscle_group_id} нет")
                 raise HTTPException(
@@ -197,7 +230,7 @@ async def rename_muscle_group(db: db_session, get_user: current_user, muscle_gro
                         detail='Same names'
                     )
                 
-                updated_training = await db.scalar(select(Training).where(Training.id == updated_muscle_group.training_id))
+                updated_training = await db.scalar(TRAINING_BY_ID, {'id': updated_muscle_group.training_id})
 
                 group_names = [name.strip(',') for name in updated_training.title.split('-')[1].split() if name.strip()]
                 group_names = [name for name in group_names if name != old_name]
@@ -205,10 +238,15 @@ async def rename_muscle_group(db: db_session, get_user: current_user, muscle_gro
                 
                 new_title = f"{updated_training.date.strftime('%d.%m.%Y')}-" + ", ".join(group_names)
                 updated_training.title = new_title
-                updated_muscle_group.group_name = new_name.strip().title()
+                updated_muscle_group.muscle_group_catalog_id = await muscle_group_catalog.get_id(
+                    db, new_name.strip().title(), updated_muscle_group.user_id
+                )
                 db.add(updated_training)
                 logger.info(f"Название тренировки изменено с учетом нового названия для гр. мышц {muscle_group_id}")
                 db.add(updated_muscle_group)
+                await log_changes(db, updated_muscle_group.user_id, [
+                    ('training', updated_training.id, UPSERT), ('muscle_group', updated_muscle_group.id, UPSERT)
+                ])
             else:
                 logger.warning(f"Пользователь {get_user.get('id')} не имеет необходимых прав для данного метода")
                 raise HTTPException(
@@ -216,7 +254,10 @@ async def rename_muscle_group(db: db_session, get_user: current_user, muscle_gro
                     detail='You are not authorized to use this method'
                 )
             logger.info(f"Пользователь {get_user.get('id')} успешно изменил название для гр. мышц")
-            return updated_muscle_group
+            return {
+                'id': updated_muscle_group.id,
+                'group_name': new_name.strip().title()
+            }
         
     except IntegrityError as e:
         await db.rollback()
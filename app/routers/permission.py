@@ -1,16 +1,78 @@
-from fastapi import APIRouter, status, HTTPException
-from sqlalchemy import select, update, delete
-from app.models.all_models import User
+from fastapi import APIRouter, Query, status, HTTPException
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import func, select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.backend.coalesce import single_flight
+from app.backend.db import async_session_maker
+from app.backend.memory import memory_report, memory_tracer
+from app.backend.profiler import collapsed, profiler
+from app.backend.shards import scatter, session_makers, shard_map
+from app.backend.tasks import enqueue_durable, load_progress, save_progress, task, task_queue
+from app.models.all_models import User, Training, MuscleGroup, Exercise, Set, ChangeVersion, BackgroundJob
 from app.config import settings
-from app.routers.dependencies import current_user, db_session
+from app.routers.dependencies import current_user, primary_db_session, primary_db_read_session
 from logging_config import logger
 
 router = APIRouter(prefix='/permission', tags=['permission'])
 full_rights = settings.full_rights_users
 
+DELETED_MODELS = (Set, Exercise, MuscleGroup, Training)
+
+
+@task('delete_user_subtree')
+async def _delete_user_subtree(user_id: int):
+    """
+    Удаляет все данные пользователя снизу вверх (подходы -> упражнения -> гр. мышц -> тренировки), затем самого пользователя.
+    Каждая пачка из USER_DELETE_BATCH_SIZE строк удаляется в отдельной короткой транзакции,
+    поэтому блокировки не держатся на всё время удаления, а ORM-каскад не загружает строки в память.
+    Выполняется durable-задачей: число удаленных строк сохраняется в ее строке после каждой пачки,
+    после рестарта воркера удаление продолжается с оставшихся строк
+    """
+    progress = await load_progress() or {'deleted': {model.__tablename__: 0 for model in DELETED_MODELS}}
+    batch_size = settings.USER_DELETE_BATCH_SIZE
+    user_session_maker = await shard_map.session_maker(user_id)
+    for model in DELETED_MODELS:
+        while True:
+            batch = select(model.id).where(model.user_id == user_id).limit(batch_size).scalar_subquery()
+            async with user_session_maker() as session:
+                async with session.begin():
+                    result = await session.execute(
+                        delete(model)
+                        .where(model.user_id == user_id, model.id.in_(batch))
+                        .execution_options(synchronize_session=False)
+                    )
+            if result.rowcount:
+                progress['deleted'][model.__tablename__] += result.rowcount
+                await save_progress(progress)
+            if result.rowcount < batch_size:
+                break
+        logger.info(f"Удаление пользователя {user_id}: из {model.__tablename__} удалено {progress['deleted'][model.__tablename__]} строк")
+
+    #Копия строки пользователя на его шарде удаляется вместе с оставшимися данными, затем запись справочника
+    if user_session_maker is not async_session_maker:
+        async with user_session_maker() as session:
+            async with session.begin():
+                await session.execute(delete(User).where(User.id == user_id))
+    async with async_session_maker() as session:
+        async with session.begin():
+            await session.execute(delete(User).where(User.id == user_id))
+    shard_map.invalidate(user_id)
+    logger.info(f"Пользователь {user_id} и все его данные удалены")
+
+
+def _user_job(name: str, user_id: int):
+    """Последняя durable-задача name для пользователя в background_jobs"""
+    return (
+        select(BackgroundJob)
+        .where(BackgroundJob.name == name, BackgroundJob.payload['user_id'].as_integer() == user_id)
+        .order_by(BackgroundJob.id.desc())
+        .limit(1)
+    )
+
+
 @router.patch('/')
 async def admin_permission(
-    db: db_session,
+    db: primary_db_session,
     get_user: current_user,
     user_id: int
 ):
@@ -49,9 +111,9 @@ async def admin_permission(
             detail='You don`t have admin permission'
         )
     
-@router.delete('/delete', status_code=status.HTTP_204_NO_CONTENT)
+@router.delete('/delete', status_code=status.HTTP_202_ACCEPTED)
 async def delete_user(
-    db: db_session,
+    db: primary_db_session,
     get_user: current_user,
     user_id: int
 ):
@@ -68,17 +130,53 @@ async def delete_user(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail='You can`t delete admin user'
             )
-        await db.execute(delete(User).where(User.id == user_id))
+        job = await db.scalar(_user_job('delete_user_subtree', user_id))
+        if job and job.status in ('pending', 'running'):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail='User deletion is already in progress'
+            )
+        enqueue_durable(db, 'delete_user_subtree', user_id=user_id)
         await db.commit()
-        return None
+        logger.info(f"Запущено удаление пользователя {user_id}")
+        return {
+            'status': status.HTTP_202_ACCEPTED,
+            'detail': 'User deletion started',
+            'progress_url': f"{router.prefix}/delete/{user_id}"
+        }
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='You don`t have admin permission'
+        )
+
+
+@router.get('/delete/{user_id}')
+async def get_delete_user_progress(db: primary_db_read_session, get_user: current_user, user_id: int):
+    """Прогресс удаления из строки durable-задачи: отвечает любой воркер, а не только выполняющий удаление"""
+    if get_user.get('is_admin'):
+        job = await db.scalar(_user_job('delete_user_subtree', user_id))
+        if not job:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail='No deletion for this user'
+            )
+        return {
+            'user_id': user_id,
+            'status': job.status,
+            'deleted': (job.progress or {}).get('deleted', {model.__tablename__: 0 for model in DELETED_MODELS}),
+            'attempts': job.attempts,
+            'error': job.last_error
+        }
     else:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail='You don`t have admin permission'
         )
 
+
 @router.get('/get_id')
-async def get_user_id(db: db_session, get_user: current_user, username: str):
+async def get_user_id(db: primary_db_read_session, get_user: current_user, username: str):
     if get_user.get("is_admin"):
         user_id = await db.scalar(select(User.id).where(User.username == username))
         if not user_id:
@@ -95,4 +193,198 @@ async def get_user_id(db: db_session, get_user: current_user, username: str):
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail='You don`t have admin permission'
         )
-    
\ No newline at end of file
+    
+
+
+@router.post('/profile', response_class=PlainTextResponse)
+async def profile_worker(
+    get_user: current_user,
+    seconds: float = Query(10, gt=0, le=settings.PROFILE_MAX_SECONDS),
+    interval_ms: int = Query(10, ge=1, le=1000),
+    mode: str = Query('cpu', pattern='^(cpu|wall)$')
+):
+    """
+    Профилирует event loop этого воркера seconds секунд и возвращает стеки в формате collapsed stacks
+    для flamegraph. cpu - только выполняющийся код, wall - еще и где ждут приостановленные корутины
+    """
+    if get_user.get('is_admin') and get_user.get('username') in full_rights:
+        logger.info(f"Пользователь {get_user.get('username')} запустил профилирование воркера на {seconds} с ({mode})")
+        result = await profiler.profile(seconds, interval_ms / 1000, wall=mode == 'wall')
+        if result is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail='Profiling is already running'
+            )
+        stacks, samples = result
+        return PlainTextResponse(collapsed(stacks), headers={'X-Profile-Samples': str(samples)})
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='You don`t have admin permission'
+        )
+
+
+@router.get('/memory')
+async def memory_diagnostics(
+    get_user: current_user,
+    limit: int = Query(20, ge=1, le=200),
+    reset: bool = False,
+    collect: bool = False
+):
+    """
+    Память воркера: RSS, статистика поколений gc, живые сессии и ORM-объекты по моделям,
+    при включенной трассировке - места аллокаций с наибольшим приростом после базового снимка
+    """
+    if get_user.get('is_admin') and get_user.get('username') in full_rights:
+        return memory_report(limit, reset, collect)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='You don`t have admin permission'
+        )
+
+
+@router.post('/memory/trace')
+async def start_memory_trace(get_user: current_user, frames: int = Query(1, ge=1, le=25)):
+    """Включает tracemalloc и запоминает базовый снимок. frames - глубина стека места аллокации"""
+    if get_user.get('is_admin') and get_user.get('username') in full_rights:
+        if not memory_tracer.start(frames):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail='Memory tracing is already running'
+            )
+        logger.info(f"Пользователь {get_user.get('username')} включил трассировку памяти (frames={frames})")
+        return {
+            'status': status.HTTP_200_OK,
+            'detail': 'Memory tracing started'
+        }
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='You don`t have admin permission'
+        )
+
+
+@router.delete('/memory/trace')
+async def stop_memory_trace(get_user: current_user):
+    if get_user.get('is_admin') and get_user.get('username') in full_rights:
+        memory_tracer.stop()
+        logger.info(f"Пользователь {get_user.get('username')} выключил трассировку памяти")
+        return {
+            'status': status.HTTP_200_OK,
+            'detail': 'Memory tracing stopped'
+        }
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='You don`t have admin permission'
+        )
+
+
+async def _shard_stats(shard: int, session: AsyncSession) -> dict:
+    try:
+        size, users = (await session.execute(
+            select(func.pg_database_size(func.current_database()), select(func.count()).select_from(ChangeVersion).scalar_subquery())
+        )).one()
+    except Exception as e:
+        logger.error(f"Шард {shard} недоступен: {str(e)}")
+        return {'available': False, 'error': str(e)}
+    return {'available': True, 'database_mb': round(size / 2 ** 20, 1), 'users_with_data': users}
+
+
+@router.get('/shards')
+async def get_shards(db: primary_db_read_session, get_user: current_user):
+    """Пользователи по шардам из справочника и состояние каждого шарда, опрошенных параллельно"""
+    if get_user.get('is_admin') and get_user.get('username') in full_rights:
+        directory = await db.execute(
+            select(User.shard, func.count(User.id), func.count(User.id).filter(User.shard_moving)).group_by(User.shard)
+        )
+        placed = {shard: {'users': users, 'moving': moving} for shard, users, moving in directory}
+        stats = await scatter(_shard_stats)
+        return {
+            'shards': [
+                {'shard': shard, **placed.get(shard, {'users': 0, 'moving': 0}), **stats[shard]}
+                for shard in sorted(stats)
+            ]
+        }
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='You don`t have admin permission'
+        )
+
+
+@router.post('/shards/move', status_code=status.HTTP_202_ACCEPTED)
+async def move_user_to_shard(db: primary_db_session, get_user: current_user, user_id: int, shard: int):
+    """
+    Запускает перенос данных пользователя на другой шард. Пока идет перенос, запросы пользователя получают 503.
+    Упавший перенос (пользователь остался с shard_moving) запускается повторно и продолжается с сохраненного этапа
+    """
+    if get_user.get('is_admin') and get_user.get('username') in full_rights:
+        if shard not in session_makers:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail='Shard not found'
+            )
+        user = await db.scalar(select(User).where(User.id == user_id))
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail='User not found'
+            )
+        job = await db.scalar(_user_job('move_user_shard', user_id))
+        if job and job.status in ('pending', 'running'):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail='User is already being moved'
+            )
+        if job and job.status == 'failed':
+            job.status = 'pending'
+            job.attempts = 0
+            job.run_at = func.now()
+            job.last_error = None
+            job.payload = {'user_id': user_id, 'target': shard}
+            detail = 'User move resumed'
+        else:
+            enqueue_durable(db, 'move_user_shard', user_id=user_id, target=shard)
+            detail = 'User move started'
+        await db.commit()
+        logger.info(f"Запущен перенос пользователя {user_id} с шарда {user.shard} на шард {shard}")
+        return {
+            'status': status.HTTP_202_ACCEPTED,
+            'detail': detail
+        }
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='You don`t have admin permission'
+        )
+
+
+@router.post('/shards/prepare', status_code=status.HTTP_202_ACCEPTED)
+async def prepare_all_shards(get_user: current_user):
+    """Разводит последовательности ID шардов и копирует общие записи каталогов - перед первым переносом пользователей"""
+    if get_user.get('is_admin') and get_user.get('username') in full_rights:
+        task_queue.enqueue('prepare_shards')
+        logger.info(f"Пользователь {get_user.get('username')} запустил подготовку шардов")
+        return {
+            'status': status.HTTP_202_ACCEPTED,
+            'detail': 'Shard preparation started'
+        }
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='You don`t have admin permission'
+        )
+
+
+@router.get('/coalescing')
+async def get_coalescing_metrics(get_user: current_user):
+    """Сколько одинаковых одновременных чтений на этом воркере получили результат чужой загрузки"""
+    if get_user.get('is_admin') and get_user.get('username') in full_rights:
+        return single_flight.metrics()
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='You don`t have admin permission'
+        )
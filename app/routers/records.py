@@ -0,0 +1,41 @@
+from typing import List
+from app.models import PersonalRecord, RepRecord
+from app.schemas.response_schemas import PersonalRecordResponse, RepRecordResponse
+from fastapi import APIRouter, HTTPException, status
+from sqlalchemy import select
+from app.routers.dependencies import db_read_session, current_user
+from logging_config import logger
+
+router = APIRouter(prefix='/records', tags=['records'])
+
+
+@router.get('/', response_model=List[PersonalRecordResponse])
+async def get_personal_records(db: db_read_session, get_user: current_user):
+    """Текущие рекорды пользователя по всем упражнениям - чтение готовых строк personal_records по первичному ключу"""
+    user_id = get_user.get('id')
+    logger.info(f"Пользователь {user_id} получает свои рекорды")
+    records = await db.scalars(
+        select(PersonalRecord)
+        .where(PersonalRecord.user_id == user_id)
+        .order_by(PersonalRecord.exercise_catalog_id)
+    )
+    return records.all()
+
+
+@router.get('/{exercise_catalog_id}/reps', response_model=List[RepRecordResponse])
+async def get_rep_records(db: db_read_session, get_user: current_user, exercise_catalog_id: int):
+    """Максимум повторений на каждом весе упражнения (0 - подходы без веса)"""
+    user_id = get_user.get('id')
+    logger.info(f"Пользователь {user_id} получает рекорды повторений упражнения каталога {exercise_catalog_id}")
+    records = (await db.scalars(
+        select(RepRecord)
+        .where(RepRecord.user_id == user_id, RepRecord.exercise_catalog_id == exercise_catalog_id)
+        .order_by(RepRecord.weight)
+    )).all()
+    if not records:
+        logger.warning(f"У пользователя {user_id} нет рекордов по упражнению каталога {exercise_catalog_id}")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Records not found'
+        )
+    return records
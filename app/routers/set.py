@@ -3,20 +3,70 @@ from app.models import Set, Exercise
 from app.schemas.create_schemas import CreateSet
 from app.schemas.response_schemas import SetResponse
 from fastapi import APIRouter, HTTPException, status
-from sqlalchemy import delete, select
-from app.routers.dependencies import db_session, current_user
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.routers.dependencies import db_session, db_read_session, current_user, idempotency_key
+from app.backend.records import record_sets
+from app.backend.tasks import enqueue_after_commit
+from app.backend.live import publish_after_commit
+from app.backend.changelog import DELETE, UPSERT, log_changes
+from app.backend.queries import EXERCISE_BY_ID, SET_BY_ID, SET_BY_ID_ALL_PARTITIONS, SETS_BY_EXERCISE, TRAINING_ID_BY_EXERCISE
 from sqlalchemy.exc import IntegrityError
 from logging_config import logger
 
 router = APIRouter(prefix='/sets', tags=['sets'])
 
 
+async def _training_id(db: AsyncSession, exercise_id: int) -> int:
+    return await db.scalar(TRAINING_ID_BY_EXERCISE, {'exercise_id': exercise_id})
+
+
+def _set_event(event_type: str, training_id: int, exercise: Exercise, set_data: Set) -> dict:
+    return {
+        'type': event_type,
+        'training_id': training_id,
+        'exercise_id': exercise.id,
+        'numbers_reps': exercise.numbers_reps,
+        'set': SetResponse.model_validate(set_data).model_dump()
+    }
+
+
+async def add_set(db: AsyncSession, exercise: Exercise, set_data: CreateSet) -> Set:
+    """Добавляет подход к упражнению в текущей транзакции: счетчик подходов, рекорды и событие для live-соединений"""
+    new_set = Set(
+        exercise_id=exercise.id,
+        weight_per_exe=set_data.weight_per_exe,
+        reps=set_data.reps,
+        user_id=exercise.user_id
+    )
+    db.add(new_set)
+    await db.flush()
+    await record_sets(db, exercise.user_id, [(exercise.exercise_catalog_id, new_set.weight_per_exe, new_set.reps)])
+
+    exercise.numbers_reps += 1
+    db.add(exercise)
+    await log_changes(db, exercise.user_id, [('set', new_set.id, UPSERT), ('exercise', exercise.id, UPSERT)])
+    publish_after_commit(
+        db, exercise.user_id,
+        _set_event('set_created', await _training_id(db, exercise.id), exercise, new_set)
+    )
+    return new_set
+
+
 @router.post('/', status_code=status.HTTP_201_CREATED)
-async def create_set(db: db_session, get_user: current_user, create_set: CreateSet, exercise_id: int):
+async def create_set(
+    db: db_session,
+    get_user: current_user,
+    create_set: CreateSet,
+    exercise_id: int,
+    idempotency: idempotency_key
+):
     try:
         async with db.begin():
             logger.info(f"Пользователь {get_user.get('id')} пытается создать новый set")
-            exercise = await db.scalar(select(Exercise).where(Exercise.id == exercise_id))
+            if idempotency and (stored := await idempotency.claim(db)):
+                return stored
+            exercise = await db.scalar(EXERCISE_BY_ID, {'id': exercise_id})
             if not exercise:
                 logger.warning(f"Упражнения {exercise_id} нет")
                 raise HTTPException(
@@ -24,22 +74,15 @@ async def create_set(db: db_session, get_user: current_user, create_set: CreateS
                     detail="Exercise not found"
                 )
             if get_user.get('is_admin') or get_user.get('id') == exercise.user_id:
-                new_set = Set(
-                    exercise_id=exercise_id,
-                    weight_per_exe=create_set.weight_per_exe,
-                    reps=create_set.reps,
-                    user_id=exercise.user_id
-                )
-                db.add(new_set)
-                await db.flush()
-
-                exercise.numbers_reps += 1
-                db.add(exercise)
+                await add_set(db, exercise, create_set)
                 logger.info(f"Set успешно создан")
-                return {
-            'status': status.HTTP_201_CREATED,
-            'transaction': 'New set created'
-        }
+                response = {
+                    'status': status.HTTP_201_CREATED,
+                    'transaction': 'New set created'
+                }
+                if idempotency:
+                    await idempotency.save(db, status.HTTP_201_CREATED, response)
+                return response
             else:
                 logger.warning(f"Пользователь {get_user.get('id')} не имеет необходимых прав для данного метода")
                 raise HTTPException(
@@ -56,10 +99,20 @@ async def create_set(db: db_session, get_user: current_user, create_set: CreateS
         )
 
 
+async def _set_by_id(db, set_id: int, get_user: dict) -> Set | None:
+    """
+    Подход по ID. Пользователь ищет только среди своих подходов - запрос читает одну секцию sets,
+    чужой подход для него не найден. Администратор ищет по всем секциям
+    """
+    if get_user.get('is_admin'):
+        return await db.scalar(SET_BY_ID_ALL_PARTITIONS, {'id': set_id})
+    return await db.scalar(SET_BY_ID, {'id': set_id, 'user_id': get_user.get('id')})
+
+
 @router.get('/{set_id}', response_model=SetResponse)
-async def get_set(db: db_session, set_id: int, get_user: current_user):
+async def get_set(db: db_read_session, set_id: int, get_user: current_user):
     logger.info(f"Пользоваетль {get_user.get('id')} пытается получить set")
-    set = await db.scalar(select(Set).where(Set.id == set_id))
+    set = await _set_by_id(db, set_id, get_user)
     if not set:
         logger.warning(f"Set {set_id} нет")
         raise HTTPException(
@@ -67,21 +120,14 @@ async def get_set(db: db_session, set_id: int, get_user: current_user):
             detail="Set not found"
         )
     
-    if get_user.get('is_admin') or get_user.get('user_id') == set.user_id:
-        logger.info(f"Set {set_id} успешно получено")
-        return set
-    else:
-        logger.warning(f"Пользователь {get_user.get('id')} не имеет прав для данного метода")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail='You are not authorized to use this method'
-        )
+    logger.info(f"Set {set_id} успешно получено")
+    return set
 
 
 @router.get('/', response_model=List[SetResponse])
-async def get_all_set_by_exercise(db: db_session, exercise_id: int, get_user: current_user):
+async def get_all_set_by_exercise(db: db_read_session, exercise_id: int, get_user: current_user):
     logger.info(f"Пользователь {get_user.get('id')} пытается получить все Set из тренировки с ID {exercise_id}")
-    exercise = await db.scalar(select(Exercise).where(Exercise.id == exercise_id))
+    exercise = await db.scalar(EXERCISE_BY_ID, {'id': exercise_id})
     if not exercise:
         logger.warning(f"Exercise {exercise_id} нет")
         raise HTTPException(
@@ -89,8 +135,8 @@ async def get_all_set_by_exercise(db: db_session, exercise_id: int, get_user: cu
             detail='Exercise not found'
         )
     
-    if get_user.get('is_admin') or get_user.get('user_id') == exercise.user_id:
-        sets = await db.scalars(select(Set).where(Set.exercise_id == exercise_id))
+    if get_user.get('is_admin') or get_user.get('id') == exercise.user_id:
+        sets = await db.scalars(SETS_BY_EXERCISE, {'exercise_id': exercise_id, 'user_id': exercise.user_id})
         logger.info(f"Sets успешно получены")
         return sets.all()
     else:
@@ -106,33 +152,32 @@ async def delete_set(db: db_session, get_user: current_user, set_id: int):
     try:
         logger.info(f"Пользователь {get_user.get('id')} пытается удалить set с ID {set_id}")
         async with db.begin():
-            set_to_delete = await db.scalar(select(Set).where(Set.id == set_id))
-            if not set:
+            set_to_delete = await _set_by_id(db, set_id, get_user)
+            if not set_to_delete:
                 logger.warning(f"Set {set_id} нет")
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail='Set not found'
                 )
             
-            if get_user.get('is_admin') or get_user.get('id') == set_to_delete.user_id:
-                exercise = await db.scalar(select(Exercise).where(Exercise.id == set_to_delete.exercise_id))
-                if exercise.numbers_reps == 1:
-                    logger.warning(f"Пользователь {get_user.get('id')} пытается удалить последний set")
-                    raise HTTPException(
-                        status_code=status.HTTP_409_CONFLICT,
-                        detail="Can't delete last approach"
-                    )
-                else:
-                    await db.execute(delete(Set).where(Set.id == set_id))
-                    exercise.numbers_reps -= 1
-                db.add(exercise)
-                logger.info(f"Set {set_id} успешно удален")
-            else:
-                logger.warning(f"Пользоваетль {get_user.get('id')} не имеет прав для данного метода")
+            exercise = await db.scalar(EXERCISE_BY_ID, {'id': set_to_delete.exercise_id})
+            if exercise.numbers_reps == 1:
+                logger.warning(f"Пользователь {get_user.get('id')} пытается удалить последний set")
                 raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail='You are not authorized to use this method'
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Can't delete last approach"
                 )
+            else:
+                await db.execute(delete(Set).where(Set.id == set_id, Set.user_id == set_to_delete.user_id))
+                exercise.numbers_reps -= 1
+                enqueue_after_commit(db, 'recompute_records', user_id=exercise.user_id, catalog_ids=[exercise.exercise_catalog_id])
+                await log_changes(db, exercise.user_id, [('set', set_id, DELETE), ('exercise', exercise.id, UPSERT)])
+            db.add(exercise)
+            publish_after_commit(
+                db, exercise.user_id,
+                _set_event('set_deleted', await _training_id(db, exercise.id), exercise, set_to_delete)
+            )
+            logger.info(f"Set {set_id} успешно удален")
             return None
 
     except IntegrityError as e:
@@ -149,33 +194,40 @@ async def update_set(db: db_session, get_user: current_user, set_id: int, new_da
     try:
         async with db.begin():
             logger.info(f"Пользователь {get_user.get('id')} пытается изменить set {set_id}")
-            set_to_update = await db.scalar(select(Set).where(Set.id == set_id))
+            set_to_update = await _set_by_id(db, set_id, get_user)
             if not set_to_update:
                 logger.warning(f"Set {set_id} нет")
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="Set not found"
                 )
-            if get_user.get('is_admin') or get_user.get('id') == set_to_update.user_id:
-                if (
-                    set_to_update.weight_per_exe == new_data.weight_per_exe and
-                    set_to_update.reps == new_data.reps
-                ):
-                    logger.info(f"Изменений нет. Переданы существующие данные")
-                    return set_to_update
-
-                set_to_update.weight_per_exe = new_data.weight_per_exe
-                set_to_update.reps = new_data.reps
-                db.add(set_to_update)
-                logger.info(f"Пользователь {get_user.get('id')} успешно изменил set {set_id}")
+            if (
+                set_to_update.weight_per_exe == new_data.weight_per_exe and
+                set_to_update.reps == new_data.reps
+            ):
+                logger.info(f"Изменений нет. Переданы существующие данные")
                 return set_to_update
+
+            #Рекорды только растут: если подход не стал хуже на том же весе, достаточно инкрементального обновления,
+            #иначе подход мог быть рекордным - пересчитываем только это упражнение
+            grew = set_to_update.weight_per_exe == new_data.weight_per_exe and new_data.reps >= set_to_update.reps
+            set_to_update.weight_per_exe = new_data.weight_per_exe
+            set_to_update.reps = new_data.reps
+            db.add(set_to_update)
+
+            exercise = await db.scalar(EXERCISE_BY_ID, {'id': set_to_update.exercise_id})
+            if grew:
+                await record_sets(db, set_to_update.user_id, [(exercise.exercise_catalog_id, new_data.weight_per_exe, new_data.reps)])
             else:
-                logger.warning(f"Пользователь {get_user.get('id')} не имеет прав для данного метода")
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail='You are not authorized to use this method'
-                )
-  
+                enqueue_after_commit(db, 'recompute_records', user_id=set_to_update.user_id, catalog_ids=[exercise.exercise_catalog_id])
+            await log_changes(db, set_to_update.user_id, [('set', set_id, UPSERT)])
+            publish_after_commit(
+                db, exercise.user_id,
+                _set_event('set_updated', await _training_id(db, exercise.id), exercise, set_to_update)
+            )
+            logger.info(f"Пользователь {get_user.get('id')} успешно изменил set {set_id}")
+            return set_to_update
+
     except Exception as e:
         await db.rollback()
         logger.error(f"Ошибка целостности базы данных: {str(e)}")
@@ -0,0 +1,60 @@
+from collections import defaultdict
+from fastapi import APIRouter, Query
+from app.backend.changelog import DELETE, UPSERT, load_entities, read_changes, sync_state
+from app.routers.dependencies import current_user, db_read_session
+from app.schemas.response_schemas import SyncResponse
+from logging_config import logger
+
+router = APIRouter(prefix='/sync', tags=['sync'])
+
+
+@router.get('/', response_model=SyncResponse)
+async def sync_changes(
+    db: db_read_session,
+    get_user: current_user,
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=1000)
+):
+    """
+    Изменения тренировок пользователя после курсора since (версии журнала). Каждая сущность отдается один раз
+    с текущими данными; удаление родителя приходит вместе с удалением потомков.
+    Если курсор старше сжатой части журнала, возвращается full_resync: клиент заново загружает данные
+    и продолжает с выданного cursor. Пока has_more - запрашивать следующую страницу с since=cursor
+    """
+    user_id = get_user.get('id')
+    version, floor = await sync_state(db, user_id)
+    if since < floor:
+        logger.info(f"Курсор {since} пользователя {user_id} старше сжатого журнала ({floor}), нужна полная синхронизация")
+        return {'cursor': version, 'has_more': False, 'full_resync': True, 'changes': []}
+
+    entries, has_more = await read_changes(db, user_id, since, limit)
+    latest = {}
+    for entry in entries:
+        latest.pop((entry.entity, entry.entity_id), None)
+        latest[(entry.entity, entry.entity_id)] = entry
+
+    upserted = defaultdict(list)
+    for entry in latest.values():
+        if entry.op == UPSERT:
+            upserted[entry.entity].append(entry.entity_id)
+    data = await load_entities(db, user_id, upserted)
+
+    changes = []
+    for key, entry in latest.items():
+        #Сущность могла быть удалена позже - ее удаление будет в следующих версиях журнала
+        found = data.get(key) if entry.op == UPSERT else None
+        changes.append({
+            'entity': entry.entity,
+            'id': entry.entity_id,
+            'op': UPSERT if found else DELETE,
+            'version': entry.version,
+            'data': found
+        })
+
+    logger.info(f"Пользователь {user_id} синхронизировался с версии {since}: изменений {len(changes)}")
+    return {
+        'cursor': entries[-1].version if entries else since,
+        'has_more': has_more,
+        'full_resync': False,
+        'changes': changes
+    }
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, HTTPException, Query, status
+from app.backend.tasks import task_queue, durable_metrics
+from app.routers.dependencies import current_user, primary_db_read_session
+from logging_config import logger
+
+router = APIRouter(prefix='/tasks', tags=['tasks'])
+
+
+@router.get('/metrics')
+async def get_task_metrics(db: primary_db_read_session, get_user: current_user):
+    """Глубина и задержка очереди фоновых задач процесса и durable-очереди в БД"""
+    if get_user.get('is_admin'):
+        return {
+            'in_process': task_queue.metrics(),
+            'durable': await durable_metrics(db)
+        }
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='You don`t have admin permission'
+        )
+
+
+@router.post('/archive-trainings', status_code=status.HTTP_202_ACCEPTED)
+async def start_training_archival(get_user: current_user, older_than_days: int | None = Query(None, ge=0)):
+    """Запускает перенос старых тренировок в холодное хранилище (по умолчанию старше ARCHIVE_AFTER_DAYS)"""
+    if get_user.get('is_admin'):
+        task_queue.enqueue('archive_trainings', older_than_days=older_than_days)
+        logger.info(f"Пользователь {get_user.get('id')} запустил архивацию тренировок")
+        return {
+            'status': status.HTTP_202_ACCEPTED,
+            'detail': 'Training archival started'
+        }
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='You don`t have admin permission'
+        )
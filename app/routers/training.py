@@ -1,25 +1,103 @@
 from typing import Annotated
-from app.models import Training, Set, MuscleGroup, Exercise
+from app.models import Training, Set, MuscleGroup, MuscleGroupCatalog, Exercise, ArchivedTraining
 from app.schemas.create_schemas import CreateTraining
-from app.schemas.response_schemas import TrainingResponse, TrainingResponsePatch
+from app.schemas.response_schemas import CalendarResponse, TrainingResponse, TrainingResponsePatch
 from app.schemas.update_schemas import UpdateTrainings
-from fastapi import APIRouter, HTTPException, status
-from sqlalchemy import select, delete
-from sqlalchemy.orm import selectinload
+from fastapi import APIRouter, HTTPException, Query, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import Integer, select, delete, insert, literal, union_all
 from datetime import date
-from app.routers.dependencies import db_session, current_user
+from app.routers.dependencies import db_session, db_read_session, current_user, idempotency_key
+from app.backend.db import next_id
+from app.backend.catalog import exercise_catalog, muscle_group_catalog
+from app.backend.coalesce import single_flight
+from app.backend.records import record_sets
+from app.backend.tasks import enqueue_after_commit
+from app.backend.sparse import TRAINING_TREE
+from app.backend.queries import (
+    ARCHIVED_TRAINING_BY_ID, ARCHIVED_TRAININGS_BY_DATES, ARCHIVED_TRAININGS_BY_IDS, TRAINING_BY_ID,
+    TRAINING_WITH_MUSCLE_GROUPS_BY_ID, training_batch, tree_by_id
+)
+from app.config import settings
+from app.backend.changelog import DELETE, UPSERT, log_changes, log_tree
+from app.backend.archive import archived_on, unpack_training
+from app.backend.training_calendar import month_bounds, training_calendar
 from sqlalchemy.exc import IntegrityError
 from logging_config import logger
 
 router = APIRouter(prefix='/trainings', tags=['trainings'])
 
 
+def _copy_training_tree_stmt(source_training_id: int, new_training_id: int):
+    """
+    Один INSERT ... SELECT, копирующий гр. мышц, упражнения и подходы тренировки source_training_id
+    в тренировку new_training_id. Новые ID выделяются заранее через nextval в CTE-отображениях old_id -> new_id,
+    поэтому дочерние строки ссылаются на скопированных родителей без промежуточных flush
+    """
+    mg_map = (
+        select(MuscleGroup.id.label('old_id'), next_id(MuscleGroup.__tablename__).label('new_id'))
+        .where(MuscleGroup.training_id == source_training_id)
+        .cte('mg_map')
+    )
+    insert_muscle_groups = insert(MuscleGroup).from_select(
+        ['id', 'training_id', 'muscle_group_catalog_id', 'user_id'],
+        select(mg_map.c.new_id, literal(new_training_id, Integer), MuscleGroup.muscle_group_catalog_id, MuscleGroup.user_id)
+        .join(MuscleGroup, MuscleGroup.id == mg_map.c.old_id)
+    ).cte('insert_muscle_groups')
+
+    exercise_map = (
+        select(
+            Exercise.id.label('old_id'),
+            next_id(Exercise.__tablename__).label('new_id'),
+            mg_map.c.new_id.label('new_muscle_group_id')
+        )
+        .join(mg_map, Exercise.muscle_group_id == mg_map.c.old_id)
+        .cte('exercise_map')
+    )
+    insert_exercises = insert(Exercise).from_select(
+        ['id', 'muscle_group_id', 'exercise_catalog_id', 'weight', 'numbers_reps', 'user_id'],
+        select(
+            exercise_map.c.new_id,
+            exercise_map.c.new_muscle_group_id,
+            Exercise.exercise_catalog_id,
+            Exercise.weight,
+            Exercise.numbers_reps,
+            Exercise.user_id
+        )
+        .join(Exercise, Exercise.id == exercise_map.c.old_id)
+    ).cte('insert_exercises')
+
+    return (
+        insert(Set).from_select(
+            ['exercise_id', 'weight_per_exe', 'reps', 'user_id'],
+            select(exercise_map.c.new_id, Set.weight_per_exe, Set.reps, Set.user_id)
+            .join(Set, Set.exercise_id == exercise_map.c.old_id)
+        )
+        .add_cte(insert_muscle_groups)
+        .add_cte(insert_exercises)
+    )
+
+
 @router.post('/', status_code=status.HTTP_201_CREATED)
-async def create_training(db: db_session, create_training_data: CreateTraining, get_user: current_user):
+async def create_training(
+    db: db_session,
+    create_training_data: CreateTraining,
+    get_user: current_user,
+    idempotency: idempotency_key
+):
     try:
         logger.info(f"Пользователь {get_user.get('id')} пытается создать новую тренировку")
         async with db.begin():
+            if idempotency and (stored := await idempotency.claim(db)):
+                return stored
             user_id = get_user.get('id')
+            if await db.scalar(select(archived_on(user_id, create_training_data.date))):
+                logger.warning(f"У пользователя {user_id} уже есть архивная тренировка на {create_training_data.date}")
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail='Training for this date already exists'
+                )
             new_training = Training(
                 date=create_training_data.date,
                 user_id=user_id
@@ -28,22 +106,24 @@ async def create_training(db: db_session, create_training_data: CreateTraining,
             await db.flush()
 
             muscle_group_names = []
+            new_sets = []
 
             for muscle_group_data in create_training_data.muscle_groups:
+                group_name = muscle_group_data.group_name.title()
                 new_muscle_group = MuscleGroup(
                     training_id=new_training.id,
-                    group_name=muscle_group_data.group_name.title(),
+                    muscle_group_catalog_id=await muscle_group_catalog.get_id(db, group_name, user_id),
                     user_id=user_id
                 )
                 db.add(new_muscle_group)
                 await db.flush()
 
-                muscle_group_names.append(new_muscle_group.group_name)
+                muscle_group_names.append(group_name)
 
                 for exercise_data in muscle_group_data.exercises:
                     new_exercise = Exercise(
                         muscle_group_id=new_muscle_group.id,
-                        exercise_name=exercise_data.exercise_name,
+                        exercise_catalog_id=await exercise_catalog.get_id(db, exercise_data.exercise_name, user_id),
                         weight=exercise_data.weight,
                         numbers_reps=1,
                         user_id=user_id
@@ -60,8 +140,12 @@ async def create_training(db: db_session, create_training_data: CreateTraining,
                             user_id=user_id
                         )
                         db.add(new_set)
+                        new_sets.append((new_exercise.exercise_catalog_id, set_data.weight_per_exe, set_data.reps))
                         cnt += 1
                     new_exercise.numbers_reps = cnt
+
+            await record_sets(db, user_id, new_sets)
+            await log_tree(db, user_id, UPSERT, 'training', [new_training.id])
             
             formatted_date = new_training.date.strftime("%d.%m.%Y")
             title = f"{formatted_date}-" + ', '.join(muscle_group_names)
@@ -69,10 +153,13 @@ async def create_training(db: db_session, create_training_data: CreateTraining,
             db.add(new_training)
             logger.info(f"Пользователь {get_user.get('id')} успешно создал тренировку {new_training.title}")
 
-            return {
-                    'status': status.HTTP_201_CREATED,
-                    'transaction': 'New training created'
-                }
+            response = {
+                'status': status.HTTP_201_CREATED,
+                'transaction': 'New training created'
+            }
+            if idempotency:
+                await idempotency.save(db, status.HTTP_201_CREATED, response)
+            return response
         
     except IntegrityError as e:
         await db.rollback()
@@ -83,29 +170,179 @@ async def create_training(db: db_session, create_training_data: CreateTraining,
         )
 
 
-@router.get('/{training_id}', response_model=TrainingResponse)
-async def get_training(db: db_session, training_id: int, get_user: current_user):
-    logger.info(f"Пользователь {get_user.get('id')} пытается получить тренировку с ID {training_id}")
-    training = await db.scalar(select(Training)
-                               .options(
-                                   selectinload(Training.muscle_groups).options(
-                                       selectinload(MuscleGroup.exercises).options(
-                                           selectinload(Exercise.sets)
-                                       )
-                                   )
-                               )
-                               .where(Training.id == training_id)
-                            )
-    if not training:
-        logger.warning(f"Тренировки {training_id} нет")
+@router.post('/{training_id}/copy', status_code=status.HTTP_201_CREATED)
+async def copy_training(db: db_session, get_user: current_user, training_id: int, new_date: date):
+    """
+    Копирует тренировку со всеми гр. мышц, упражнениями и подходами на дату new_date.
+    Всё дерево дублируется на стороне БД фиксированным числом запросов, независимо от размера тренировки
+    """
+    try:
+        logger.info(f"Пользователь {get_user.get('id')} пытается скопировать тренировку {training_id} на {new_date}")
+        async with db.begin():
+            training = await db.scalar(TRAINING_BY_ID, {'id': training_id})
+            if not training:
+                logger.warning(f"Тренировки {training_id} нет")
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail='Training not found'
+                )
+
+            if not (get_user.get('is_admin') or get_user.get('id') == training.user_id):
+                logger.warning(f"Пользователь {get_user.get('id')} не имеет прав для данного метода")
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail='You are not authorized to use this method'
+                )
+
+            user_id = training.user_id
+            existing = await db.scalar(
+                select(Training.id).where(Training.user_id == user_id, Training.date == new_date)
+            )
+            if existing or await db.scalar(select(archived_on(user_id, new_date))):
+                logger.warning(f"У пользователя {user_id} уже есть тренировка {existing} на {new_date}")
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail='Training for this date already exists'
+                )
+
+            muscle_group_names = (await db.scalars(
+                select(MuscleGroupCatalog.group_name)
+                .join(MuscleGroup, MuscleGroup.muscle_group_catalog_id == MuscleGroupCatalog.id)
+                .where(MuscleGroup.training_id == training_id)
+                .order_by(MuscleGroup.id)
+            )).all()
+            formatted_date = new_date.strftime("%d.%m.%Y")
+            title = f"{formatted_date}-" + ', '.join(muscle_group_names)
+
+            new_training_id = await db.scalar(
+                insert(Training)
+                .values(date=new_date, title=title, user_id=user_id)
+                .returning(Training.id)
+            )
+            await db.execute(_copy_training_tree_stmt(training_id, new_training_id))
+            await log_tree(db, user_id, UPSERT, 'training', [new_training_id])
+
+            logger.info(f"Тренировка {training_id} успешно скопирована в тренировку {new_training_id}")
+            return {
+                'status': status.HTTP_201_CREATED,
+                'transaction': 'Training copied',
+                'training_id': new_training_id
+            }
+
+    except IntegrityError as e:
+        await db.rollback()
+        logger.error(f"Ошибка целостности базы данных: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to copy training: {str(e)}"
+        )
+
+
+@router.get('/calendar', response_model=CalendarResponse)
+async def get_training_calendar(
+    db: db_read_session,
+    get_user: current_user,
+    year: int = Query(ge=1, le=9999),
+    month: int | None = Query(None, ge=1, le=12)
+):
+    """
+    Календарь тренировок за месяц (или за год без month): для каждого дня с тренировкой - группы мышц,
+    число подходов и объем (сумма вес x повторения). Считается одним сгруппированным запросом по покрывающим индексам
+    """
+    user_id = get_user.get('id')
+    months = [(year, month)] if month else [(year, number) for number in range(1, 13)]
+    days = await training_calendar(db, user_id, months)
+    logger.info(f"Пользователь {user_id} получил календарь тренировок за {year}{f'-{month:02d}' if month else ''}")
+    return {
+        'date_from': month_bounds(months[0])[0],
+        'date_to': month_bounds(months[-1])[1],
+        'days': days
+    }
+
+
+@router.get('/batch')
+async def get_trainings_batch(
+    db: db_read_session,
+    get_user: current_user,
+    ids: list[int] | None = Query(None),
+    date_from: date | None = None,
+    date_to: date | None = None,
+    fields: str | None = None,
+    depth: int | None = Query(None, ge=0, le=TRAINING_TREE.max_depth)
+):
+    """
+    Несколько тренировок пользователя целиком за один запрос: по ID (ids=1&ids=2, в порядке запроса)
+    или за период date_from..date_to (по возрастанию даты, не больше TRAINING_BATCH_MAX_SIZE, has_more - есть еще).
+    Независимо от числа тренировок - один запрос на уровень дерева. fields и depth - как у GET /trainings/{training_id}.
+    missing - ID, которых нет среди тренировок пользователя
+    """
+    user_id = get_user.get('id')
+    max_size = settings.TRAINING_BATCH_MAX_SIZE
+    by_dates = date_from is not None or date_to is not None
+    if bool(ids) == by_dates:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail='Training not found'
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Pass either ids or date_from/date_to'
         )
+    if ids and len(set(ids)) > max_size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {max_size} trainings per request"
+        )
+
+    logger.info(f"Пользователь {user_id} запрашивает пачку тренировок")
+    tree, query = training_batch(fields, depth, by_dates)
+    if by_dates:
+        params = {'user_id': user_id, 'date_from': date_from or date.min, 'date_to': date_to or date.max, 'limit': max_size + 1}
+        hot = (await db.scalars(query, params)).all()
+        archived = (await db.scalars(ARCHIVED_TRAININGS_BY_DATES, params)).all()
+    else:
+        ids = list(dict.fromkeys(ids))
+        hot = (await db.scalars(query, {'user_id': user_id, 'ids': ids})).all()
+        #Старые тренировки ищутся в холодном хранилище одним запросом
+        not_hot = [training_id for training_id in ids if training_id not in {training.id for training in hot}]
+        archived = (await db.scalars(ARCHIVED_TRAININGS_BY_IDS, {'user_id': user_id, 'ids': not_hot})).all() if not_hot else []
+
+    found = [(training.date, training.id, jsonable_encoder(tree.serialize(training))) for training in hot]
+    found += [(training.date, training.id, tree.prune(unpack_training(training.document))) for training in archived]
+    if by_dates:
+        found.sort(key=lambda item: item[0])
+        has_more = len(found) > max_size
+        found = found[:max_size]
+        missing = []
+    else:
+        position = {training_id: index for index, training_id in enumerate(ids)}
+        found.sort(key=lambda item: position[item[1]])
+        has_more = False
+        missing = [training_id for training_id in ids if training_id not in {item[1] for item in found}]
+
+    logger.info(f"Пользователь {user_id} получил {len(found)} тренировок одним запросом")
+    return JSONResponse({
+        'trainings': [data for _, _, data in found],
+        'missing': missing,
+        'has_more': has_more
+    })
+
+
+async def _training_body(db, training_id: int, get_user: dict, fields: str | None, depth: int | None) -> bytes:
+    tree, query = tree_by_id('training', fields, depth)
+    training = await db.scalar(query, {'id': training_id})
+    if not training:
+        #Старые тренировки переносятся в холодное хранилище с тем же ID
+        archived = await db.scalar(ARCHIVED_TRAINING_BY_ID, {'id': training_id})
+        if not archived:
+            logger.warning(f"Тренировки {training_id} нет")
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail='Training not found'
+            )
+        training = archived
     
-    if get_user.get('is_admin') or get_user.get('user_id') == training.user_id:
+    if get_user.get('is_admin') or get_user.get('id') == training.user_id:
         logger.info(f"Тренировка {training_id} успешно получена")
-        return training
+        if isinstance(training, ArchivedTraining):
+            return JSONResponse(tree.prune(unpack_training(training.document))).body
+        return JSONResponse(jsonable_encoder(tree.serialize(training))).body
     else:
         logger.warning(f"Пользователь {get_user.get('id')} не имеет прав для данного метода")
         raise HTTPException(
@@ -114,14 +351,42 @@ async def get_training(db: db_session, training_id: int, get_user: current_user)
         )
 
 
+@router.get('/{training_id}', response_model=TrainingResponse)
+async def get_training(
+    db: db_read_session,
+    training_id: int,
+    get_user: current_user,
+    fields: str | None = None,
+    depth: int | None = Query(None, ge=0, le=TRAINING_TREE.max_depth)
+):
+    """
+    fields - поля ответа через запятую, вложенные через точку (например id,title,muscle_groups.group_name);
+    depth - сколько уровней вложенности загружать (0 - только тренировка).
+    Незапрошенные уровни и колонки не загружаются из БД. Одновременные одинаковые запросы пользователя
+    (телефон и часы, повторы клиента) выполняют одну загрузку и сериализацию
+    """
+    logger.info(f"Пользователь {get_user.get('id')} пытается получить тренировку с ID {training_id}")
+    return await single_flight.json(
+        ('get_training', training_id, fields, depth, get_user.get('id'), get_user.get('is_admin')),
+        lambda: _training_body(db, training_id, get_user, fields, depth)
+    )
+
+
 @router.get("/", status_code=status.HTTP_200_OK)
-async def get_number_of_trainings(db: db_session, get_user: current_user):
+async def get_number_of_trainings(db: db_read_session, get_user: current_user):
     """
     Функция, которая возвращает кол-во тренировок у юзера и выводит список всех его тренировок, в порядке возрастания даты
     """
     logger.info(f"Пользователь {get_user.get('id')} пытается получить список своих тренировок")
     user_id = get_user.get('id')
-    all_trainings = await db.scalars(select(Training).where(Training.user_id == user_id).order_by(Training.date))
+    #Список объединяет рабочие и архивные тренировки - для клиента архивация незаметна
+    all_trainings = await db.execute(
+        union_all(
+            select(Training.id, Training.title, Training.date).where(Training.user_id == user_id),
+            select(ArchivedTraining.id, ArchivedTraining.title, ArchivedTraining.date).where(ArchivedTraining.user_id == user_id)
+        )
+        .order_by('date')
+    )
     trainings_list = all_trainings.all()
     if len(trainings_list) == 0:
         logger.info(f"У пользователя {get_user.get('id')} не создано тренировок")
@@ -141,9 +406,7 @@ async def update_training_date(db: db_session, get_user: current_user, update_da
     try:
         async with db.begin():
             logger.info(f"Пользователь {get_user.get('id')} пытается изменить тренировку {update_data.training_id}")
-            training = await db.scalar(select(Training)
-                                       .options(selectinload(Training.muscle_groups))
-                                       .where(Training.id == update_data.training_id))
+            training = await db.scalar(TRAINING_WITH_MUSCLE_GROUPS_BY_ID, {'id': update_data.training_id})
             if not training:
                 logger.warning(f"Тренировки с ID {update_data.training_id} нет")
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Тренировка не найдена")
@@ -160,6 +423,7 @@ async def update_training_date(db: db_session, get_user: current_user, update_da
                 training.date = update_data.update_date
                 training.title = new_title
                 db.add(training)
+                await log_changes(db, training.user_id, [('training', training.id, UPSERT)])
                 logger.info(f"Тренировка {update_data.training_id} успешно изменена")
             else:
                 logger.warning(f"Пользователь {get_user.get('id')} не имеет прав для данного метода")
@@ -183,7 +447,7 @@ async def delete_training(db: db_session, get_user: current_user, training_id: i
     try:
         async with db.begin():
             logger.info(f"Пользователь {get_user.get('id')} пытается удалить тренировку {training_id}")
-            training = await db.scalar(select(Training).where(Training.id == training_id))
+            training = await db.scalar(TRAINING_BY_ID, {'id': training_id})
             if not training:
                 logger.warning(f"Тренировки {training_id} нет")
                 raise HTTPException(
@@ -192,7 +456,15 @@ async def delete_training(db: db_session, get_user: current_user, training_id: i
                 )
             
             if get_user.get('is_admin') or get_user.get('id') == training.user_id:
+                catalog_ids = await db.scalars(
+                    select(Exercise.exercise_catalog_id)
+                    .join(MuscleGroup, MuscleGroup.id == Exercise.muscle_group_id)
+                    .where(MuscleGroup.training_id == training_id)
+                )
+                catalog_ids = catalog_ids.all()
+                await log_tree(db, training.user_id, DELETE, 'training', [training_id])
                 await db.execute(delete(Training).where(Training.id == training_id))
+                enqueue_after_commit(db, 'recompute_records', user_id=training.user_id, catalog_ids=catalog_ids)
             else:
                 logger.warning(f"Пользователь {get_user.get('id')} не имеет прав для данного метода")
                 raise HTTPException(
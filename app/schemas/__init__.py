@@ -1,3 +1,3 @@
-from .create_schemas import CreateExercise, CreateMuscleGroup, CreateSet, CreateTraining, CreateUser
-from .response_schemas import SetResponse, ExerciseResponse, TrainingResponse, MuscleGroupResponse, TrainingResponsePatch, MuscleGroupResponsePatch
+from .create_schemas import CreateExercise, CreateMuscleGroup, CreateSet, CreateTraining, CreateUser, RefreshTokenRequest
+from .response_schemas import SetResponse, ExerciseResponse, TrainingResponse, MuscleGroupResponse, TrainingResponsePatch, MuscleGroupResponsePatch, ImportRowError, ImportReport, ExerciseSearchResult, ExerciseSearchResponse
 from .update_schemas import UpdateTrainings
\ No newline at end of file
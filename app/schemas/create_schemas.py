@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Literal
 from pydantic import BaseModel, Field, EmailStr
 from datetime import date
 
@@ -7,10 +7,21 @@ class CreateUser(BaseModel):
     username: str = Field(..., min_length=1, max_length=20)
     password: str = Field(..., min_length=5)
 
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str = Field(..., min_length=1)
+
 class CreateSet(BaseModel):
     weight_per_exe: float = Field(..., ge=0)
     reps: int = Field(..., gt=0)
 
+class LiveWatchTraining(BaseModel):
+    action: Literal['watch']
+    training_id: int
+
+class LiveLogSet(CreateSet):
+    action: Literal['log_set']
+    exercise_id: int
+
 class CreateExercise(BaseModel):
     exercise_name: str = Field(..., min_length=3, max_length=15)
     weight: float = Field(..., ge=0)
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
 from datetime import date
 
@@ -42,4 +42,105 @@ class TrainingResponse(BaseModel):
 
 class TrainingResponsePatch(BaseModel):
     id: int
-    title: str
\ No newline at end of file
+    title: str
+
+class CalendarDay(BaseModel):
+    date: date
+    muscle_groups: List[str]
+    sets: int
+    volume: float
+
+class CalendarResponse(BaseModel):
+    date_from: date
+    date_to: date
+    days: List[CalendarDay]
+
+class ImportRowError(BaseModel):
+    line: int
+    errors: List[str]
+
+class ImportReport(BaseModel):
+    lines_read: int
+    trainings_valid: int
+    trainings_imported: int
+    trainings_skipped: int
+    errors: List[ImportRowError]
+
+class ExerciseSearchResult(BaseModel):
+    id: int
+    exercise_name: str
+    weight: float
+    numbers_reps: int
+    group_name: str
+    training_id: int
+    training_date: date
+
+    class Config:
+        from_attributes = True
+
+class ExerciseSearchResponse(BaseModel):
+    limit: int
+    offset: int
+    items: List[ExerciseSearchResult]
+
+class RepRecordResponse(BaseModel):
+    weight: float
+    reps: int
+
+    class Config:
+        from_attributes = True
+
+class PersonalRecordResponse(BaseModel):
+    exercise_catalog_id: int
+    exercise_name: str
+    max_weight: Optional[float]
+    max_weight_reps: Optional[int]
+    best_e1rm: Optional[float]
+    max_reps: int
+
+    class Config:
+        from_attributes = True
+
+class SyncChange(BaseModel):
+    entity: str
+    id: int
+    op: str
+    version: int
+    data: Optional[dict]
+
+class SyncResponse(BaseModel):
+    cursor: int
+    has_more: bool
+    full_resync: bool
+    changes: List[SyncChange]
+
+class WorkloadDay(BaseModel):
+    date: date
+    load: float
+    acute: float
+    chronic: float
+    ratio: Optional[float]
+
+class MuscleGroupVolume(BaseModel):
+    group_name: str
+    sets: int
+    volume: float
+
+class WeeklyVolume(BaseModel):
+    week_start: date
+    muscle_groups: List[MuscleGroupVolume]
+
+class E1rmWeek(BaseModel):
+    week_start: date
+    e1rm: float
+
+class E1rmTrend(BaseModel):
+    exercise_name: str
+    slope_per_week: Optional[float]
+    weeks: List[E1rmWeek]
+
+class FatigueDay(BaseModel):
+    date: date
+    fitness: float
+    fatigue: float
+    form: float
@@ -0,0 +1,24 @@
+"""
+Общая подготовка скриптов бенчмарков: запуск из корня репозитория (python benchmarks/<скрипт>.py).
+Приложение импортирует модули и как app.*, и от каталога app (logging_config), поэтому в sys.path нужны оба.
+Бенчмаркам, которые не ходят в БД, без app/.env хватает фиктивных настроек
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, 'app')
+sys.path[:0] = [path for path in (ROOT, APP_DIR) if path not in sys.path]
+
+if not os.path.exists(os.path.join(APP_DIR, '.env')):
+    for name, value in {
+        'DB_USER': 'bench',
+        'DB_PASSWORD': 'bench',
+        'DB_HOST': '127.0.0.1',
+        'DB_PORT': '5432',
+        'DB_NAME': 'bench',
+        'SECRET_KEY': 'bench',
+        'ALGORITHM': 'HS256',
+        'FULL_RIGHTS': 'admin',
+    }.items():
+        os.environ.setdefault(name, value)
@@ -0,0 +1,103 @@
+"""
+Нагрузочный тест live-сессий: открывает N WebSocket-соединений /live/ws, держит их открытыми
+и читает GET /live/metrics - сколько соединений видит воркер и сколько подключений к БД он при этом держит.
+Открытые live-соединения не должны занимать подключения из пула: сессия БД берется только на время команды.
+
+Токены выпускаются скриптом с SECRET_KEY из app/.env, поэтому сервер должен работать с тем же .env.
+Пользователи получают по LIVE_MAX_CONNECTIONS_PER_USER соединений; для открытия соединения пользователь в БД
+не нужен, для --training-id (команда watch на каждом соединении) тренировка должна принадлежать первому пользователю
+или токены должны быть администраторскими (--admin-sessions). Метрики считаются на воркер, поэтому сервер
+для точных цифр запускается с одним воркером: uvicorn app.main:app --workers 1
+Запуск из корня репозитория: python benchmarks/live_sessions.py --sessions 1000 [--url http://127.0.0.1:8000]
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import timedelta
+import _setup  # noqa: F401
+import httpx
+import websockets
+from app.config import settings
+from app.routers.auth import create_access_token
+
+TOKEN_TTL = timedelta(hours=1)
+
+
+async def _metrics(client: httpx.AsyncClient, admin_token: str) -> dict:
+    response = await client.get('/live/metrics', headers={'Authorization': f'Bearer {admin_token}'})
+    response.raise_for_status()
+    return response.json()
+
+
+async def _open(ws_url: str, token: str, training_id: int | None, opened: list, failed: list):
+    try:
+        connection = await websockets.connect(f'{ws_url}/live/ws?token={token}', open_timeout=30)
+        if training_id is not None:
+            await connection.send(json.dumps({'action': 'watch', 'training_id': training_id}))
+            reply = json.loads(await connection.recv())
+            if reply.get('type') != 'snapshot':
+                raise RuntimeError(reply.get('detail'))
+        opened.append(connection)
+    except Exception as e:
+        failed.append(f'{type(e).__name__}: {e}')
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=100, help='одновременно открываемых соединений')
+    parser.add_argument('--hold', type=float, default=10.0, help='секунд держать соединения открытыми')
+    parser.add_argument('--first-user-id', type=int, default=1_000_000)
+    parser.add_argument('--training-id', type=int, help='отправить watch с этой тренировкой на каждом соединении')
+    parser.add_argument('--admin-sessions', action='store_true', help='выпускать соединениям администраторские токены')
+    args = parser.parse_args()
+
+    admin = settings.full_rights_users[0]
+    admin_token = await create_access_token(admin, args.first_user_id - 1, True, False, TOKEN_TTL)
+    per_user = settings.LIVE_MAX_CONNECTIONS_PER_USER
+    tokens = [
+        await create_access_token(f'live{user_id}', user_id, args.admin_sessions, False, TOKEN_TTL)
+        for user_id in range(args.first_user_id, args.first_user_id + -(-args.sessions // per_user))
+    ]
+    ws_url = 'ws' + args.url.removeprefix('http')
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+        before = await _metrics(client, admin_token)
+        opened, failed = [], []
+        started = time.monotonic()
+        for batch in range(0, args.sessions, args.concurrency):
+            await asyncio.gather(*(
+                _open(ws_url, tokens[number // per_user], args.training_id, opened, failed)
+                for number in range(batch, min(batch + args.concurrency, args.sessions))
+            ))
+        open_seconds = time.monotonic() - started
+
+        samples = []
+        deadline = time.monotonic() + args.hold
+        while time.monotonic() < deadline:
+            samples.append(await _metrics(client, admin_token))
+            await asyncio.sleep(1)
+
+        await asyncio.gather(*(connection.close() for connection in opened))
+        await asyncio.sleep(1)
+        after = await _metrics(client, admin_token)
+
+    print(f"сессий: запрошено {args.sessions}, открыто {len(opened)}, ошибок {len(failed)} за {open_seconds:.1f} с")
+    for error in sorted(set(failed))[:5]:
+        print(f"  {error}")
+    print(f"{'':<28}{'connections':>12}{'db_connections':>16}{'buffered_bytes':>16}")
+    rows = {
+        'до открытия': before,
+        'открыты (максимум)': {key: max(sample[key] for sample in samples) for key in before},
+        'после закрытия': after,
+    }
+    for name, metrics in rows.items():
+        print(f"{name:<28}{metrics['connections']:>12}{metrics['db_connections']:>16}{metrics['buffered_bytes']:>16}")
+    peak = rows['открыты (максимум)']
+    print(f"подключений к БД на открытое live-соединение: {peak['db_connections'] / max(peak['connections'], 1):.4f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
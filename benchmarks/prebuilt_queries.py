@@ -0,0 +1,58 @@
+"""
+Накладные расходы Python на один запрос горячего пути: построение select() на каждый вызов (как было)
+против готового запроса из app/backend/queries.py с bind-параметрами (как стало).
+Измеряется путь Connection.execute до драйвера: построение запроса, ключ кэша компиляции и поиск в кэше.
+БД не нужна. Запуск из корня репозитория: python benchmarks/prebuilt_queries.py [--number N]
+"""
+import argparse
+import timeit
+import _setup  # noqa: F401
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import selectinload
+from sqlalchemy.util import LRUCache
+from app.backend.queries import EXERCISE_WITH_SETS_BY_ID, SET_BY_ID, TRAINING_WITH_MUSCLE_GROUPS_BY_ID
+from app.models import Exercise, Set, Training
+
+DIALECT = postgresql.asyncpg.dialect()
+CACHE = LRUCache(500)
+
+#Название -> (запрос, построенный на каждый вызов, как в роутерах до queries.py; готовый запрос)
+CASES = {
+    'set by id': (
+        lambda: select(Set).where(Set.id == 1, Set.user_id == 42),
+        SET_BY_ID
+    ),
+    'exercise with sets': (
+        lambda: select(Exercise).options(selectinload(Exercise.sets)).where(Exercise.id == 1),
+        EXERCISE_WITH_SETS_BY_ID
+    ),
+    'training with muscle groups': (
+        lambda: select(Training).options(selectinload(Training.muscle_groups)).where(Training.id == 1),
+        TRAINING_WITH_MUSCLE_GROUPS_BY_ID
+    ),
+}
+
+
+def _execute_overhead(stmt):
+    """То же, что Connection.execute делает с запросом до обращения к драйверу"""
+    stmt._compile_w_cache(DIALECT, compiled_cache=CACHE, column_keys=[])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'запрос':<30}{'до, мкс':>10}{'после, мкс':>12}{'ускорение':>12}")
+    for name, (build, prebuilt) in CASES.items():
+        #Прогрев: первая компиляция каждого запроса - промах кэша, в измерение она не входит
+        _execute_overhead(build())
+        _execute_overhead(prebuilt)
+        before = min(timeit.repeat(lambda: _execute_overhead(build()), number=args.number, repeat=5)) / args.number
+        after = min(timeit.repeat(lambda: _execute_overhead(prebuilt), number=args.number, repeat=5)) / args.number
+        print(f"{name:<30}{before * 1e6:>10.1f}{after * 1e6:>12.2f}{before / after:>11.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+CPU на продление доступа одного активного пользователя за час: повторный вход по паролю (bcrypt verify)
+против ротации refresh-токена (POST /auth/refresh, SHA-256 и новый случайный токен).
+Access-токен живет ACCESS_TOKEN_MINUTES, поэтому активный клиент продлевает его 60 / ACCESS_TOKEN_MINUTES раз в час.
+Измеряется только CPU процесса на стороне API; запросы к БД (один поиск пользователя при входе,
+UPDATE ... RETURNING и INSERT при ротации) не входят. БД не нужна.
+Запуск из корня репозитория: python benchmarks/token_renewal.py [--users N]
+"""
+import argparse
+import asyncio
+import secrets
+import time
+from datetime import timedelta
+import _setup  # noqa: F401
+from app.config import settings
+from app.routers.auth import bcrypt_context, create_access_token, hash_refresh_token
+
+PASSWORD = 'correct horse battery staple'
+ACCESS_TTL = timedelta(minutes=settings.ACCESS_TOKEN_MINUTES)
+
+
+async def login(password_hash: str):
+    """CPU-часть POST /auth/token: проверка пароля, access-токен и новый refresh-токен"""
+    bcrypt_context.verify(PASSWORD, password_hash)
+    await create_access_token('bench', 1, False, False, expires_delta=ACCESS_TTL)
+    hash_refresh_token(secrets.token_urlsafe(32))
+
+
+async def refresh(refresh_token: str):
+    """CPU-часть POST /auth/refresh: хэш предъявленного токена, новый refresh-токен и access-токен"""
+    hash_refresh_token(refresh_token)
+    hash_refresh_token(secrets.token_urlsafe(32))
+    await create_access_token('bench', 1, False, False, expires_delta=ACCESS_TTL)
+
+
+async def cpu_per_call(call, number: int) -> float:
+    await call()
+    start = time.process_time()
+    for _ in range(number):
+        await call()
+    return (time.process_time() - start) / number
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10000, help='активных пользователей для оценки числа ядер')
+    parser.add_argument('--logins', type=int, default=20)
+    parser.add_argument('--refreshes', type=int, default=20000)
+    args = parser.parse_args()
+
+    password_hash = bcrypt_context.hash(PASSWORD)
+    refresh_token = secrets.token_urlsafe(32)
+    renewals = 60 / settings.ACCESS_TOKEN_MINUTES
+    results = {
+        'вход по паролю': await cpu_per_call(lambda: login(password_hash), args.logins),
+        'ротация refresh': await cpu_per_call(lambda: refresh(refresh_token), args.refreshes),
+    }
+
+    print(f"ACCESS_TOKEN_MINUTES={settings.ACCESS_TOKEN_MINUTES}: {renewals:g} продлений в час на пользователя")
+    print(f"{'способ':<18}{'CPU на вызов, мс':>18}{'CPU/пользователь/час, мс':>26}{f'ядер на {args.users}':>16}")
+    for name, cpu in results.items():
+        per_hour = cpu * renewals
+        print(f"{name:<18}{cpu * 1e3:>18.3f}{per_hour * 1e3:>26.3f}{per_hour * args.users / 3600:>16.4f}")
+    login_cpu, refresh_cpu = results.values()
+    print(f"ротация дешевле входа в {login_cpu / refresh_cpu:.0f} раз")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,25 @@
+"""
+Тесты запускаются из корня репозитория: python -m pytest tests.
+Приложение импортирует модули и как app.*, и от каталога app (logging_config), поэтому в sys.path нужны оба
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, 'app')
+sys.path[:0] = [path for path in (ROOT, APP_DIR) if path not in sys.path]
+
+#Настройки читаются из app/.env. Без него тестам, которым не нужна БД, хватает фиктивных значений
+#(переменные окружения важнее .env, поэтому при наличии файла ничего не подставляется)
+if not os.path.exists(os.path.join(APP_DIR, '.env')):
+    for name, value in {
+        'DB_USER': 'test',
+        'DB_PASSWORD': 'test',
+        'DB_HOST': '127.0.0.1',
+        'DB_PORT': '5432',
+        'DB_NAME': 'test',
+        'SECRET_KEY': 'test',
+        'ALGORITHM': 'HS256',
+        'FULL_RIGHTS': 'admin',
+    }.items():
+        os.environ.setdefault(name, value)
@@ -0,0 +1,44 @@
+"""
+Готовые запросы из app/backend/queries.py должны попадать в кэш компиляции: ключ кэша вычисляется один раз,
+повторное выполнение берет скомпилированный SQL из кэша. Проверка идет тем же путем, которым
+Connection.execute компилирует запрос, на диалекте PostgreSQL и без БД
+"""
+import pytest
+from sqlalchemy import Select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
+from sqlalchemy.util import LRUCache
+from app.backend import queries
+
+PREBUILT = {name: stmt for name, stmt in vars(queries).items() if isinstance(stmt, Select)}
+PREBUILT['tree_by_id'] = queries.tree_by_id('training', None, None)[1]
+PREBUILT['training_batch'] = queries.training_batch(None, None, True)[1]
+#Диалект входит в ключ кэша компиляции, поэтому он один на все компиляции, как у engine
+DIALECT = postgresql.asyncpg.dialect()
+
+
+def _compile(stmt, cache):
+    compiled, _, cache_hit = stmt._compile_w_cache(DIALECT, compiled_cache=cache, column_keys=[])
+    return compiled, cache_hit
+
+
+@pytest.mark.parametrize('name', list(PREBUILT))
+def test_prebuilt_query_hits_compiled_cache(name):
+    stmt = PREBUILT[name]
+    cache = LRUCache(100)
+    first, miss = _compile(stmt, cache)
+    second, hit = _compile(stmt, cache)
+    assert (miss, hit) == (CACHE_MISS, CACHE_HIT)
+    assert second is first
+    assert len(cache) == 1
+
+
+@pytest.mark.parametrize('name', list(PREBUILT))
+def test_prebuilt_query_cache_key_is_memoized(name):
+    stmt = PREBUILT[name]
+    assert stmt._generate_cache_key() is stmt._generate_cache_key()
+
+
+def test_lru_cached_builders_return_same_statement():
+    assert queries.tree_by_id('training', None, None)[1] is PREBUILT['tree_by_id']
+    assert queries.training_batch(None, None, True)[1] is PREBUILT['training_batch']
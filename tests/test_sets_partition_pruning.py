@@ -0,0 +1,48 @@
+"""
+Запросы к секционированной sets должны отсекать секции: условие по user_id обязательно.
+Проверка формы запросов работает без БД, EXPLAIN - на БД из app/.env с примененными миграциями
+(без доступной БД или таблицы sets тест пропускается). Запуск из корня репозитория: python -m pytest tests
+"""
+import asyncio
+import json
+import pytest
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from app.backend.queries import ANALYTICS_SETS, SET_BY_ID, SETS_BY_EXERCISE
+
+
+def _where(stmt) -> str:
+    return str(stmt.whereclause.compile(dialect=postgresql.dialect()))
+
+
+@pytest.mark.parametrize('stmt', [SET_BY_ID, SETS_BY_EXERCISE, ANALYTICS_SETS])
+def test_set_queries_filter_by_partition_key(stmt):
+    assert 'sets.user_id = %(user_id)s' in _where(stmt)
+
+
+def _relations(plan: dict) -> set[str]:
+    relations = {plan['Relation Name']} if 'Relation Name' in plan else set()
+    for child in plan.get('Plans', []):
+        relations |= _relations(child)
+    return relations
+
+
+async def _explain(stmt, **params) -> set[str]:
+    from app.backend.db import engine
+    sql = stmt.params(**params).compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True})
+    try:
+        async with engine.connect() as conn:
+            plan = await conn.scalar(text(f'EXPLAIN (FORMAT JSON) {sql}'))
+    except Exception as e:
+        #Нет соединения, драйвера или непримененные миграции - проверять план не на чем
+        pytest.skip(f'PostgreSQL with migrated sets is not available: {type(e).__name__}: {e}')
+    finally:
+        await engine.dispose()
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    return _relations(plan[0]['Plan'])
+
+
+def test_set_by_id_reads_one_partition():
+    relations = asyncio.run(_explain(SET_BY_ID, id=1, user_id=42))
+    assert len(relations) == 1
+    assert relations.pop().startswith('sets_p')